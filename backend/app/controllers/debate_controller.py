@@ -1,11 +1,9 @@
-import logging
-
-from fastapi import HTTPException, Depends
-from typing import Any, List, Dict
+from fastapi import HTTPException
+from typing import Any, AsyncIterator, List, Dict, Optional
 import asyncio
 import datetime
+import os
 from dotenv import load_dotenv
-import ollama
 
 from app.schemas.schema import (
     DebatePromptResponse,
@@ -14,43 +12,78 @@ from app.schemas.schema import (
     DebateMessageRequest,
     DebateMessageResponse
 )
-from app.db.singleton import ChromaDBSingleton
+from app.controllers.dilemma_pool import dilemma_pool, generate_dilemma
+from app.db.ingest import ingestion_queue
+from app.db.session_store import session_store
+from app.db.singleton import ChromaDBSingleton, DEBATE
+from app.utils.embeddings import get_embeddings
+from app.utils.deadline import DeadlineExceeded
+from app.utils.context import context_manager
+from app.utils.generation import NARRATIVE, RUBRIC, generation_profiles
+from app.utils.sse import sse_event, stream_chat_tokens
+from app.utils.model_registry import EVALUATOR, NARRATOR, model_for
+from app.utils.scheduler import bind_llm_session
 
 load_dotenv()
 
+# Also store each evaluated argument in the debate collection as a reference for later
+# evaluations. Off by default: the references would then include unvetted user text.
+DEBATE_STORE_ARGUMENTS = os.getenv("DEBATE_STORE_ARGUMENTS", "false").lower() in ("1", "true", "yes")
+
 chroma_client = ChromaDBSingleton()
-debate_collection = chroma_client.get_collection()
+debate_collection = chroma_client.get_collection(DEBATE)
 
 
-async def get_model_client():
-    return ollama
+async def generate_debate_prompt(client: Any, topic: Optional[str] = None) -> DebatePromptResponse:
+    """Serve a pre-generated dilemma, generating one live only when the pool has none."""
+    try:
+        pooled = dilemma_pool.take(topic)
+        if pooled is not None:
+            return DebatePromptResponse(prompt=pooled["prompt"], topic=pooled["topic"], timestamp=str(datetime.datetime.now()))
+
+        content = await generate_dilemma(client, topic)
+        return DebatePromptResponse(prompt=content, topic=topic, timestamp=str(datetime.datetime.now()))
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Request timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate dilemma: {str(e)}")
 
 
-async def get_embeddings(text: str, client: Any = None):
-    if client is None:
-        client = await get_model_client()
+async def resume_debate_session(request: DebateMessageRequest) -> DebateMessageRequest:
+    """
+    Fill the dilemma and history from the stored session. Requests without
+    a session id stay stateless: nothing is stored for them. A client
+    starts a stored session by sending a session id of its own.
+    """
+    request = await session_store.resume(DEBATE, request, required=("prompt",))
+    bind_llm_session(request.session_id or session_store.new_session_id())
+    return request
 
-    response = await asyncio.to_thread(
-        client.embeddings,
-        model="all-minilm:33m",
-        prompt=text
-    )
 
-    return response["embedding"]
+async def _save_debate_session(request: DebateMessageRequest, reply: str) -> None:
+    if not request.session_id:
+        return
+    history = request.history + [
+        {"role": "user", "content": request.message},
+        {"role": "assistant", "content": reply}
+    ]
+    await session_store.save(DEBATE, request.session_id, {"prompt": request.prompt, "history": history})
 
 
-async def generate_debate_prompt(client: Any) -> DebatePromptResponse:
-    try:
-        prompt = (
-            "Generate a culturally sensitive real-world ethical dilemma that sparks debate. "
-            "The topic should encourage players to take sides and argue with historical, ethical, or empathetic reasoning."
-        )
-        messages = [{"role": "user", "content": prompt}]
-        response = await asyncio.to_thread(client.chat, model="llama3.2:latest", messages=messages)
-        content = response["message"]["content"].strip()
-        return DebatePromptResponse(prompt=content, timestamp=str(datetime.datetime.now()))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate dilemma: {str(e)}")
+def _build_debate_messages(request: DebateMessageRequest) -> List[Dict[str, str]]:
+    # Format the context for the AI based on conversation history
+    messages = [{"role": "system", "content": (
+        f"You are an AI debate partner discussing the following ethical dilemma:\n{request.prompt}\n\n"
+        f"Maintain a thoughtful, challenging stance in the debate. "
+        f"Consider ethical principles, cultural contexts, and historical precedents in your reasoning."
+    )}]
+
+    # Add conversation history
+    messages.extend(request.history)
+
+    # Add the user's new message
+    messages.append({"role": "user", "content": request.message})
+    return messages
 
 
 async def process_debate_message(
@@ -61,40 +94,65 @@ async def process_debate_message(
     Process a new message in the debate conversation and return the AI's response
     """
     try:
-        # Format the context for the AI based on conversation history
-        messages = [{"role": "system", "content": (
-            f"You are an AI debate partner discussing the following ethical dilemma:\n{request.prompt}\n\n"
-            f"Maintain a thoughtful, challenging stance in the debate. "
-            f"Consider ethical principles, cultural contexts, and historical precedents in your reasoning."
-        )}]
-
-        # Add conversation history
-        messages.extend(request.history)
-
-        # Add the user's new message
-        messages.append({"role": "user", "content": request.message})
-
         # Generate AI response
-        response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
-            messages=messages,
+        response = await generation_profiles.chat(
+            client,
+            NARRATIVE,
+            model=model_for(NARRATOR),
+            messages=await context_manager.fit(
+                _build_debate_messages(request), client, model_for(NARRATOR), session_key=request.session_id
+            ),
             options={"temperature": 0.8}
         )
 
         ai_response = response["message"]["content"].strip()
+        await _save_debate_session(request, ai_response)
 
         # Save this conversation to the database for future reference
         # This could be implemented later to build a knowledge base
 
         return DebateMessageResponse(
             content=ai_response,
-            timestamp=str(datetime.datetime.now())
+            timestamp=str(datetime.datetime.now()),
+            session_id=request.session_id
         )
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process debate message: {str(e)}")
 
 
+async def stream_debate_message(request: DebateMessageRequest, client: Any) -> AsyncIterator[str]:
+    """
+    Streaming variant of process_debate_message
+    """
+    try:
+        messages = await context_manager.fit(
+            _build_debate_messages(request), client, model_for(NARRATOR), session_key=request.session_id
+        )
+        chunks = []
+        async for token in stream_chat_tokens(
+                client,
+                NARRATIVE,
+                model=model_for(NARRATOR),
+                messages=messages,
+                options={"temperature": 0.8}
+        ):
+            chunks.append(token)
+            yield sse_event("token", {"content": token})
+
+        ai_response = "".join(chunks).strip()
+        await _save_debate_session(request, ai_response)
+
+        yield sse_event("done", DebateMessageResponse(
+            content=ai_response,
+            timestamp=str(datetime.datetime.now()),
+            session_id=request.session_id
+        ))
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Failed to process debate message: {str(e)}"})
+
+
 async def evaluate_debate_response(request: DebateRequest, client: Any) -> DebateEvaluationResponse:
     try:
         response_embedding = await get_embeddings(request.user_response, client)
@@ -138,9 +196,10 @@ async def evaluate_debate_response(request: DebateRequest, client: Any) -> Debat
 
         messages = [{"role": "user", "content": prompt}]
 
-        response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
+        response = await generation_profiles.chat(
+            client,
+            RUBRIC,
+            model=model_for(EVALUATOR),
             messages=messages,
             options={"temperature": 0.4}
         )
@@ -165,11 +224,22 @@ async def evaluate_debate_response(request: DebateRequest, client: Any) -> Debat
             elif line.lower().startswith("suggestion:"):
                 suggestion = line.split(":", 1)[1].strip()
 
+        if DEBATE_STORE_ARGUMENTS:
+            await ingestion_queue.enqueue(
+                document=request.user_response,
+                metadata={"mode": DEBATE, "prompt": request.prompt},
+                id_prefix="debate",
+                mode=DEBATE,
+                embedding=response_embedding
+            )
+
         return DebateEvaluationResponse(
             evaluation=eval_text,
             scores=scores,
             suggestions=suggestion,
             timestamp=str(datetime.datetime.now())
         )
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to evaluate debate response: {str(e)}")
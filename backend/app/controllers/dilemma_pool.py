@@ -0,0 +1,236 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.embeddings import cosine_similarity, get_embeddings
+from app.utils.generation import DILEMMA, generation_profiles
+from app.utils.model_registry import NARRATOR, model_for
+from app.utils.scheduler import BACKGROUND, llm_priority
+
+load_dotenv()
+
+DILEMMA_POOL_SIZE = int(os.getenv("DILEMMA_POOL_SIZE", "20"))
+# Refill starts once the pool drops below this many dilemmas
+DILEMMA_POOL_LOW_WATER = int(os.getenv("DILEMMA_POOL_LOW_WATER", "15"))
+DILEMMA_POOL_PATH = os.getenv("DILEMMA_POOL_PATH", "./dilemma_pool.json")
+# Changes within this many seconds are written to DILEMMA_POOL_PATH together
+DILEMMA_POOL_SAVE_DELAY = float(os.getenv("DILEMMA_POOL_SAVE_DELAY", "2.0"))
+DILEMMA_DEDUP_THRESHOLD = float(os.getenv("DILEMMA_DEDUP_THRESHOLD", "0.92"))
+DILEMMA_TOPICS = [
+    topic.strip() for topic in os.getenv(
+        "DILEMMA_TOPICS",
+        "migration and belonging,religious freedom,land and resources,language and identity,"
+        "tradition and modernity,historical memory,environment and livelihoods,gender roles"
+    ).split(",") if topic.strip()
+]
+
+logger = logging.getLogger(__name__)
+
+DILEMMA_INSTRUCTION = (
+    "Generate a culturally sensitive real-world ethical dilemma that sparks debate. "
+    "The topic should encourage players to take sides and argue with historical, ethical, or empathetic reasoning."
+)
+
+
+async def generate_dilemma(client: Any, topic: Optional[str] = None) -> str:
+    prompt = DILEMMA_INSTRUCTION
+    if topic:
+        prompt += f" The dilemma should concern {topic}."
+    response = await generation_profiles.chat(
+        client, DILEMMA, model=model_for(NARRATOR), messages=[{"role": "user", "content": prompt}]
+    )
+    return response["message"]["content"].strip()
+
+
+class DilemmaPool:
+    """
+    Bounded pool of pre-generated debate dilemmas. A background task tops
+    it up at low priority, rotating through `topics`, and drops any new
+    dilemma too similar (by embedding) to one already pooled or recently
+    served. The pool is written to `path` so it survives restarts: off
+    the event loop, at most once per `save_delay` seconds however many
+    dilemmas were taken or added, and once more on stop.
+    """
+
+    def __init__(
+            self,
+            capacity: int = DILEMMA_POOL_SIZE,
+            low_water: int = DILEMMA_POOL_LOW_WATER,
+            path: Optional[str] = DILEMMA_POOL_PATH,
+            save_delay: float = DILEMMA_POOL_SAVE_DELAY,
+            dedup_threshold: float = DILEMMA_DEDUP_THRESHOLD,
+            topics: Optional[List[str]] = None
+    ):
+        self.capacity = capacity
+        self.low_water = min(low_water, capacity)
+        self.path = path
+        self.save_delay = save_delay
+        self.dedup_threshold = dedup_threshold
+        self.topics = list(DILEMMA_TOPICS if topics is None else topics)
+
+        self._pool: List[Dict[str, Any]] = []
+        self._recent = deque(maxlen=max(capacity * 2, 1))
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_topic = 0
+        self._save_task: Optional[asyncio.Task] = None
+        # Set by every change and cleared as a save takes its snapshot
+        self._dirty = False
+        # A write cancelled on stop may still be running in its thread
+        self._write_lock = threading.Lock()
+
+        self.served = 0
+        self.misses = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.failures = 0
+        self._refills = deque(maxlen=256)
+
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._pool = json.load(f)[:self.capacity]
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load dilemma pool: %s", str(e))
+
+    def _write(self, pool: List[Dict[str, Any]]) -> bool:
+        tmp_path = self.path + ".tmp"
+        try:
+            with self._write_lock:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(pool, f)
+                os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.warning("Could not persist dilemma pool: %s", str(e))
+            return False
+
+    async def _save_later(self) -> None:
+        # Changes made while a write is running set the flag again and get a write of their own
+        while self._dirty:
+            await asyncio.sleep(self.save_delay)
+            self._dirty = False
+            # The snapshot is taken on the loop; only the dump and the write run in a thread
+            if not await asyncio.to_thread(self._write, list(self._pool)):
+                # Retried on the next change or on stop
+                self._dirty = True
+                return
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._dirty = not self._write(self._pool)
+                return
+            self._save_task = loop.create_task(self._save_later())
+
+    def take(self, topic: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Pop a pooled dilemma (matching `topic` if given), or None when there is none."""
+        for i, item in enumerate(self._pool):
+            if topic is None or item.get("topic") == topic:
+                del self._pool[i]
+                self._recent.append(item["embedding"])
+                self._save()
+                self.served += 1
+                if len(self._pool) < self.low_water and self._wakeup is not None:
+                    self._wakeup.set()
+                return item
+        self.misses += 1
+        return None
+
+    def _is_duplicate(self, embedding: List[float]) -> bool:
+        known = [item["embedding"] for item in self._pool] + list(self._recent)
+        return any(cosine_similarity(embedding, other) >= self.dedup_threshold for other in known)
+
+    async def refill_one(self, client: Any) -> bool:
+        """Generate one dilemma and pool it unless it duplicates another; returns whether it was kept."""
+        topic = None
+        if self.topics:
+            topic = self.topics[self._next_topic % len(self.topics)]
+            self._next_topic += 1
+
+        prompt = await generate_dilemma(client, topic)
+        embedding = await get_embeddings(prompt, client)
+        self.generated += 1
+        if self._is_duplicate(embedding):
+            self.duplicates += 1
+            return False
+
+        self._pool.append({"prompt": prompt, "topic": topic, "embedding": embedding, "created_at": time.time()})
+        self._refills.append(time.time())
+        self._save()
+        return True
+
+    async def _run(self, client: Any) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Bound the attempts per round so a model stuck on one idea cannot spin forever
+            attempts = 0
+            while len(self._pool) < self.capacity and attempts < self.capacity * 3:
+                attempts += 1
+                try:
+                    with llm_priority(BACKGROUND, session="dilemma-pool"):
+                        await self.refill_one(client)
+                except Exception as e:
+                    self.failures += 1
+                    logger.warning("Could not pre-generate a dilemma: %s", str(e))
+                    await asyncio.sleep(random.uniform(5, 15))
+
+    def start(self, client: Any) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            if len(self._pool) < self.capacity:
+                self._wakeup.set()
+            self._task = asyncio.get_running_loop().create_task(self._run(client))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._save_task is not None:
+            self._save_task.cancel()
+            self._save_task = None
+        if self.path and self._dirty:
+            self._dirty = not await asyncio.to_thread(self._write, list(self._pool))
+
+    def stats(self) -> Dict[str, Any]:
+        hour_ago = time.time() - 3600
+        topics: Dict[str, int] = {}
+        for item in self._pool:
+            topics[item.get("topic") or "any"] = topics.get(item.get("topic") or "any", 0) + 1
+        return {
+            "depth": len(self._pool),
+            "capacity": self.capacity,
+            "low_water": self.low_water,
+            "by_topic": topics,
+            "served": self.served,
+            "misses": self.misses,
+            "generated": self.generated,
+            "duplicates_rejected": self.duplicates,
+            "failures": self.failures,
+            "refills_last_hour": sum(1 for at in self._refills if at >= hour_ago)
+        }
+
+
+dilemma_pool = DilemmaPool()
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from app.db.session_store import session_store
+from app.utils.deadline import request_deadline
+from app.utils.generation import RUBRIC, SCORE, generation_profiles
+from app.utils.model_registry import SCORER, model_for
+from app.utils.scheduler import BACKGROUND, llm_priority
+
+load_dotenv()
+
+# Ask for a short written summary when a session's scores are finalised
+KALKI_FINAL_SUMMARY = os.getenv("KALKI_FINAL_SUMMARY", "false").lower() in ("1", "true", "yes")
+
+# (field, label in model output, maximum points)
+KALKI_DIMENSIONS = (
+    ("empathy", "EMPATHY", 30),
+    ("diplomatic_skill", "DIPLOMATIC_SKILL", 30),
+    ("historical_accuracy", "HISTORICAL_ACCURACY", 20),
+    ("ethical_balance", "ETHICAL_BALANCE", 20),
+)
+
+# Session-store kind holding per-turn KALKI ratings
+KALKI_STATE = "kalki"
+
+logger = logging.getLogger(__name__)
+
+TURN_PROMPT = (
+    "Rate the user's latest move in {context} on the KALKI dimensions, each from 0 to 10:\n"
+    "EMPATHY: understanding of every side's perspective\n"
+    "DIPLOMATIC_SKILL: constructive dialogue, negotiation and compromise\n"
+    "HISTORICAL_ACCURACY: realism given real-world history\n"
+    "ETHICAL_BALANCE: fairness and consistent ethical principles\n\n"
+    "User: {user}\n"
+    "AI: {ai}\n\n"
+    "Be critical; failed or one-sided moves deserve low ratings.\n"
+    "Respond with a JSON object only:\n"
+    '{{"EMPATHY": 0-10, "DIPLOMATIC_SKILL": 0-10, "HISTORICAL_ACCURACY": 0-10, '
+    '"ETHICAL_BALANCE": 0-10, "NOTE": "one short sentence on the move"}}'
+)
+
+
+def turn_pairs(turns: Iterable[Any]) -> List[Tuple[str, str]]:
+    """(user, ai) pairs from {"user", "ai"} dicts or ChatTurn models."""
+    return [(turn["user"], turn["ai"]) if isinstance(turn, dict) else (turn.user, turn.ai) for turn in turns]
+
+
+def parse_turn_rating(text: str) -> Dict[str, Any]:
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, dict):
+        # Not valid JSON (a truncated reply, or a model without format support): read "LABEL: value" pairs
+        parsed = {}
+        for _, label, _ in KALKI_DIMENSIONS:
+            match = re.search(rf'"?{label}"?\s*:\s*(\d+)', text)
+            if match:
+                parsed[label] = match.group(1)
+        note = re.search(r'"?NOTE"?\s*:\s*"?([^"\n}]+)', text)
+        if note:
+            parsed["NOTE"] = note.group(1)
+
+    rating: Dict[str, Any] = {}
+    for field, label, _ in KALKI_DIMENSIONS:
+        try:
+            rating[field] = max(0, min(10, int(float(parsed.get(label)))))
+        except (TypeError, ValueError):
+            rating[field] = 5
+    rating["note"] = str(parsed.get("NOTE") or "").strip()
+    return rating
+
+
+class KalkiEngine:
+    """
+    Incremental KALKI scoring. Each turn is rated on its own with a small
+    prompt (the exchange only, not the transcript) and the rating is kept
+    in the session store, so a final score is an aggregation over stored
+    ratings. Turns that were never rated, for example in sessions that
+    predate this engine, are rated concurrently when the score is needed.
+
+    Per-turn ratings run at BACKGROUND priority, so they can sit behind
+    other sessions' background work. The final score never waits for them:
+    ratings still in flight are cancelled and their turns are rated again
+    at the priority of the request asking for the score.
+    """
+
+    def __init__(self, store: Any = None, final_summary: bool = KALKI_FINAL_SUMMARY):
+        self._store = store
+        self.final_summary = final_summary
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, Set[asyncio.Task]] = {}
+
+        self.turns_rated = 0
+        self.backfilled = 0
+        self.failures = 0
+        self.finalised = 0
+        self.cancelled = 0
+
+    @property
+    def store(self):
+        return self._store or session_store
+
+    async def rate_turn(self, client: Any, user: str, ai: str, context: str) -> Dict[str, Any]:
+        response = await generation_profiles.generate(
+            client,
+            SCORE,
+            model=model_for(SCORER),
+            prompt=TURN_PROMPT.format(context=context, user=user, ai=ai)
+        )
+        self.turns_rated += 1
+        return parse_turn_rating(response["response"])
+
+    async def _save_rating(self, session_id: str, index: int, rating: Dict[str, Any]) -> None:
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            state = await self.store.load(KALKI_STATE, session_id) or {"turns": {}}
+            state["turns"][str(index)] = rating
+            await self.store.save(KALKI_STATE, session_id, state)
+
+    async def record_turn(self, session_id: str, index: int, user: str, ai: str, client: Any, context: str) -> None:
+        rating = await self.rate_turn(client, user, ai, context)
+        await self._save_rating(session_id, index, rating)
+
+    def schedule_turn(self, session_id: Optional[str], index: int, user: str, ai: str, client: Any, context: str) -> None:
+        """Rate turn `index` of a session in the background; failures are logged, never raised."""
+        if not session_id:
+            return
+
+        async def run():
+            try:
+                with llm_priority(BACKGROUND):
+                    await self.record_turn(session_id, index, user, ai, client, context)
+            except Exception as e:
+                self.failures += 1
+                logger.warning("Could not rate turn %s of %s: %s", index, session_id, str(e))
+
+        # Outlives the request that scheduled it
+        with request_deadline(None):
+            task = asyncio.get_running_loop().create_task(run())
+        pending = self._pending.setdefault(session_id, set())
+        pending.add(task)
+
+        def _forget(done: asyncio.Task) -> None:
+            pending.discard(done)
+            if not pending and self._pending.get(session_id) is pending:
+                del self._pending[session_id]
+                self._locks.pop(session_id, None)
+
+        task.add_done_callback(_forget)
+
+    def cancel_pending(self, session_id: Optional[str]) -> int:
+        """Cancel a session's background ratings that have not landed yet; returns how many there were."""
+        pending = list(self._pending.get(session_id, ())) if session_id else []
+        for task in pending:
+            task.cancel()
+        self.cancelled += len(pending)
+        return len(pending)
+
+    async def ratings(self, session_id: Optional[str]) -> Dict[int, Dict[str, Any]]:
+        """Stored per-turn ratings of a session; ratings still in flight are not waited for."""
+        if not session_id:
+            return {}
+        state = await self.store.load(KALKI_STATE, session_id)
+        return {int(index): rating for index, rating in (state or {"turns": {}})["turns"].items()}
+
+    async def final_score(
+            self,
+            session_id: Optional[str],
+            turns: List[Tuple[str, str]],
+            client: Any,
+            context: str
+    ) -> Dict[str, Any]:
+        """
+        Aggregate the session's per-turn ratings into KALKI points, rating
+        any of `turns` that have no stored rating yet at the caller's
+        priority, including those whose background rating was cancelled.
+        """
+        self.cancel_pending(session_id)
+        ratings = await self.ratings(session_id)
+        missing = [index for index in range(len(turns)) if index not in ratings]
+        if missing:
+            backfill = await asyncio.gather(
+                *(self.rate_turn(client, *turns[index], context) for index in missing),
+                return_exceptions=True
+            )
+            for index, rating in zip(missing, backfill):
+                if isinstance(rating, Exception):
+                    self.failures += 1
+                    logger.warning("Could not rate turn %s: %s", index, str(rating))
+                    continue
+                ratings[index] = rating
+                if session_id:
+                    await self._save_rating(session_id, index, rating)
+            self.backfilled += len(missing)
+
+        self.finalised += 1
+        result = self.aggregate([ratings[index] for index in sorted(ratings)])
+        if self.final_summary and ratings:
+            result["feedback"] = await self._summarise(client, result, ratings) or result["feedback"]
+        return result
+
+    @staticmethod
+    def aggregate(ratings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Mean per-turn rating (0-10) of each dimension, scaled to its maximum points."""
+        result: Dict[str, Any] = {}
+        feedback: Dict[str, str] = {}
+        for field, _, max_points in KALKI_DIMENSIONS:
+            if not ratings:
+                # Same neutral midpoint the whole-transcript scorer fell back to
+                result[field] = max_points // 2
+                continue
+            mean = sum(rating[field] for rating in ratings) / len(ratings)
+            result[field] = round(mean / 10 * max_points)
+            weakest = min(ratings, key=lambda rating: rating[field])
+            feedback[field] = f"{mean:.1f}/10 over {len(ratings)} turns."
+            if weakest.get("note"):
+                feedback[field] += f" Weakest moment: {weakest['note']}"
+        result["total_score"] = sum(result[field] for field, _, _ in KALKI_DIMENSIONS)
+        result["feedback"] = feedback
+        result["turns"] = len(ratings)
+        return result
+
+    async def _summarise(self, client: Any, result: Dict[str, Any], ratings: Dict[int, Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        notes = "\n".join(f"- {ratings[index]['note']}" for index in sorted(ratings) if ratings[index].get("note"))
+        scores = ", ".join(f"{label}: {result[field]}/{max_points}" for field, label, max_points in KALKI_DIMENSIONS)
+        try:
+            response = await generation_profiles.generate(
+                client,
+                RUBRIC,
+                model=model_for(SCORER),
+                prompt=(
+                    f"KALKI scores: {scores}\nNotes on each move:\n{notes}\n\n"
+                    "Give one sentence of feedback per dimension in exactly this format:\n"
+                    "EMPATHY: ...\nDIPLOMATIC_SKILL: ...\nHISTORICAL_ACCURACY: ...\nETHICAL_BALANCE: ..."
+                ),
+                options={"num_predict": 160}
+            )
+        except Exception as e:
+            logger.warning("Could not summarise KALKI feedback: %s", str(e))
+            return None
+
+        feedback = {}
+        for field, label, _ in KALKI_DIMENSIONS:
+            match = re.search(rf"{label}:\s*(.+)", response["response"])
+            if match:
+                feedback[field] = match.group(1).strip()
+        return feedback or None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns_rated": self.turns_rated,
+            "backfilled": self.backfilled,
+            "failures": self.failures,
+            "finalised": self.finalised,
+            "cancelled": self.cancelled,
+            "sessions_pending": len(self._pending),
+            "final_summary": self.final_summary
+        }
+
+
+kalki_engine = KalkiEngine()
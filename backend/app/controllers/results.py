@@ -28,29 +28,81 @@ from typing import Any, List, Dict
 import ollama
 import asyncio
 import re
+from app.controllers.kalki import KALKI_DIMENSIONS, kalki_engine
 from app.schemas.schema import ResultsResponse, KalkiScore
-from app.db.singleton import ChromaDBSingleton
+from app.db.singleton import ChromaDBSingleton, ROLE_PLAY
+from app.utils.deadline import DeadlineExceeded
+from app.utils.generation import RUBRIC, SUMMARY, generation_profiles
+from app.utils.model_registry import EVALUATOR, model_for
 
 chroma_client = ChromaDBSingleton()
-chroma_collection = chroma_client.get_collection()
+chroma_collection = chroma_client.get_collection(ROLE_PLAY)
+
+
+async def _results_from_turn_scores(ratings: Dict[int, Dict[str, Any]], client: Any) -> ResultsResponse:
+    """Build results from per-turn KALKI ratings stored for a session; one short call writes the prose."""
+    scores = kalki_engine.aggregate([ratings[index] for index in sorted(ratings)])
+    kalki_score = KalkiScore(
+        empathy=scores["empathy"],
+        diplomatic_skill=scores["diplomatic_skill"],
+        historical_accuracy=scores["historical_accuracy"],
+        ethical_balance=scores["ethical_balance"],
+        total_score=scores["total_score"],
+        feedback=scores["feedback"]
+    )
+
+    breakdown = "\n".join(
+        f"{label}: {scores[field]}/{max_points} - {scores['feedback'][field]}"
+        for field, label, max_points in KALKI_DIMENSIONS
+    )
+    try:
+        response = await generation_profiles.chat(
+            client,
+            SUMMARY,
+            model=model_for(EVALUATOR),
+            messages=[
+                {"role": "system", "content": "Write a brief, encouraging summary of the user's KALKI performance, "
+                                              "then 3-5 specific suggestions for improvement as a numbered list."},
+                {"role": "user", "content": f"Total Score: {scores['total_score']}/100\n{breakdown}"}
+            ]
+        )
+        text = response['message']['content']
+        performance_summary = text.split("\n\n")[0].strip()
+        improvement_suggestions = _extract_suggestions(text)
+    except Exception:
+        performance_summary = f"Total KALKI score {scores['total_score']}/100 over {scores['turns']} turns."
+        improvement_suggestions = [f"Work on {label.replace('_', ' ').lower()}: {scores['feedback'][field]}"
+                                   for field, label, _ in KALKI_DIMENSIONS]
+
+    return ResultsResponse(
+        total_score=scores["total_score"],
+        individual_scores=kalki_score,
+        performance_summary=performance_summary,
+        improvement_suggestions=improvement_suggestions
+    )
 
 
 async def analyze_user_responses(user_id: str, client: Any) -> ResultsResponse:
     try:
-        # Retrieve all user interactions from the database
-        query = f"user_id:{user_id}"
-        results = chroma_collection.query(
-            query_texts=["user responses"],
-            where={"user_id": user_id},
-            n_results=50  # Adjust as needed
+        # A session id with per-turn scores needs no transcript analysis
+        ratings = await kalki_engine.ratings(user_id)
+        if ratings:
+            return await _results_from_turn_scores(ratings, client)
+
+        # Retrieve the session's role-play turns; every one is needed, so filter rather than search
+        results = await asyncio.to_thread(
+            chroma_collection.get,
+            where={"$and": [{"mode": ROLE_PLAY}, {"session_id": user_id}]},
+            limit=50,
+            include=["documents", "metadatas"]
         )
 
         if not results or not results['documents']:
             raise HTTPException(status_code=404, detail="No user responses found")
 
         # Compile all user responses
-        user_responses = results['documents'][0]
-        metadata_list = results['metadatas'][0]
+        user_responses = results['documents']
+        metadata_list = results['metadatas']
 
         # Create a comprehensive prompt for the LLM to analyze
         analysis_prompt = [
@@ -70,9 +122,10 @@ async def analyze_user_responses(user_id: str, client: Any) -> ResultsResponse:
         ]
 
         # Get analysis from LLM
-        response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
+        response = await generation_profiles.chat(
+            client,
+            RUBRIC,
+            model=model_for(EVALUATOR),
             messages=analysis_prompt
         )
 
@@ -102,9 +155,10 @@ async def analyze_user_responses(user_id: str, client: Any) -> ResultsResponse:
             {"role": "user", "content": f"KALKI Analysis: {analysis_text}\n\nProvide concise improvement suggestions."}
         ]
 
-        improvement_response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
+        improvement_response = await generation_profiles.chat(
+            client,
+            SUMMARY,
+            model=model_for(EVALUATOR),
             messages=improvement_prompt
         )
 
@@ -117,9 +171,10 @@ async def analyze_user_responses(user_id: str, client: Any) -> ResultsResponse:
             {"role": "user", "content": f"Total Score: {total_score}/100\nAnalysis: {analysis_text}"}
         ]
 
-        summary_response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
+        summary_response = await generation_profiles.chat(
+            client,
+            SUMMARY,
+            model=model_for(EVALUATOR),
             messages=performance_summary_prompt
         )
 
@@ -142,6 +197,8 @@ async def analyze_user_responses(user_id: str, client: Any) -> ResultsResponse:
             improvement_suggestions=improvement_suggestions
         )
 
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing user responses: {str(e)}")
 
@@ -1,47 +1,60 @@
+import logging
 import re
-from venv import logger
 
 from fastapi import HTTPException
-from typing import Any, List, Dict
-import ollama
+from typing import Any, AsyncIterator, List, Dict
 import asyncio
 from dotenv import load_dotenv
 import datetime
 
 from app.controllers.conflict_resolution import analyze_sentiment
-from app.schemas.schema import RolePlayRequest, StoryResponse, EvaluationRequest, EvaluationResponse
-from app.db.singleton import ChromaDBSingleton
+from app.controllers.kalki import KALKI_DIMENSIONS, kalki_engine, turn_pairs
+from app.schemas.schema import (
+    RolePlayRequest,
+    RolePlayActionsResponse,
+    StoryResponse,
+    EvaluationRequest,
+    EvaluationResponse
+)
+from app.db.ingest import ingestion_queue
+from app.db.session_store import session_store
+from app.db.singleton import ChromaDBSingleton, ROLE_PLAY, EVALUATION
+from app.utils.context import context_manager, turns_to_messages
+from app.utils.deadline import DeadlineExceeded, request_deadline
+from app.utils.generation import ACTIONS, NARRATIVE, generation_profiles
+from app.utils.sse import sse_event, stream_chat_tokens
+from app.utils.model_registry import ACTION_SUGGESTER, NARRATOR, model_for
+from app.utils.scheduler import ASSIST, bind_llm_session, llm_priority
 
 load_dotenv()
 
 chroma_client = ChromaDBSingleton()
-chroma_collection = chroma_client.get_collection()
+chroma_collection = chroma_client.get_collection(ROLE_PLAY)
+evaluation_collection = chroma_client.get_collection(EVALUATION)
 
+logger = logging.getLogger(__name__)
 
-async def get_model_client():
-    return ollama
+# Session-store kind holding the suggested actions of a session's latest turn
+ROLE_PLAY_ACTIONS = "role-play-actions"
 
+FALLBACK_ACTIONS = [
+    "Ask a follow-up question",
+    "Share your perspective",
+    "Request more information",
+    "Change the subject"
+]
 
-async def get_embeddings(text: str, client: Any = None):
-    if client is None:
-        client = await get_model_client()
-
-    response = await asyncio.to_thread(
-        client.embeddings,
-        model="all-minilm:33m",
-        prompt=text
-    )
-    return response["embedding"]
+# session_id -> background task finishing that session's latest turn
+_side_work: Dict[str, asyncio.Task] = {}
 
 
 async def generate_context_aware_actions(scene: str, chat_history: List[Dict[str, str]], client: Any) -> List[str]:
     """Generate contextually relevant suggested actions based on the current scene and chat history."""
     try:
         # Prepare a prompt that asks the model to generate contextually appropriate actions
-        full_conversation = ""
-        for turn in chat_history:
-            full_conversation += f"User: {turn['user']}\n"
-            full_conversation += f"AI: {turn['ai']}\n\n"
+        full_conversation = await context_manager.fit_transcript(
+            turns_to_messages(chat_history), client, model_for(ACTION_SUGGESTER)
+        )
 
         prompt = (
             "Based on the following role-playing conversation and the current scene, "
@@ -54,11 +67,11 @@ async def generate_context_aware_actions(scene: str, chat_history: List[Dict[str
             "Each action should be a specific, clear phrase that makes sense in the current context."
         )
 
-        response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
-            messages=[{"role": "user", "content": prompt}],
-            options={"temperature": 0.7}
+        response = await generation_profiles.chat(
+            client,
+            ACTIONS,
+            model=model_for(ACTION_SUGGESTER),
+            messages=[{"role": "user", "content": prompt}]
         )
 
         # Process the response to extract the actions
@@ -74,60 +87,174 @@ async def generate_context_aware_actions(scene: str, chat_history: List[Dict[str
 
     except Exception as e:
         # If something goes wrong, return some generic fallback actions
-        return [
-            "Ask a follow-up question",
-            "Share your perspective",
-            "Request more information",
-            "Change the subject"
-        ]
+        return list(FALLBACK_ACTIONS)
 
 
-async def generate_role_play(request: RolePlayRequest, client: Any):
-    try:
-        system_prompt = (
-            f"You are role-playing as a {request.role} from the {request.culture} culture, "
-            f"during the {request.era} era. You respond based on that role only. "
-            f"Maintain historical and cultural accuracy. Use a {request.tone} tone and write in {request.language}. "
-            f"{'Include emotional and reflective thoughts as well.' if request.include_emotion else ''}"
-        )
+def _build_role_play_messages(request: RolePlayRequest) -> List[Dict[str, str]]:
+    system_prompt = (
+        f"You are role-playing as a {request.role} from the {request.culture} culture, "
+        f"during the {request.era} era. You respond based on that role only. "
+        f"Maintain historical and cultural accuracy. Use a {request.tone} tone and write in {request.language}. "
+        f"{'Include emotional and reflective thoughts as well.' if request.include_emotion else ''}"
+    )
 
-        history: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
-        for turn in request.chat_history:
-            history.append({"role": "user", "content": turn["user"]})
-            history.append({"role": "assistant", "content": turn["ai"]})
+    history: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+    history.extend(turns_to_messages(request.chat_history))
+    history.append({"role": "user", "content": request.user_input})
+    return history
+
+
+async def resume_role_play_session(request: RolePlayRequest) -> RolePlayRequest:
+    """
+    Fill the scene and history from the stored session. Requests without a
+    session id stay stateless (nothing is stored, no turn is rated) unless
+    they defer their actions, which are fetched by a new session id. A
+    client starts a stored session by sending a session id of its own.
+    """
+    request = await session_store.resume(
+        ROLE_PLAY, request, required=("role", "culture", "era", "tone", "language")
+    )
+    if request.session_id is None and request.defer_actions:
+        request.session_id = session_store.new_session_id()
+    bind_llm_session(request.session_id or session_store.new_session_id())
+    return request
 
-        history.append({"role": "user", "content": request.user_input})
 
-        response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
-            messages=history,
-            options={"temperature": 0.75, "top_p": 0.9}
-        )
+async def _save_role_play_session(request: RolePlayRequest, reply: str) -> None:
+    if not request.session_id:
+        return
+    state = request.model_dump(
+        include={"role", "culture", "era", "tone", "language", "include_emotion", "chat_history"}
+    )
+    state["chat_history"] = state["chat_history"] + [{"user": request.user_input, "ai": reply}]
+    await session_store.save(ROLE_PLAY, request.session_id, state)
+
+
+def _role_play_metadata(request: RolePlayRequest) -> Dict[str, str]:
+    return {
+        "mode": "role-play",
+        "session_id": request.session_id,
+        "culture": request.culture,
+        "role": request.role,
+        "era": request.era,
+        "tone": request.tone,
+        "language": request.language
+    }
+
+
+async def _store_role_play_reply(reply: str, metadata: Dict[str, str], request: RolePlayRequest) -> None:
+    await ingestion_queue.enqueue(
+        document=reply,
+        metadata=metadata,
+        id_prefix=request.role + "-role",
+        mode=ROLE_PLAY
+    )
 
-        reply = response['message']['content'].strip()
-        embeddings = await get_embeddings(reply, client)
 
-        # Generate contextually relevant actions
-        suggested_actions = await generate_context_aware_actions(reply, request.chat_history + [
+async def _suggest_actions(request: RolePlayRequest, reply: str, client: Any) -> List[str]:
+    with llm_priority(ASSIST):
+        return await generate_context_aware_actions(reply, request.chat_history + [
             {"user": request.user_input, "ai": reply}], client)
 
-        metadata = {
-            "mode": "role-play",
-            "culture": request.culture,
-            "role": request.role,
-            "era": request.era,
-            "tone": request.tone,
-            "language": request.language
-        }
-
-        chroma_collection.add(
-            documents=[reply],
-            embeddings=[embeddings],
-            metadatas=[metadata],
-            ids=[request.role + "-role-" + str(datetime.datetime.now().timestamp())]
+
+async def _finish_turn(request: RolePlayRequest, reply: str, metadata: Dict[str, str], client: Any) -> Dict[str, Any]:
+    """
+    Side work of a role-play turn: suggested actions and the vector-store
+    write run concurrently. Neither can fail the turn; errors are logged and
+    the actions fall back to generic ones.
+    """
+    actions, stored = await asyncio.gather(
+        _suggest_actions(request, reply, client),
+        _store_role_play_reply(reply, metadata, request),
+        return_exceptions=True
+    )
+    if isinstance(stored, Exception):
+        logger.warning(f"Could not store role-play reply: {str(stored)}")
+    if isinstance(actions, Exception):
+        logger.warning(f"Could not suggest role-play actions: {str(actions)}")
+        actions = list(FALLBACK_ACTIONS)
+
+    # Rated at background priority so the session's final evaluation only has to aggregate
+    kalki_engine.schedule_turn(
+        request.session_id,
+        len(request.chat_history),
+        request.user_input,
+        reply,
+        client,
+        f"a role-play as {request.role} in {request.culture} culture during {request.era}"
+    )
+
+    result = {"turn": len(request.chat_history) + 1, "actions": actions}
+    if not request.session_id:
+        return result
+    try:
+        await session_store.save(ROLE_PLAY_ACTIONS, request.session_id, result)
+    except Exception as e:
+        logger.warning(f"Could not save suggested actions: {str(e)}")
+    return result
+
+
+def _start_side_work(request: RolePlayRequest, reply: str, metadata: Dict[str, str], client: Any) -> asyncio.Task:
+    # Deferred actions are fetched after the turn's request has ended, so no request deadline applies
+    with request_deadline(None):
+        task = asyncio.get_running_loop().create_task(_finish_turn(request, reply, metadata, client))
+    session_id = request.session_id
+    if not session_id:
+        return task
+    _side_work[session_id] = task
+
+    def _forget(done: asyncio.Task) -> None:
+        if _side_work.get(session_id) is done:
+            del _side_work[session_id]
+
+    task.add_done_callback(_forget)
+    return task
+
+
+async def get_suggested_actions(session_id: str, wait: float) -> RolePlayActionsResponse:
+    """Actions for the latest turn of a session, waiting up to `wait` seconds if they are still being generated."""
+    task = _side_work.get(session_id)
+    if task is not None:
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout=wait)
+        except asyncio.TimeoutError:
+            return RolePlayActionsResponse(session_id=session_id, pending=True)
+        return RolePlayActionsResponse(session_id=session_id, pending=False, **result)
+
+    # Finished here, or handled by another worker sharing the session store
+    stored = await session_store.load(ROLE_PLAY_ACTIONS, session_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="No suggested actions for this session")
+    return RolePlayActionsResponse(session_id=session_id, pending=False, **stored)
+
+
+async def generate_role_play(request: RolePlayRequest, client: Any):
+    """
+    Returns as soon as the reply exists when `defer_actions` is set; the
+    actions are then fetched from /rpg_mode/actions/{session_id}. Otherwise
+    the response waits for them, as before.
+    """
+    try:
+        response = await generation_profiles.chat(
+            client,
+            NARRATIVE,
+            model=model_for(NARRATOR),
+            messages=await context_manager.fit(
+                _build_role_play_messages(request), client, model_for(NARRATOR), session_key=request.session_id
+            ),
+            options={"temperature": 0.75}
         )
 
+        reply = response['message']['content'].strip()
+        metadata = _role_play_metadata(request)
+        await _save_role_play_session(request, reply)
+
+        # Actions and storage continue in the background; shielded so a dropped connection keeps them going
+        side_work = _start_side_work(request, reply, metadata, client)
+        suggested_actions = None
+        if not request.defer_actions:
+            suggested_actions = (await asyncio.shield(side_work))["actions"]
+
         return StoryResponse(
             story=reply,
             character_count=len(reply),
@@ -135,13 +262,69 @@ async def generate_role_play(request: RolePlayRequest, client: Any):
             metadata=metadata,
             used_rag=False,
             reference_count=0,
-            actions=suggested_actions  # Include the context-aware actions in the response
+            actions=suggested_actions,  # Include the context-aware actions in the response
+            session_id=request.session_id
         )
 
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in role-play generation: {str(e)}")
 
 
+async def stream_role_play(request: RolePlayRequest, client: Any) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_role_play; the closing `done` event carries
+    the suggested actions. With `defer_actions`, `done` is sent as soon as
+    the reply is complete and an `actions` event follows.
+    """
+    try:
+        messages = await context_manager.fit(
+            _build_role_play_messages(request), client, model_for(NARRATOR), session_key=request.session_id
+        )
+        chunks = []
+        async for token in stream_chat_tokens(
+                client,
+                NARRATIVE,
+                model=model_for(NARRATOR),
+                messages=messages,
+                options={"temperature": 0.75}
+        ):
+            chunks.append(token)
+            yield sse_event("token", {"content": token})
+
+        reply = "".join(chunks).strip()
+        metadata = _role_play_metadata(request)
+        await _save_role_play_session(request, reply)
+
+        side_work = _start_side_work(request, reply, metadata, client)
+        suggested_actions = None
+        if not request.defer_actions:
+            suggested_actions = (await asyncio.shield(side_work))["actions"]
+
+        yield sse_event("done", StoryResponse(
+            story=reply,
+            character_count=len(reply),
+            language=request.language,
+            metadata=metadata,
+            used_rag=False,
+            reference_count=0,
+            actions=suggested_actions,
+            session_id=request.session_id
+        ))
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error in role-play generation: {str(e)}"})
+        return
+
+    if request.defer_actions:
+        yield sse_event("actions", await asyncio.shield(side_work))
+
+
+async def resume_evaluation_session(request: EvaluationRequest) -> EvaluationRequest:
+    """Take the chat history from the role-play session when the client only sends its id."""
+    return await session_store.resume(ROLE_PLAY, request)
+
+
 async def evaluate_chat_history(request: EvaluationRequest, client: Any):
     try:
         # Combine conversation history into a readable format
@@ -157,46 +340,18 @@ async def evaluate_chat_history(request: EvaluationRequest, client: Any):
         # If we have sentiment analysis capability, use it
         try:
             combined_text = " ".join([f"{turn['user']} {turn['ai']}" for turn in request.chat_history])
-            overall_sentiment = analyze_sentiment(combined_text)
+            overall_sentiment = await analyze_sentiment(combined_text)
             sentiment_modifier = int(overall_sentiment * 10)  # Convert to -10 to +10 scale
         except Exception as e:
-            print(f"Sentiment analysis not available: {str(e)}")
+            logger.warning(f"Sentiment analysis not available: {str(e)}")
 
         # Apply faction-specific modifiers if available
         faction_modifier = 0
         if hasattr(request, 'player_faction') and request.player_faction == "neutral":
             faction_modifier = 5  # Bonus for taking neutral role
 
-        # Set up improved evaluation prompt with detailed rubrics
-        prompt = (
-            "Evaluate the user's conflict resolution approach based on the KALKI scoring system:\n\n"
-            "1. EMPATHY (0-30): Did the user consider multiple perspectives? Score higher if they demonstrated understanding of all sides.\n"
-            "   - Low (0-10): Showed no understanding of opposing viewpoints\n"
-            "   - Medium (11-20): Some acknowledgment of other perspectives\n"
-            "   - High (21-30): Deep understanding of multiple viewpoints\n\n"
-            "2. DIPLOMATIC SKILL (0-30): Did the user promote peaceful negotiation? Score higher for constructive dialogue and compromise.\n"
-            "   - Low (0-10): Confrontational or inflexible approach\n"
-            "   - Medium (11-20): Some attempt at negotiation but with limitations\n"
-            "   - High (21-30): Skilled diplomacy with concrete proposals\n\n"
-            "3. HISTORICAL ACCURACY (0-20): Were the user's decisions informed by real-world lessons? Score higher for realistic approaches.\n"
-            "   - Low (0-7): Historically inaccurate or unrealistic\n"
-            "   - Medium (8-14): Generally aligned with historical context\n"
-            "   - High (15-20): Sophisticated understanding of historical dynamics\n\n"
-            "4. ETHICAL BALANCE (0-20): Did the user avoid bias and maintain ethical principles? Score higher for fair solutions.\n"
-            "   - Low (0-7): One-sided or ethically questionable approach\n"
-            "   - Medium (8-14): Some ethical considerations but with gaps\n"
-            "   - High (15-20): Strong ethical framework with consistent principles\n\n"
-            "Based on the conversation below, provide numeric scores for each category.\n\n"
-            f"{full_conversation}\n\n"
-            "IMPORTANT: Be critical and realistic in your assessment. Not all approaches succeed, and failed attempts should receive appropriate scores.\n"
-            "Respond in this exact format (with ONLY the scores and no additional text):\n"
-            "EMPATHY: [score]\n"
-            "DIPLOMATIC_SKILL: [score]\n"
-            "HISTORICAL_ACCURACY: [score]\n"
-            "ETHICAL_BALANCE: [score]\n"
-        )
-
         # Additional context if available
+        context = "a role-play conversation"
         if hasattr(request, 'conflict_type') and request.conflict_type:
             conflict_context = {
                 "india_pakistan": "the 1947 India-Pakistan partition with tension over borders, refugees, and religious differences",
@@ -206,29 +361,13 @@ async def evaluate_chat_history(request: EvaluationRequest, client: Any):
                 "rwanda": "the ethnic tensions in Rwanda leading up to and following the 1994 genocide"
             }
             context = conflict_context.get(request.conflict_type, "a historical conflict")
-            prompt = f"For context, this conversation is about {context}.\n\n{prompt}"
-
-        # Get evaluation from LLM with reduced temperature for consistency
-        response = await asyncio.to_thread(
-            client.chat,
-            model="llama3.2:latest",
-            messages=[{"role": "user", "content": prompt}],
-            options={"temperature": 0.2}  # Reduced temperature for more consistent scoring
-        )
 
-        evaluation_text = response['message']['content'].strip()
+        # Turns rated while the session was played are reused; only the rest are rated now
+        kalki = await kalki_engine.final_score(request.session_id, turn_pairs(request.chat_history), client, context)
 
-        # Parse scores using regex for more robust extraction
         scores = {}
-        empathy_match = re.search(r"EMPATHY: (\d+)", evaluation_text)
-        diplomatic_match = re.search(r"DIPLOMATIC_SKILL: (\d+)", evaluation_text)
-        historical_match = re.search(r"HISTORICAL_ACCURACY: (\d+)", evaluation_text)
-        ethical_match = re.search(r"ETHICAL_BALANCE: (\d+)", evaluation_text)
-
-        scores["EMPATHY"] = int(empathy_match.group(1)) if empathy_match else 15
-        scores["DIPLOMATIC_SKILL"] = int(diplomatic_match.group(1)) if diplomatic_match else 15
-        scores["HISTORICAL_ACCURACY"] = int(historical_match.group(1)) if historical_match else 10
-        scores["ETHICAL_BALANCE"] = int(ethical_match.group(1)) if ethical_match else 10
+        for field, category, _ in KALKI_DIMENSIONS:
+            scores[category] = kalki[field]
 
         # Apply sentiment and faction modifiers
         scores["EMPATHY"] = max(0, min(30, scores["EMPATHY"] + sentiment_modifier))
@@ -238,22 +377,11 @@ async def evaluate_chat_history(request: EvaluationRequest, client: Any):
         # Calculate total score
         total_score = sum(scores.values())
 
-        # If the evaluation contains detailed feedback, extract it
-        feedback = {}
-        sections = evaluation_text.split("\n\n")
-        if len(sections) > 1:
-            for section in sections:
-                for category in ["EMPATHY", "DIPLOMATIC_SKILL", "HISTORICAL_ACCURACY", "ETHICAL_BALANCE"]:
-                    if category in section:
-                        # Extract any text after the score as feedback
-                        pattern = rf"{category}: \d+(.*?)(?=\n\n|\Z)"
-                        match = re.search(pattern, section, re.DOTALL)
-                        if match and match.group(1).strip():
-                            feedback[category] = match.group(1).strip()
+        feedback = {category: kalki["feedback"][field] for field, category, _ in KALKI_DIMENSIONS if field in kalki["feedback"]}
 
         # Store evaluation results in vector database if available
         try:
-            if chroma_collection and request.session_id:
+            if evaluation_collection and request.session_id:
                 metadata = {
                     "mode": "evaluation",
                     "session_id": request.session_id,
@@ -273,18 +401,15 @@ async def evaluate_chat_history(request: EvaluationRequest, client: Any):
                 if hasattr(request, 'player_role'):
                     metadata["role"] = request.player_role
 
-                # Get embeddings for the conversation
-                conversation_embedding = await get_embeddings(full_conversation, client)
-
-                # Store in ChromaDB
-                chroma_collection.add(
-                    documents=[full_conversation],
-                    embeddings=[conversation_embedding],
-                    metadatas=[metadata],
-                    ids=[f"eval-{request.session_id}-{str(datetime.datetime.now().timestamp())}"]
+                # Embedded and stored in ChromaDB in the background
+                await ingestion_queue.enqueue(
+                    document=full_conversation,
+                    metadata=metadata,
+                    id_prefix=f"eval-{request.session_id}",
+                    mode=EVALUATION
                 )
         except Exception as e:
-            print(f"Warning: Could not store evaluation in vector database: {str(e)}")
+            logger.warning(f"Could not store evaluation in vector database: {str(e)}")
 
         return EvaluationResponse(
             empathy_score=scores["EMPATHY"],
@@ -1,34 +1,34 @@
+import logging
+import os
+
 from fastapi import HTTPException, Depends
-from typing import Any, List, Optional
-import ollama
+from typing import Any, AsyncIterator, List, Optional
 import asyncio
 from dotenv import load_dotenv
 import datetime
 
 from app.schemas.schema import Response, StoryRequest, StoryResponse, SearchQuery
-from app.db.singleton import ChromaDBSingleton
+from app.db.ingest import ingestion_queue
+from app.db.retrieval_cache import retrieval_cache
+from app.db.singleton import ChromaDBSingleton, STORY
+from app.utils.deadline import DeadlineExceeded, deadline_monitor, remaining, within_deadline
+from app.utils.embeddings import get_embeddings
+from app.utils.generation import NARRATIVE, generation_profiles, words_to_tokens
+from app.utils.get_model import get_model_client
+from app.utils.sse import sse_event, stream_chat_tokens
+from app.utils.model_registry import STORYTELLER, model_for
 
 load_dotenv()
 
 chroma_client = ChromaDBSingleton()
-chroma_collection = chroma_client.get_collection()
-
-
-async def get_model_client():
-    return ollama
-
+chroma_collection = chroma_client.get_collection(STORY)
 
-async def get_embeddings(text: str, client: Any = None):
-    if client is None:
-        client = await get_model_client()
-
-    response = await asyncio.to_thread(
-        client.embeddings,
-        model="all-minilm:33m",
-        prompt=text
-    )
+STORY_ATTEMPTS = int(os.getenv("STORY_ATTEMPTS", "3"))
+STORY_ATTEMPT_TIMEOUT = float(os.getenv("STORY_ATTEMPT_TIMEOUT", "60"))
+# A retry with less request budget left than this is not started
+STORY_MIN_ATTEMPT_SECONDS = float(os.getenv("STORY_MIN_ATTEMPT_SECONDS", "15"))
 
-    return response["embedding"]
+logger = logging.getLogger(__name__)
 
 
 async def add_story(request: StoryRequest, client: Any = Depends(get_model_client)):
@@ -38,105 +38,138 @@ async def add_story(request: StoryRequest, client: Any = Depends(get_model_clien
             "theme": request.theme,
             "max_length": request.max_length,
             "language": request.language,
-            "tone": request.tone
+            "tone": request.tone,
+            "source": "user"
         }
 
         story_text = f"{request.culture} {request.theme} {request.tone} {request.language}"
-        embeddings = await get_embeddings(story_text, client)
 
-        chroma_collection.add(
-            documents=[str(story_data)],
-            embeddings=[embeddings],
-            metadatas=[story_data],
-            ids=[request.culture + "-" + str(datetime.datetime.now().timestamp())]
+        await ingestion_queue.enqueue(
+            document=str(story_data),
+            metadata=story_data,
+            id_prefix=request.culture,
+            mode=STORY,
+            embed_text=story_text
         )
 
         return Response(
             success=True,
-            message="Added To VectorDB",
+            message="Queued For VectorDB",
             timestamp=str(datetime.datetime.now())
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding story: {str(e)}")
 
 
-async def retrieve_similar_stories(query: str, limit: int = 3, client: Any = None):
+async def retrieve_similar_stories(query: str, limit: int = 3, client: Any = None, where: Optional[dict] = None):
     if client is None:
         client = await get_model_client()
 
     try:
+        # Popular culture/theme/tone combinations skip both the embedding and the vector search
+        cache_key = retrieval_cache.make_key(STORY, query, limit, where)
+        results = retrieval_cache.get(cache_key)
+        if results is not None:
+            return results
+
         query_embedding = await get_embeddings(query, client)
 
         results = chroma_collection.query(
             query_embeddings=[query_embedding],
             n_results=limit,
+            where=where,
             include=["documents", "metadatas"]
         )
 
+        retrieval_cache.put(cache_key, results)
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving similar stories: {str(e)}")
 
 
-async def generate_story(request: StoryRequest, client: Any = Depends(get_model_client)):
+async def _retrieve_story_examples(request: StoryRequest, client: Any) -> List[str]:
     query = f"{request.culture} {request.theme} {request.tone}"
+    # Only model-written stories are useful examples; add_story entries are bare parameters
+    similar_stories = await retrieve_similar_stories(query, limit=2, client=client, where={"source": "generated"})
+    retrieved_stories = []
+
+    if similar_stories and len(similar_stories["documents"]) > 0 and len(similar_stories["documents"][0]) > 0:
+        retrieved_stories.extend(similar_stories["documents"][0])
+
+    return retrieved_stories
+
+
+def _build_story_prompt(request: StoryRequest, retrieved_stories: List[str]) -> str:
+    rag_context = ""
+    if retrieved_stories:
+        rag_context = "Here are some examples of similar stories for inspiration (DO NOT copy these directly):\n\n"
+        for i, story in enumerate(retrieved_stories):
+            rag_context += f"Example {i + 1}:\n{story[:500]}...\n\n"
+
+    return (
+        f"{rag_context}\n"
+        f"Generate an authentic and engaging story from {request.culture} culture. "
+        f"{'Theme: ' + request.theme + '.' if request.theme else ''} "
+        f"Use a {request.tone} tone. "
+        f"Ensure the story is between {max(100, request.max_length // 2)} and {request.max_length} words long. "
+        f"Write the story in {request.language}. "
+        f"Make this story unique and different from the examples."
+    )
+
+
+def _story_metadata(request: StoryRequest, retrieved_stories: List[str]) -> dict:
+    return {
+        "culture": request.culture,
+        "theme": request.theme,
+        "tone": request.tone,
+        "language": request.language,
+        "model": model_for(STORYTELLER),
+        "has_rag": len(retrieved_stories) > 0
+    }
 
-    try:
-        similar_stories = await retrieve_similar_stories(query, limit=2, client=client)
-        retrieved_stories = []
-
-        if similar_stories and len(similar_stories["documents"]) > 0 and len(similar_stories["documents"][0]) > 0:
-            for i, doc in enumerate(similar_stories["documents"][0]):
-                if "story-" in similar_stories["ids"][0][i]:
-                    retrieved_stories.append(doc)
-
-        rag_context = ""
-        if retrieved_stories:
-            rag_context = "Here are some examples of similar stories for inspiration (DO NOT copy these directly):\n\n"
-            for i, story in enumerate(retrieved_stories):
-                rag_context += f"Example {i + 1}:\n{story[:500]}...\n\n"
-
-        prompt = (
-            f"{rag_context}\n"
-            f"Generate an authentic and engaging story from {request.culture} culture. "
-            f"{'Theme: ' + request.theme + '.' if request.theme else ''} "
-            f"Use a {request.tone} tone. "
-            f"Ensure the story is between {max(100, request.max_length // 2)} and {request.max_length} words long. "
-            f"Write the story in {request.language}. "
-            f"Make this story unique and different from the examples."
-        )
 
-        for attempt in range(3):
+async def _store_story(story_content: str, metadata: dict, request: StoryRequest) -> None:
+    await ingestion_queue.enqueue(
+        document=story_content,
+        metadata={**metadata, "source": "generated"},
+        id_prefix=request.culture + "-story",
+        mode=STORY
+    )
+
+
+def _story_options(request: StoryRequest) -> dict:
+    # Cap decoding at the requested length, with some slack so the ending is not cut off
+    return {"num_predict": words_to_tokens(int(request.max_length * 1.2))}
+
+
+async def generate_story(request: StoryRequest, client: Any = Depends(get_model_client)):
+    try:
+        retrieved_stories = await _retrieve_story_examples(request, client)
+        prompt = _build_story_prompt(request, retrieved_stories)
+
+        for attempt in range(STORY_ATTEMPTS):
+            # Only try again if the request's remaining budget leaves room for a useful attempt
+            left = remaining()
+            if attempt > 0 and left is not None and left < STORY_MIN_ATTEMPT_SECONDS:
+                deadline_monitor.retries_skipped += 1
+                raise HTTPException(status_code=504, detail="Request timed out")
             try:
                 messages = [{"role": "user", "content": prompt}]
-                response = await asyncio.wait_for(
-                    asyncio.to_thread(
-                        client.chat,
-                        model="llama3.2:3b",
+                # A timed-out attempt is cancelled, which also stops the generation in Ollama
+                response = await within_deadline(
+                    generation_profiles.chat(
+                        client,
+                        NARRATIVE,
+                        model=model_for(STORYTELLER),
                         messages=messages,
-                        options={"temperature": 0.7, "top_p": 0.9}
+                        options=_story_options(request)
                     ),
-                    timeout=60
+                    limit=STORY_ATTEMPT_TIMEOUT
                 )
                 story_content = response['message']['content'].strip()
 
-                embeddings = await get_embeddings(story_content, client)
-
-                metadata = {
-                    "culture": request.culture,
-                    "theme": request.theme,
-                    "tone": request.tone,
-                    "language": request.language,
-                    "model": "llama3.2:3b",
-                    "has_rag": len(retrieved_stories) > 0
-                }
-
-                chroma_collection.add(
-                    documents=[story_content],
-                    embeddings=[embeddings],
-                    metadatas=[metadata],
-                    ids=[request.culture + "-story-" + str(datetime.datetime.now().timestamp())]
-                )
+                metadata = _story_metadata(request, retrieved_stories)
+                await _store_story(story_content, metadata, request)
 
                 return StoryResponse(
                     story=story_content,
@@ -146,18 +179,66 @@ async def generate_story(request: StoryRequest, client: Any = Depends(get_model_
                     used_rag=len(retrieved_stories) > 0,
                     reference_count=len(retrieved_stories)
                 )
+            except DeadlineExceeded:
+                raise HTTPException(status_code=504, detail="Request timed out")
             except asyncio.TimeoutError:
-                if attempt == 2:
+                if attempt == STORY_ATTEMPTS - 1:
                     raise HTTPException(status_code=504, detail="Request timed out")
             except Exception as e:
-                if attempt == 2:
+                if attempt == STORY_ATTEMPTS - 1:
                     raise HTTPException(status_code=500, detail=f"Failed to generate story: {str(e)}")
 
         raise HTTPException(status_code=500, detail="Maximum retries exceeded")
+    except HTTPException:
+        raise
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in RAG story generation: {str(e)}")
 
 
+async def stream_story(request: StoryRequest, client: Any) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_story. Emits `token` events as the model
+    produces them and a closing `done` event carrying the StoryResponse
+    fields; the story is embedded and stored only after the stream ends.
+    """
+    try:
+        retrieved_stories = await _retrieve_story_examples(request, client)
+        prompt = _build_story_prompt(request, retrieved_stories)
+
+        chunks = []
+        async for token in stream_chat_tokens(
+                client,
+                NARRATIVE,
+                model=model_for(STORYTELLER),
+                messages=[{"role": "user", "content": prompt}],
+                options=_story_options(request)
+        ):
+            chunks.append(token)
+            yield sse_event("token", {"content": token})
+
+        story_content = "".join(chunks).strip()
+        metadata = _story_metadata(request, retrieved_stories)
+
+        yield sse_event("done", StoryResponse(
+            story=story_content,
+            character_count=len(story_content),
+            language=request.language,
+            metadata=metadata,
+            used_rag=len(retrieved_stories) > 0,
+            reference_count=len(retrieved_stories)
+        ))
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error in RAG story generation: {str(e)}"})
+        return
+
+    try:
+        await _store_story(story_content, metadata, request)
+    except Exception as e:
+        logger.warning("Could not store streamed story: %s", str(e))
+
+
 async def search_stories(query: SearchQuery, client: Any = Depends(get_model_client)):
     try:
         search_text = f"{query.text} {query.culture if query.culture else ''} {query.theme if query.theme else ''}"
@@ -0,0 +1,373 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.db.retrieval_cache import retrieval_cache
+from app.db.singleton import ChromaDBSingleton, STORY
+from app.utils.embeddings import cosine_similarity, get_embeddings
+
+load_dotenv()
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "1000"))
+INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", "./ingest_spill.jsonl")
+# Records that could not be embedded or written end up here instead of being dropped
+INGEST_DEAD_LETTER_PATH = os.getenv("INGEST_DEAD_LETTER_PATH", "./ingest_dead_letter.jsonl")
+INGEST_DEDUP_THRESHOLD = float(os.getenv("INGEST_DEDUP_THRESHOLD", "0.97"))
+INGEST_DEDUP_MODES = [mode.strip() for mode in os.getenv("INGEST_DEDUP_MODES", "role-play,conflict-resolution").split(",") if mode.strip()]
+
+logger = logging.getLogger(__name__)
+
+
+def new_document_id(prefix: str) -> str:
+    """Collision-free document id that keeps the readable mode prefix."""
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+
+class IngestionQueue:
+    """
+    Write-behind pipeline for ChromaDB inserts, routed to the collection of
+    each record's mode.
+
+    Requests enqueue documents and return immediately; a background worker
+    embeds anything that arrived without a vector and upserts in batches,
+    flushing once `batch_size` records are waiting or `flush_interval`
+    seconds after the first one. The queue is bounded, so producers wait
+    when the store falls behind. Every record is appended to a spill file
+    before it is queued, and records replayed from it at start are written
+    back before they are queued again. The file is cleared only once the
+    queue drains and every record journalled in it has either been stored
+    or been appended to the dead-letter file, so records pending at a
+    crash, including replayed ones, are replayed on the next start.
+    Records that cannot be embedded or written go to the dead-letter file;
+    append its lines to the spill file before a restart to retry them. If
+    the dead-letter file cannot be written either, the spill is kept until
+    the next start instead.
+
+    For modes in `dedup_modes`, a record whose embedding has cosine
+    similarity >= `dedup_threshold` with its nearest neighbour (already
+    stored, or earlier in the same batch) is not inserted; the neighbour's
+    `duplicate_hits` counter is bumped instead.
+    """
+
+    def __init__(
+            self,
+            store: Any = None,
+            batch_size: int = INGEST_BATCH_SIZE,
+            flush_interval: float = INGEST_FLUSH_INTERVAL,
+            max_pending: int = INGEST_MAX_PENDING,
+            spill_path: Optional[str] = INGEST_SPILL_PATH,
+            dead_letter_path: Optional[str] = INGEST_DEAD_LETTER_PATH,
+            dedup_threshold: float = INGEST_DEDUP_THRESHOLD,
+            dedup_modes: Optional[List[str]] = None
+    ):
+        self._store = store
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self.dedup_threshold = dedup_threshold
+        self.dedup_modes = set(INGEST_DEDUP_MODES if dedup_modes is None else dedup_modes)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._spill = None
+        # Set when failed records could not be dead-lettered; the spill is then their only copy
+        self._keep_spill = False
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = 0.0
+        self.duplicates_skipped = 0
+        self.bytes_saved = 0
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = ChromaDBSingleton()
+        return self._store
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._worker.get_loop() is loop:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        pending = self._load_spill()
+        if self.spill_path:
+            if self._spill is not None:
+                self._spill.close()
+            # Rewritten rather than truncated: replayed records stay journalled until they are flushed
+            self._spill = open(self.spill_path, "w", encoding="utf-8")
+            for record in pending:
+                self._spill.write(json.dumps(record) + "\n")
+            self._spill.flush()
+        self._worker = loop.create_task(self._run())
+
+        for record in pending:
+            await self._queue.put(record)
+        self.replayed += len(pending)
+        if pending:
+            logger.info("Replaying %d spilled ingestion records", len(pending))
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop the worker."""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    async def enqueue(
+            self,
+            document: str,
+            metadata: Dict[str, Any],
+            id_prefix: str,
+            mode: str = STORY,
+            embed_text: Optional[str] = None,
+            embedding: Optional[List[float]] = None
+    ) -> str:
+        """
+        Queue a document for insertion and return its id. The document is
+        embedded in the background (from `embed_text` if given) unless a
+        precomputed `embedding` is passed.
+        """
+        await self.start()
+
+        self.store.get_collection(mode)
+
+        metadata = {key: value for key, value in metadata.items() if value is not None}
+        # Retention policies age documents out by this timestamp
+        metadata.setdefault("created_at", time.time())
+
+        record = {
+            "id": new_document_id(id_prefix),
+            "mode": mode,
+            "document": document,
+            "metadata": metadata,
+            "embed_text": embed_text,
+            "embedding": embedding
+        }
+
+        if self._spill is not None:
+            self._spill.write(json.dumps(record) + "\n")
+            self._spill.flush()
+
+        await self._queue.put(record)
+        self.enqueued += 1
+        return record["id"]
+
+    def _load_spill(self) -> List[Dict[str, Any]]:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+
+        records = []
+        with open(self.spill_path, encoding="utf-8") as spill:
+            for line in spill:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    continue
+        return records
+
+    def _truncate_spill(self) -> None:
+        if self._spill is not None:
+            self._spill.seek(0)
+            self._spill.truncate()
+
+    def _dead_letter(self, records: List[Dict[str, Any]]) -> None:
+        if self.dead_letter_path:
+            try:
+                with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter:
+                    for record in records:
+                        dead_letter.write(json.dumps(record) + "\n")
+                self.dead_lettered += len(records)
+                return
+            except OSError as e:
+                logger.error("Could not dead-letter %d ingestion records: %s", len(records), str(e))
+        self._keep_spill = True
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                failed = await self._flush(batch)
+            except Exception as e:
+                failed = batch
+                logger.exception("Ingestion flush failed: %s", str(e))
+
+            if failed:
+                self.failed += len(failed)
+                self._dead_letter(failed)
+            # Everything journalled so far is now in the store or the dead-letter file
+            if self._queue.empty() and not self._keep_spill:
+                self._truncate_spill()
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write `batch` to the store; returns the records that could not be embedded or written."""
+        started = time.perf_counter()
+
+        missing = [record for record in batch if record["embedding"] is None]
+        vectors = await asyncio.gather(
+            *[get_embeddings(record["embed_text"] or record["document"]) for record in missing],
+            return_exceptions=True
+        )
+        for record, vector in zip(missing, vectors):
+            if isinstance(vector, Exception):
+                logger.warning("Could not embed %s: %s", record["id"], str(vector))
+            else:
+                record["embedding"] = vector
+
+        failed = [record for record in batch if record["embedding"] is None]
+        ready = [record for record in batch if record["embedding"] is not None]
+        if ready and self.dedup_modes:
+            ready = await asyncio.to_thread(self._suppress_duplicates, ready)
+        if not ready:
+            return failed
+
+        try:
+            await asyncio.to_thread(self._write, ready)
+            self.batches += 1
+            self.flushed += len(ready)
+        except Exception as e:
+            # Isolate the bad record(s) rather than losing the whole batch
+            logger.warning("Batch insert failed, retrying individually: %s", str(e))
+            for record in ready:
+                try:
+                    await asyncio.to_thread(self._write, [record])
+                    self.flushed += 1
+                except Exception as e:
+                    failed.append(record)
+                    logger.error("Could not insert ingestion record %s: %s", record["id"], str(e))
+
+        self.last_flush_ms = 1000 * (time.perf_counter() - started)
+        return failed
+
+    def _suppress_duplicates(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        kept = []
+        by_mode: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_mode.setdefault(record.get("mode", STORY), []).append(record)
+
+        for mode, group in by_mode.items():
+            if mode not in self.dedup_modes:
+                kept.extend(group)
+                continue
+
+            collection = self.store.get_collection(mode)
+            neighbours = None
+            if collection.count() > 0:
+                neighbours = collection.query(
+                    query_embeddings=[record["embedding"] for record in group],
+                    n_results=1,
+                    include=["embeddings", "metadatas"]
+                )
+
+            accepted: List[Dict[str, Any]] = []
+            merged: Dict[str, Dict[str, Any]] = {}
+
+            for i, record in enumerate(group):
+                match = None
+                if neighbours is not None and neighbours["ids"][i]:
+                    neighbour_id = neighbours["ids"][i][0]
+                    similarity = cosine_similarity(record["embedding"], neighbours["embeddings"][i][0])
+                    # A replayed spill record finds itself; that is not a duplicate
+                    if neighbour_id != record["id"] and similarity >= self.dedup_threshold:
+                        metadata = merged.setdefault(neighbour_id, dict(neighbours["metadatas"][i][0] or {}))
+                        match = (neighbour_id, metadata, similarity)
+
+                if match is None:
+                    for other in accepted:
+                        similarity = cosine_similarity(record["embedding"], other["embedding"])
+                        if similarity >= self.dedup_threshold:
+                            match = (other["id"], other["metadata"], similarity)
+                            break
+
+                if match is None:
+                    accepted.append(record)
+                    continue
+
+                neighbour_id, metadata, similarity = match
+                metadata["duplicate_hits"] = metadata.get("duplicate_hits", 0) + 1
+                metadata["last_seen_at"] = time.time()
+                saved = len(record["document"].encode("utf-8")) + 4 * len(record["embedding"])
+                self.duplicates_skipped += 1
+                self.bytes_saved += saved
+                logger.info(
+                    "Skipped near-duplicate %s in %s (cosine %.3f with %s, ~%d bytes saved)",
+                    record["id"], mode, similarity, neighbour_id, saved
+                )
+
+            if merged:
+                collection.update(ids=list(merged), metadatas=list(merged.values()))
+            kept.extend(accepted)
+
+        return kept
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        by_mode: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_mode.setdefault(record.get("mode", STORY), []).append(record)
+
+        # upsert keeps spill replays idempotent
+        for mode, group in by_mode.items():
+            self.store.get_collection(mode).upsert(
+                ids=[record["id"] for record in group],
+                documents=[record["document"] for record in group],
+                embeddings=[record["embedding"] for record in group],
+                metadatas=[record["metadata"] for record in group]
+            )
+            retrieval_cache.record_writes(mode, len(group))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "max_pending": self.max_pending,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failed": self.failed,
+            "replayed": self.replayed,
+            "dead_lettered": self.dead_lettered,
+            "last_flush_ms": self.last_flush_ms,
+            "dedup_threshold": self.dedup_threshold,
+            "duplicates_skipped": self.duplicates_skipped,
+            "bytes_saved": self.bytes_saved
+        }
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,136 @@
+"""
+Split the legacy single `cultural_stories` collection into per-mode collections.
+
+Usage (from the backend directory):
+    python -m app.db.migrate [--path ./chroma_db] [--batch-size 500] [--dry-run]
+    python -m app.db.migrate --reembed [--path ./chroma_db] [--batch-size 500] [--dry-run]
+
+Role-play, conflict and evaluation documents are copied, embeddings included,
+into their own collections and removed from `cultural_stories`. Stories stay
+where they are and get a `source` tag so retrieval can filter on it.
+
+With --reembed, every document in every collection is embedded again with the
+current embedding service instead. Run it once after EMBEDDING_VERSION or the
+embedding model changes: collections written before the switch to /api/embed
+hold unnormalised vectors that must not be compared with normalised ones.
+"""
+import argparse
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.db.singleton import ChromaDBSingleton, COLLECTIONS, STORY, ROLE_PLAY, CONFLICT, EVALUATION
+from app.utils.embeddings import embedding_service
+from app.utils.get_model import close_model_client
+
+LEGACY_MODES = {
+    "role-play": ROLE_PLAY,
+    "conflict-resolution": CONFLICT,
+    "evaluation": EVALUATION,
+}
+
+
+def classify(doc_id: str, metadata: Optional[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """Return the target mode for a legacy document and its (possibly tagged) metadata."""
+    metadata = dict(metadata or {})
+    mode = LEGACY_MODES.get(metadata.get("mode"))
+    if mode is not None:
+        return mode, metadata
+
+    if "source" not in metadata:
+        # Generated stories were the only ids carrying "-story-"; the rest came from add_story
+        metadata["source"] = "generated" if "-story-" in doc_id else "user"
+    return STORY, metadata
+
+
+def migrate(path: str = "./chroma_db", batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    store = ChromaDBSingleton(path)
+    legacy = store.get_collection(STORY)
+    counts = {mode: 0 for mode in COLLECTIONS}
+
+    all_ids: List[str] = legacy.get(include=[])["ids"]
+    for start in range(0, len(all_ids), batch_size):
+        chunk = legacy.get(
+            ids=all_ids[start:start + batch_size],
+            include=["documents", "metadatas", "embeddings"]
+        )
+
+        moves: Dict[str, Dict[str, list]] = {}
+        retagged_ids, retagged_metadata = [], []
+
+        for i, doc_id in enumerate(chunk["ids"]):
+            original = chunk["metadatas"][i]
+            mode, metadata = classify(doc_id, original)
+            counts[mode] += 1
+
+            if mode == STORY:
+                if metadata != (original or {}):
+                    retagged_ids.append(doc_id)
+                    retagged_metadata.append(metadata)
+                continue
+
+            target = moves.setdefault(mode, {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+            target["ids"].append(doc_id)
+            target["documents"].append(chunk["documents"][i])
+            target["metadatas"].append(metadata)
+            target["embeddings"].append([float(value) for value in chunk["embeddings"][i]])
+
+        if dry_run:
+            continue
+
+        for mode, target in moves.items():
+            store.get_collection(mode).upsert(**target)
+            legacy.delete(ids=target["ids"])
+
+        if retagged_ids:
+            legacy.update(ids=retagged_ids, metadatas=retagged_metadata)
+
+    return counts
+
+
+async def _reembed(path: str, batch_size: int, dry_run: bool) -> Dict[str, int]:
+    store = ChromaDBSingleton(path)
+    counts = {mode: 0 for mode in COLLECTIONS}
+    try:
+        for mode in COLLECTIONS:
+            collection = store.get_collection(mode)
+            all_ids: List[str] = collection.get(include=[])["ids"]
+            counts[mode] = len(all_ids)
+            if dry_run:
+                continue
+
+            for start in range(0, len(all_ids), batch_size):
+                chunk = collection.get(ids=all_ids[start:start + batch_size], include=["documents"])
+                embeddings = await asyncio.gather(
+                    *(embedding_service.embed(document or "") for document in chunk["documents"])
+                )
+                collection.update(ids=chunk["ids"], embeddings=list(embeddings))
+    finally:
+        await close_model_client()
+    return counts
+
+
+def reembed(path: str = "./chroma_db", batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """Replace the stored embedding of every document with one from the current embedding service."""
+    return asyncio.run(_reembed(path, batch_size, dry_run))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split cultural_stories into per-mode collections, or re-embed them")
+    parser.add_argument("--path", default="./chroma_db", help="ChromaDB persistence directory")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    parser.add_argument("--reembed", action="store_true", help="Re-embed every stored document instead")
+    args = parser.parse_args()
+
+    if args.reembed:
+        counts = reembed(args.path, args.batch_size, args.dry_run)
+    else:
+        counts = migrate(args.path, args.batch_size, args.dry_run)
+    for mode, count in counts.items():
+        print(f"{COLLECTIONS[mode]:<20} {count}")
+    if args.dry_run:
+        print("Dry run: nothing was changed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Retention, cold archival and compaction for the per-mode vector collections.
+
+Usage (from the backend directory):
+    python -m app.db.retention [--mode conflict-resolution] [--dry-run]
+
+Evicted documents are appended, embeddings included, to a compressed JSONL
+archive (zstd when the `zstandard` package is installed, gzip otherwise)
+and then deleted from the live index.
+"""
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.db.retrieval_cache import retrieval_cache
+from app.db.singleton import ChromaDBSingleton, COLLECTIONS, STORY, ROLE_PLAY, CONFLICT, EVALUATION, DEBATE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "./chroma_archive")
+# Seconds between background compaction runs; 0 disables the periodic task
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", str(6 * 60 * 60)))
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+
+class RetentionPolicy:
+    """
+    Limits for one collection. Any limit left as None is not enforced.
+
+    - max_age_days: evict documents older than this
+    - max_per_session: keep only the newest N documents per session_id
+    - max_total: keep only the newest N documents overall
+    - latest_per_session_only: keep just the newest document per session_id
+    """
+
+    def __init__(
+            self,
+            max_age_days: Optional[float] = None,
+            max_per_session: Optional[int] = None,
+            max_total: Optional[int] = None,
+            latest_per_session_only: bool = False
+    ):
+        self.max_age_days = max_age_days
+        self.max_per_session = 1 if latest_per_session_only else max_per_session
+        self.max_total = max_total
+
+    def select_evictions(self, ids: List[str], metadatas: List[Dict[str, Any]], now: float) -> List[str]:
+        """Return the ids that violate this policy, given each document's metadata."""
+        documents = sorted(
+            zip(ids, metadatas),
+            key=lambda item: item[1].get("created_at", now),
+            reverse=True
+        )
+        evicted = set()
+
+        if self.max_age_days is not None:
+            cutoff = now - self.max_age_days * DAY
+            evicted.update(doc_id for doc_id, metadata in documents if metadata.get("created_at", now) < cutoff)
+
+        if self.max_per_session is not None:
+            seen: Dict[str, int] = {}
+            for doc_id, metadata in documents:
+                session_id = metadata.get("session_id")
+                if session_id is None:
+                    continue
+                seen[session_id] = seen.get(session_id, 0) + 1
+                if seen[session_id] > self.max_per_session:
+                    evicted.add(doc_id)
+
+        if self.max_total is not None:
+            survivors = [doc_id for doc_id, _ in documents if doc_id not in evicted]
+            evicted.update(survivors[self.max_total:])
+
+        return [doc_id for doc_id in ids if doc_id in evicted]
+
+
+DEFAULT_POLICIES = {
+    STORY: RetentionPolicy(max_total=5000),
+    ROLE_PLAY: RetentionPolicy(max_age_days=30, max_per_session=50, max_total=20000),
+    CONFLICT: RetentionPolicy(max_age_days=30, max_per_session=50, max_total=20000),
+    EVALUATION: RetentionPolicy(max_age_days=180, latest_per_session_only=True),
+    DEBATE: RetentionPolicy(max_age_days=90, max_total=5000),
+}
+
+
+def _open_archive(mode: str, archive_dir: str):
+    os.makedirs(archive_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    base = os.path.join(archive_dir, f"{COLLECTIONS[mode]}-{stamp}.jsonl")
+
+    if zstandard is not None:
+        raw = open(base + ".zst", "ab")
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=True), base + ".zst"
+    return gzip.open(base + ".gz", "ab"), base + ".gz"
+
+
+class RetentionManager:
+    def __init__(
+            self,
+            store: Any = None,
+            policies: Optional[Dict[str, RetentionPolicy]] = None,
+            archive_dir: str = RETENTION_ARCHIVE_DIR,
+            batch_size: int = 500
+    ):
+        self._store = store
+        self.policies = policies or DEFAULT_POLICIES
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.archived = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = ChromaDBSingleton()
+        return self._store
+
+    def compact_mode(self, mode: str, dry_run: bool = False) -> Dict[str, Any]:
+        collection = self.store.get_collection(mode)
+        policy = self.policies[mode]
+        now = time.time()
+
+        listing = collection.get(include=["metadatas"])
+        ids = listing["ids"]
+        metadatas = [metadata or {} for metadata in listing["metadatas"]]
+
+        # Legacy documents have no timestamp; start their clock now
+        unstamped = [doc_id for doc_id, metadata in zip(ids, metadatas) if "created_at" not in metadata]
+        if unstamped and not dry_run:
+            for metadata in metadatas:
+                metadata.setdefault("created_at", now)
+            stamped = dict(zip(ids, metadatas))
+            for start in range(0, len(unstamped), self.batch_size):
+                chunk = unstamped[start:start + self.batch_size]
+                collection.update(ids=chunk, metadatas=[stamped[doc_id] for doc_id in chunk])
+
+        evictions = policy.select_evictions(ids, metadatas, now)
+        report = {"mode": mode, "live": len(ids), "evicted": len(evictions), "archive": None}
+        if dry_run or not evictions:
+            return report
+
+        archive, archive_path = _open_archive(mode, self.archive_dir)
+        try:
+            for start in range(0, len(evictions), self.batch_size):
+                chunk = collection.get(
+                    ids=evictions[start:start + self.batch_size],
+                    include=["documents", "metadatas", "embeddings"]
+                )
+                for i, doc_id in enumerate(chunk["ids"]):
+                    line = json.dumps({
+                        "id": doc_id,
+                        "document": chunk["documents"][i],
+                        "metadata": chunk["metadatas"][i],
+                        "embedding": [float(value) for value in chunk["embeddings"][i]]
+                    })
+                    archive.write((line + "\n").encode("utf-8"))
+                # Only delete once the batch is safely in the archive
+                archive.flush()
+                collection.delete(ids=chunk["ids"])
+        finally:
+            archive.close()
+
+        retrieval_cache.record_writes(mode, len(evictions))
+        self.archived += len(evictions)
+        report["archive"] = archive_path
+        return report
+
+    def compact(self, modes: Optional[List[str]] = None, dry_run: bool = False) -> List[Dict[str, Any]]:
+        reports = []
+        for mode in modes or list(self.policies):
+            try:
+                reports.append(self.compact_mode(mode, dry_run))
+            except Exception as e:
+                logger.exception("Compaction of %s failed: %s", mode, str(e))
+                reports.append({"mode": mode, "error": str(e)})
+
+        if not dry_run:
+            self.runs += 1
+            self.last_run = {"finished_at": datetime.datetime.now().isoformat(), "reports": reports}
+        return reports
+
+    async def _run_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            reports = await asyncio.to_thread(self.compact)
+            logger.info("Vector store compaction: %s", reports)
+
+    def start(self, interval: float = RETENTION_INTERVAL) -> None:
+        if interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run_periodically(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "archived": self.archived,
+            "archive_format": "zstd" if zstandard is not None else "gzip",
+            "last_run": self.last_run
+        }
+
+
+retention_manager = RetentionManager()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply retention policies and archive evicted documents")
+    parser.add_argument("--mode", choices=list(COLLECTIONS), action="append",
+                        help="Collection to compact (repeatable); defaults to all")
+    parser.add_argument("--path", default="./chroma_db", help="ChromaDB persistence directory")
+    parser.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be evicted")
+    args = parser.parse_args()
+
+    manager = RetentionManager(store=ChromaDBSingleton(args.path), archive_dir=args.archive_dir)
+    for report in manager.compact(args.mode, args.dry_run):
+        if "error" in report:
+            print(f"{report['mode']:<20} error: {report['error']}")
+        else:
+            print(f"{report['mode']:<20} live={report['live']:<6} evicted={report['evicted']:<6} {report['archive'] or ''}")
+    if args.dry_run:
+        print("Dry run: nothing was changed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+# How many new documents a partition may receive before cached results for it are dropped.
+# Every /story call writes a story, so 0 would invalidate the story cache on nearly every request.
+RETRIEVAL_CACHE_MAX_STALE_WRITES = int(os.getenv("RETRIEVAL_CACHE_MAX_STALE_WRITES", "16"))
+
+
+def normalise_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class RetrievalCache:
+    """
+    LRU + TTL cache of vector-store query results, keyed by mode, normalised
+    query text, n_results and where-filter. Each mode has a write generation
+    that the ingestion pipeline bumps after inserting; an entry is served only
+    while its partition has seen at most `max_stale_writes` writes since the
+    entry was cached.
+    """
+
+    def __init__(
+            self,
+            max_size: int = RETRIEVAL_CACHE_SIZE,
+            ttl: float = RETRIEVAL_CACHE_TTL,
+            max_stale_writes: int = RETRIEVAL_CACHE_MAX_STALE_WRITES
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_stale_writes = max_stale_writes
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float, int]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def make_key(mode: str, query: str, n_results: int, where: Optional[dict] = None) -> Tuple:
+        return mode, normalise_query(query), n_results, json.dumps(where, sort_keys=True, default=str)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            results, cached_at, generation = entry
+            if time.monotonic() - cached_at > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            if self._generations.get(key[0], 0) - generation > self.max_stale_writes:
+                del self._entries[key]
+                self.invalidated += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key: Tuple, results: Any) -> None:
+        with self._lock:
+            self._entries[key] = (results, time.monotonic(), self._generations.get(key[0], 0))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_writes(self, mode: str, count: int = 1) -> None:
+        """Called after `count` documents were written to the `mode` partition."""
+        with self._lock:
+            self._generations[mode] = self._generations.get(mode, 0) + count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+                "entries": len(self._entries),
+                "capacity": self.max_size,
+                "ttl_seconds": self.ttl,
+                "max_stale_writes": self.max_stale_writes,
+                "write_generations": dict(self._generations)
+            }
+
+
+retrieval_cache = RetrievalCache()
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, TypeVar
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+load_dotenv()
+
+# "memory" keeps sessions in-process; "sqlite" survives restarts and is shared by workers on one host
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./sessions.sqlite3")
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+logger = logging.getLogger(__name__)
+
+RequestT = TypeVar("RequestT", bound=BaseModel)
+
+
+class SessionBackend:
+    """
+    Storage interface for session state. Keys are `(kind, session_id)` and
+    values are JSON-serialisable dicts. Entries expire `ttl` seconds after
+    their last save; once more than `max_entries` are held, the least
+    recently saved ones are evicted.
+    """
+
+    # Whether calls do I/O and should run off the event loop
+    blocking = False
+
+    def get(self, kind: str, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, kind: str, session_id: str, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, kind: str, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class MemorySessionBackend(SessionBackend):
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple[str, str], tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, kind: str, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get((kind, session_id))
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[(kind, session_id)]
+                self.expired += 1
+                return None
+            # Stored serialised so callers never share mutable state with the store
+            return json.loads(payload)
+
+    def put(self, kind: str, session_id: str, state: Dict[str, Any]) -> None:
+        payload = json.dumps(state)
+        with self._lock:
+            self._entries[(kind, session_id)] = (payload, time.time() + self.ttl)
+            self._entries.move_to_end((kind, session_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def delete(self, kind: str, session_id: str) -> bool:
+        with self._lock:
+            return self._entries.pop((kind, session_id), None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "expired": self.expired,
+                "evicted": self.evicted
+            }
+
+
+class SQLiteSessionBackend(SessionBackend):
+    blocking = True
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "kind TEXT NOT NULL, session_id TEXT NOT NULL, state TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, session_id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._db.commit()
+
+    def get(self, kind: str, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, expires_at FROM sessions WHERE kind = ? AND session_id = ?",
+                (kind, session_id)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() >= row[1]:
+                self._db.execute("DELETE FROM sessions WHERE kind = ? AND session_id = ?", (kind, session_id))
+                self._db.commit()
+                self.expired += 1
+                return None
+            return json.loads(row[0])
+
+    def put(self, kind: str, session_id: str, state: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (kind, session_id, state, updated_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (kind, session_id, json.dumps(state), now, now + self.ttl)
+            )
+            self.expired += self._db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+            overflow = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self.evicted += self._db.execute(
+                    "DELETE FROM sessions WHERE rowid IN "
+                    "(SELECT rowid FROM sessions ORDER BY updated_at ASC LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+            self._db.commit()
+
+    def delete(self, kind: str, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM sessions WHERE kind = ? AND session_id = ?", (kind, session_id)
+            ).rowcount
+            self._db.commit()
+            return deleted > 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "capacity": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+
+def create_backend(name: str = SESSION_BACKEND) -> SessionBackend:
+    if name == "sqlite":
+        return SQLiteSessionBackend()
+    if name == "memory":
+        return MemorySessionBackend()
+    raise ValueError(f"Unknown session backend: {name}")
+
+
+class SessionStore:
+    """
+    Server-side state for multi-turn modes (conflict, role-play, debate), so
+    clients only send `session_id` and the new input. Any field a client
+    does send still overrides the stored value.
+    """
+
+    def __init__(self, backend: Optional[SessionBackend] = None):
+        self._backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self) -> SessionBackend:
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    @staticmethod
+    def new_session_id() -> str:
+        return str(uuid.uuid4())
+
+    async def _call(self, method: str, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(getattr(self.backend, method), *args)
+        return getattr(self.backend, method)(*args)
+
+    async def load(self, kind: str, session_id: str) -> Optional[Dict[str, Any]]:
+        state = await self._call("get", kind, session_id)
+        if state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return state
+
+    async def save(self, kind: str, session_id: str, state: Dict[str, Any]) -> None:
+        await self._call("put", kind, session_id, state)
+
+    async def delete(self, kind: str, session_id: str) -> bool:
+        return await self._call("delete", kind, session_id)
+
+    async def resume(self, kind: str, request: RequestT, required: Iterable[str] = ()) -> RequestT:
+        """
+        Return `request` with the fields the client left out filled in from
+        the stored session. Raises 404 when the session is unknown and the
+        request alone is incomplete, 422 when no session was given at all.
+        """
+        session_id = getattr(request, "session_id", None)
+        state = await self.load(kind, session_id) if session_id else None
+        if state is not None:
+            request = type(request).model_validate({**state, **request.model_dump(exclude_unset=True)})
+
+        missing = [field for field in required if getattr(request, field) is None]
+        if missing:
+            if session_id:
+                raise HTTPException(status_code=404, detail="Session not found or expired")
+            raise HTTPException(status_code=422, detail=f"Missing fields for a new session: {', '.join(missing)}")
+        return request
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+session_store = SessionStore()
@@ -1,6 +1,23 @@
 import threading
 import chromadb
 
+# One collection per game mode. Stories keep the original collection name
+# so existing persisted data stays readable without a migration.
+STORY = "story"
+ROLE_PLAY = "role-play"
+CONFLICT = "conflict-resolution"
+EVALUATION = "evaluation"
+DEBATE = "debate"
+
+COLLECTIONS = {
+    STORY: "cultural_stories",
+    ROLE_PLAY: "role_play_turns",
+    CONFLICT: "conflict_turns",
+    EVALUATION: "evaluations",
+    DEBATE: "debate_arguments",
+}
+
+
 class ChromaDBSingleton:
     _instance = None
     _lock = threading.Lock()
@@ -14,7 +31,13 @@ class ChromaDBSingleton:
 
     def _init_client(self, path):
         self.client = chromadb.PersistentClient(path=path)
-        self.collection = self.client.get_or_create_collection("cultural_stories")
+        self.collections = {
+            mode: self.client.get_or_create_collection(name)
+            for mode, name in COLLECTIONS.items()
+        }
+        self.collection = self.collections[STORY]
 
-    def get_collection(self):
-        return self.collection
\ No newline at end of file
+    def get_collection(self, mode=STORY):
+        if mode not in self.collections:
+            raise ValueError(f"Unknown collection mode: {mode}")
+        return self.collections[mode]
@@ -1,5 +1,6 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
@@ -8,12 +9,43 @@ from app.routes.story_router import router
 from app.routes.rpg_router import rpg_router
 from app.routes.conflict_router import conflict_router
 from app.routes.debate_router import debate_router
+from app.routes.metrics_router import metrics_router
+from app.controllers.dilemma_pool import dilemma_pool
+from app.db.ingest import ingestion_queue
+from app.db.retention import retention_manager
+from app.utils.context import context_manager
+from app.utils.cpu_pool import cpu_pool
+from app.utils.deadline import DeadlineMiddleware
+from app.utils.get_model import close_model_client, get_async_client
+from app.utils.model_registry import model_registry
+from app.utils.model_runtime import sentiment_runtime
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Story Generator API", version="1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything here only starts background work, so the app can serve straight away
+    await ingestion_queue.start()
+    retention_manager.start()
+    model_registry.start(get_async_client())
+    dilemma_pool.start(get_async_client())
+    sentiment_runtime.start()
+    yield
+    await sentiment_runtime.stop()
+    await cpu_pool.stop()
+    await dilemma_pool.stop()
+    await context_manager.stop()
+    await model_registry.stop()
+    await retention_manager.stop()
+    await ingestion_queue.stop()
+    await close_model_client()
+
+app = FastAPI(title="Story Generator API", version="1.0", lifespan=lifespan)
 
 templates = Jinja2Templates(directory="templates")
 
+# Inside CORS so its 504 responses still carry CORS headers
+app.add_middleware(DeadlineMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,6 +59,19 @@ app.include_router(rpg_router, prefix="/api/v1", tags=["Role Playing"])
 app.include_router(conflict_router, prefix="/api/v1", tags=["Conflict Resolution"])
 app.include_router(debate_router, prefix="/api/v1", tags=["Debate Mode"])
 app.include_router(results_router, prefix="/api", tags=["Results"])
+app.include_router(metrics_router, prefix="/api/v1", tags=["Metrics"])
+
+@app.get("/ready")
+async def readiness():
+    """503 until every configured model has been loaded and warmed up; sentiment is reported but optional"""
+    return JSONResponse(
+        status_code=200 if model_registry.ready else 503,
+        content={
+            "ready": model_registry.ready,
+            "models": {m: s["warm"] for m, s in model_registry.models.items()},
+            "sentiment": sentiment_runtime.state
+        }
+    )
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
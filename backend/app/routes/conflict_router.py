@@ -1,8 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import Any
 
-from app.controllers.conflict_resolution import get_model_client, generate_conflict_scenario
-from app.schemas.schema import ConflictRequest, ConflictResponse, Response
+from app.controllers.conflict_resolution import (
+    generate_conflict_scenario,
+    resume_conflict_session,
+    stream_conflict_scenario
+)
+from app.schemas.schema import ConflictRequest, ConflictResponse
+from app.utils.get_model import get_model_client
+from app.utils.sse import sse_response
 
 conflict_router = APIRouter()
 
@@ -12,12 +18,11 @@ async def start_conflict_endpoint(request: ConflictRequest, client: Any = Depend
     """
     Endpoint to start a new conflict resolution scenario.
     This should be used for the initial request when beginning a new scenario.
+    The returned session_id is enough to continue it; state is kept on the server.
     """
-    if request.chat_history is None:
-        request.chat_history = []
-
     request.session_id = request.session_id or None
     request.current_stage = request.current_stage or 0
+    request = await resume_conflict_session(request)
 
     try:
         return await generate_conflict_scenario(request, client)
@@ -30,17 +35,30 @@ async def continue_conflict_endpoint(request: ConflictRequest, client: Any = Dep
     """
     Endpoint to continue an existing conflict resolution scenario.
     This should be used for subsequent requests after starting a scenario.
+    Only session_id and user_input are required; anything else sent overrides the stored session.
     """
     if not request.session_id:
         raise HTTPException(status_code=400, detail="Session ID is required to continue a conflict scenario")
 
-    if request.chat_history is None:
-        request.chat_history = []
+    request = await resume_conflict_session(request)
 
     try:
         return await generate_conflict_scenario(request, client)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error continuing conflict scenario: {str(e)}")
+
+
+@conflict_router.post("/continue-conflict/stream")
+async def stream_conflict_endpoint(request: ConflictRequest, client: Any = Depends(get_model_client)):
+    """
+    Streaming variant of /continue-conflict.
+    Tokens are sent as Server-Sent Events; the final `done` event carries the ConflictResponse.
+    """
+    if not request.session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required to continue a conflict scenario")
+
+    request = await resume_conflict_session(request)
+    return sse_response(stream_conflict_scenario(request, client))
 # from fastapi import APIRouter, Depends, HTTPException
 # from typing import Any, Optional
 # import redis.asyncio as redis
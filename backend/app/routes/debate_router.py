@@ -1,11 +1,13 @@
-from typing import Any
+from typing import Any, Optional
 
 from fastapi import APIRouter, Depends
 
 from app.controllers.debate_controller import (
     generate_debate_prompt,
     evaluate_debate_response,
-    process_debate_message, get_model_client
+    process_debate_message,
+    resume_debate_session,
+    stream_debate_message
 )
 from app.schemas.schema import (
     DebateRequest,
@@ -14,20 +16,32 @@ from app.schemas.schema import (
     DebateMessageRequest,
     DebateMessageResponse
 )
+from app.utils.get_model import get_model_client
+from app.utils.scheduler import BACKGROUND, llm_priority
+from app.utils.single_flight import single_flight
+from app.utils.sse import sse_response
 
 debate_router = APIRouter(prefix="/debate", tags=["debate"])
 
 @debate_router.get("/prompt", response_model=DebatePromptResponse)
-async def get_debate_prompt(client : Any = Depends(get_model_client)):
-    """Get a new ethical dilemma for debate"""
-    return await generate_debate_prompt(client)
+async def get_debate_prompt(topic : Optional[str] = None, client : Any = Depends(get_model_client)):
+    """Get a new ethical dilemma for debate, optionally on one of the pool's topics"""
+    return await generate_debate_prompt(client, topic)
 
 @debate_router.post("/message", response_model=DebateMessageResponse)
 async def send_debate_message(request: DebateMessageRequest, client : Any = Depends(get_model_client)):
     """Send a message in the debate conversation and get AI response"""
+    request = await resume_debate_session(request)
     return await process_debate_message(request,client)
 
+@debate_router.post("/message/stream")
+async def stream_debate_message_endpoint(request: DebateMessageRequest, client : Any = Depends(get_model_client)):
+    """Stream the AI debate response token by token as Server-Sent Events"""
+    request = await resume_debate_session(request)
+    return sse_response(stream_debate_message(request, client))
+
 @debate_router.post("/evaluate", response_model=DebateEvaluationResponse)
 async def evaluate_debate(request: DebateRequest, client : Any = Depends(get_model_client)):
-    """Evaluate the entire debate conversation"""
-    return await evaluate_debate_response(request,client)
\ No newline at end of file
+    """Evaluate the entire debate conversation; a double-submitted evaluation shares the first one's result"""
+    with llm_priority(BACKGROUND):
+        return await single_flight.run("debate-evaluate", request, lambda: evaluate_debate_response(request, client))
\ No newline at end of file
@@ -0,0 +1,117 @@
+from fastapi import APIRouter
+
+from app.controllers.dilemma_pool import dilemma_pool
+from app.controllers.kalki import kalki_engine
+from app.db.ingest import ingestion_queue
+from app.db.retention import retention_manager
+from app.db.retrieval_cache import retrieval_cache
+from app.db.session_store import session_store
+from app.utils.context import context_manager
+from app.utils.cpu_pool import cpu_pool
+from app.utils.deadline import deadline_monitor
+from app.utils.embeddings import embedding_service
+from app.utils.generation import generation_profiles
+from app.utils.get_model import get_async_client
+from app.utils.model_registry import model_registry
+from app.utils.scheduler import llm_scheduler
+from app.utils.model_runtime import sentiment_runtime
+from app.utils.sentiment import sentiment_engine
+from app.utils.single_flight import single_flight
+
+metrics_router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@metrics_router.get("/embeddings")
+async def get_embedding_metrics():
+    """Cache hit/miss and micro-batching statistics for the shared embedding service"""
+    return embedding_service.stats()
+
+
+@metrics_router.get("/model-client")
+async def get_model_client_metrics():
+    """Connection pool utilisation of the shared Ollama client"""
+    return get_async_client().stats()
+
+
+@metrics_router.get("/ingestion")
+async def get_ingestion_metrics():
+    """Queue depth and flush statistics of the write-behind ChromaDB pipeline"""
+    return ingestion_queue.stats()
+
+
+@metrics_router.get("/retrieval")
+async def get_retrieval_metrics():
+    """Hit rate and invalidation counts of the story retrieval cache"""
+    return retrieval_cache.stats()
+
+
+@metrics_router.get("/retention")
+async def get_retention_metrics():
+    """Compaction runs and cold-archive totals for the vector store"""
+    return retention_manager.stats()
+
+
+@metrics_router.get("/context")
+async def get_context_metrics():
+    """Summarisation calls and estimated prompt tokens saved by history folding"""
+    return context_manager.stats()
+
+
+@metrics_router.get("/sessions")
+async def get_session_metrics():
+    """Size, hit rate and expiry counts of the server-side session store"""
+    return session_store.stats()
+
+
+@metrics_router.get("/models")
+async def get_model_metrics():
+    """Role-to-model mapping, warm-up state and swap/reload events"""
+    return model_registry.stats()
+
+
+@metrics_router.get("/scheduler")
+async def get_scheduler_metrics():
+    """Queue depth, running calls and wait times per LLM priority class"""
+    return llm_scheduler.stats()
+
+
+@metrics_router.get("/dilemmas")
+async def get_dilemma_pool_metrics():
+    """Depth, refill rate and hit/miss counts of the pre-generated debate dilemma pool"""
+    return dilemma_pool.stats()
+
+
+@metrics_router.get("/kalki")
+async def get_kalki_metrics():
+    """Per-turn KALKI ratings made in the background versus backfilled at final scoring"""
+    return kalki_engine.stats()
+
+
+@metrics_router.get("/generation")
+async def get_generation_metrics():
+    """Decoding settings of each generation profile with its prompt and generated token counts"""
+    return generation_profiles.stats()
+
+
+@metrics_router.get("/deadlines")
+async def get_deadline_metrics():
+    """Requests cut by deadline or disconnect, skipped retries and model seconds spent on cancelled calls"""
+    return deadline_monitor.stats()
+
+
+@metrics_router.get("/single-flight")
+async def get_single_flight_metrics():
+    """Identical concurrent requests computed once versus served from a shared in-flight computation"""
+    return single_flight.stats()
+
+
+@metrics_router.get("/sentiment")
+async def get_sentiment_metrics():
+    """Model load state and time, memo hit rate, batch sizes and predict latency of the shared sentiment engine"""
+    return {**sentiment_engine.stats(), "runtime": sentiment_runtime.stats()}
+
+
+@metrics_router.get("/cpu-pool")
+async def get_cpu_pool_metrics():
+    """Worker processes, queued and refused jobs, timeouts and job latency of the CPU pool"""
+    return cpu_pool.stats()
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from typing import Any
 
 from app.controllers.results import analyze_user_responses
-from app.controllers.role_playing import get_model_client
+from app.utils.get_model import get_model_client
 from app.schemas.schema import ResultsResponse
+from app.utils.scheduler import BACKGROUND, llm_priority
+from app.utils.single_flight import single_flight
 
 results_router = APIRouter()
 
@@ -20,4 +22,5 @@ async def get_user_results(user_id: str, client: Any = Depends(get_model_client)
 
     Returns detailed scores, feedback, and improvement suggestions.
     """
-    return await analyze_user_responses(user_id, client)
\ No newline at end of file
+    with llm_priority(BACKGROUND, session=user_id):
+        return await single_flight.run("results", {"user_id": user_id}, lambda: analyze_user_responses(user_id, client))
\ No newline at end of file
@@ -1,15 +1,39 @@
 from typing import Any
 
-from app.controllers.role_playing import generate_role_play, get_model_client, evaluate_chat_history
-from app.schemas.schema import StoryResponse, RolePlayRequest, EvaluationResponse, EvaluationRequest
-from fastapi import APIRouter, Depends
+from app.controllers.role_playing import (
+    generate_role_play,
+    evaluate_chat_history,
+    resume_evaluation_session,
+    get_suggested_actions,
+    stream_role_play,
+    resume_role_play_session
+)
+from app.schemas.schema import StoryResponse, RolePlayRequest, RolePlayActionsResponse, EvaluationResponse, EvaluationRequest
+from app.utils.get_model import get_model_client
+from app.utils.scheduler import BACKGROUND, llm_priority
+from app.utils.single_flight import single_flight
+from app.utils.sse import sse_response
+from fastapi import APIRouter, Depends, Query
 
 rpg_router = APIRouter()
 
 @rpg_router.post("/rpg_mode", response_model=StoryResponse)
 async def rpg_endpoint(request : RolePlayRequest, client : Any = Depends(get_model_client)):
+    request = await resume_role_play_session(request)
     return await generate_role_play(request, client)
 
+@rpg_router.post("/rpg_mode/stream")
+async def rpg_stream_endpoint(request : RolePlayRequest, client : Any = Depends(get_model_client)):
+    request = await resume_role_play_session(request)
+    return sse_response(stream_role_play(request, client))
+
+@rpg_router.get("/rpg_mode/actions/{session_id}", response_model=RolePlayActionsResponse)
+async def rpg_actions_endpoint(session_id : str, wait : float = Query(10.0, ge=0, le=60)):
+    """Suggested actions for a turn sent with defer_actions, waiting up to `wait` seconds for them"""
+    return await get_suggested_actions(session_id, wait)
+
 @rpg_router.post("/rpg_evaluate", response_model=EvaluationResponse)
 async def evaluation_endpoint(request: EvaluationRequest, client: Any = Depends(get_model_client)):
-    return await evaluate_chat_history(request, client)
\ No newline at end of file
+    request = await resume_evaluation_session(request)
+    with llm_priority(BACKGROUND):
+        return await single_flight.run("rpg-evaluate", request, lambda: evaluate_chat_history(request, client))
\ No newline at end of file
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends
-from app.controllers.story import get_model_client, add_story, generate_story
+from app.controllers.story import add_story, generate_story, stream_story
 from app.schemas.schema import StoryResponse, StoryRequest, Response
+from app.utils.get_model import get_model_client
+from app.utils.single_flight import single_flight
+from app.utils.sse import sse_response
 
 router = APIRouter()
 
 @router.post("/add_story", response_model=Response)
-async def add_story_endpoint(request: StoryRequest):
-    return await add_story(request)
+async def add_story_endpoint(request: StoryRequest, client=Depends(get_model_client)):
+    return await add_story(request, client)
 
 @router.post("/story", response_model=StoryResponse)
 async def generate_story_endpoint(request: StoryRequest, client=Depends(get_model_client)):
-    return await generate_story(request, client)
+    return await single_flight.run("story", request, lambda: generate_story(request, client))
+
+@router.post("/story/stream")
+async def stream_story_endpoint(request: StoryRequest, client=Depends(get_model_client)):
+    return sse_response(stream_story(request, client))
@@ -24,6 +24,7 @@ class StoryResponse(BaseModel):
     used_rag: bool
     reference_count: int
     actions: Optional[List[str]] = None
+    session_id: Optional[str] = None
 
 class Response(BaseModel):
     success: bool
@@ -31,14 +32,24 @@ class Response(BaseModel):
     timestamp: str
 
 class RolePlayRequest(BaseModel):
-    role: str
-    culture: str
-    era: str
-    tone: str
-    language: str
-    include_emotion: bool
+    # Scene fields and history may be omitted when continuing a stored session
+    role: Optional[str] = None
+    culture: Optional[str] = None
+    era: Optional[str] = None
+    tone: Optional[str] = None
+    language: Optional[str] = None
+    include_emotion: bool = False
     user_input: str
-    chat_history: List[Dict[str, str]]
+    chat_history: List[Dict[str, str]] = []
+    session_id: Optional[str] = None
+    # Return the reply without waiting for suggested actions; fetch them from /rpg_mode/actions/{session_id}
+    defer_actions: bool = False
+
+class RolePlayActionsResponse(BaseModel):
+    session_id: str
+    actions: Optional[List[str]] = None
+    turn: Optional[int] = None
+    pending: bool
 
 class SentimentRequest(BaseModel):
     story : str
@@ -58,15 +69,19 @@ class DebateRequest(BaseModel):
 class DebatePromptResponse(BaseModel):
     prompt: str
     timestamp: str
+    topic: Optional[str] = None
 
 class DebateMessageRequest(BaseModel):
-    prompt: str
+    # prompt and history may be omitted when continuing a stored session
+    prompt: Optional[str] = None
     message: str
-    history: List[Dict[str, str]]
+    history: List[Dict[str, str]] = []
+    session_id: Optional[str] = None
 
 class DebateMessageResponse(BaseModel):
     content: str
     timestamp: str
+    session_id: Optional[str] = None
 
 class DebateEvaluationResponse(BaseModel):
     evaluation: str
@@ -110,9 +125,10 @@ class KalkiScore(BaseModel):
     feedback: Optional[Dict[str, str]]
 
 class ConflictRequest(BaseModel):
-    conflict_type: ConflictType
-    player_role: Role
-    player_faction: Faction
+    # Scenario fields, stage, tension and history are loaded from the session when omitted
+    conflict_type: Optional[ConflictType] = None
+    player_role: Optional[Role] = None
+    player_faction: Optional[Faction] = None
     user_input: str
     current_stage: int = 1
     tension_level: int = 50
@@ -138,7 +154,8 @@ class ResultsResponse(BaseModel):
     improvement_suggestions: List[str]
 
 class EvaluationRequest(BaseModel):
-    chat_history: List[Dict[str, str]]  # List of {"user": "message", "ai": "response"} dictionaries
+    chat_history: List[Dict[str, str]] = []  # List of {"user": "message", "ai": "response"} dictionaries
+    session_id: Optional[str] = None  # Role-play session to evaluate; its history and per-turn scores are reused
 
 class EvaluationResponse(BaseModel):
     empathy_score: int
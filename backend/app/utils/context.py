@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.deadline import request_deadline
+from app.utils.generation import SUMMARY, generation_profiles
+from app.utils.model_registry import SUMMARISER, model_for
+from app.utils.scheduler import BACKGROUND, llm_priority
+
+load_dotenv()
+
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3072"))
+CONTEXT_REPLY_RESERVE = int(os.getenv("CONTEXT_REPLY_RESERVE", "512"))
+CONTEXT_SUMMARY_MODEL = model_for(SUMMARISER)
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "1024"))
+
+# Prompt-side token budgets per chat model; anything unlisted uses CONTEXT_TOKEN_BUDGET
+MODEL_TOKEN_BUDGETS = {
+    "llama3.2:latest": 4096,
+    "llama3.2:3b": 4096,
+    "llama3:latest": 4096,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages: Iterable[Dict[str, str]]) -> int:
+    # A few tokens of per-message framing in the chat template
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+
+def turns_to_messages(turns: Iterable[Any]) -> List[Dict[str, str]]:
+    """Convert {"user", "ai"} dicts or ChatTurn models into chat messages."""
+    messages = []
+    for turn in turns:
+        user, ai = (turn["user"], turn["ai"]) if isinstance(turn, dict) else (turn.user, turn.ai)
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": ai})
+    return messages
+
+
+def render_transcript(messages: Iterable[Dict[str, str]]) -> str:
+    lines = []
+    for message in messages:
+        if message["role"] == "user":
+            lines.append(f"User: {message['content']}\n")
+        elif message["role"] == "assistant":
+            lines.append(f"AI: {message['content']}\n\n")
+        else:
+            lines.append(f"{message['content']}\n\n")
+    return "".join(lines)
+
+
+def _digest(messages: List[Dict[str, str]]) -> str:
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ContextManager:
+    """
+    Keeps chat prompts within a per-model token budget. The last
+    `keep_turns` exchanges are sent verbatim; older ones are folded into a
+    running summary that is cached per conversation and extended
+    incrementally, so each turn only summarises the messages that newly
+    fell out of the verbatim window.
+
+    Folding never holds up a reply: it runs as a background task at
+    BACKGROUND priority, queued behind the reply it was started for, and
+    until it lands prompts use the last summary plus as many of the
+    not-yet-summarised messages as the budget allows. A failed fold keeps
+    the last good summary and is retried on the next turn.
+    """
+
+    def __init__(
+            self,
+            keep_turns: int = CONTEXT_KEEP_TURNS,
+            default_budget: int = CONTEXT_TOKEN_BUDGET,
+            reply_reserve: int = CONTEXT_REPLY_RESERVE,
+            summary_model: str = CONTEXT_SUMMARY_MODEL,
+            cache_size: int = CONTEXT_CACHE_SIZE
+    ):
+        self.keep_turns = keep_turns
+        self.default_budget = default_budget
+        self.reply_reserve = reply_reserve
+        self.summary_model = summary_model
+        self.cache_size = cache_size
+        # conversation key -> (messages folded, digest of those messages, summary)
+        self._summaries: "OrderedDict[str, tuple[int, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # conversation key -> running fold
+        self._folds: Dict[str, asyncio.Task] = {}
+
+        self.summary_calls = 0
+        self.failed_folds = 0
+        self.incremental_folds = 0
+        self.cache_hits = 0
+        self.tokens_saved = 0
+
+    def budget_for(self, model: str) -> int:
+        return MODEL_TOKEN_BUDGETS.get(model, self.default_budget) - self.reply_reserve
+
+    async def fit(
+            self,
+            messages: List[Dict[str, str]],
+            client: Any,
+            model: str,
+            session_key: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Fit `[system..., history..., current input]` into the budget of
+        `model`. Leading system messages and the final message are kept as-is.
+        """
+        head = []
+        while len(head) < len(messages) - 1 and messages[len(head)]["role"] == "system":
+            head.append(messages[len(head)])
+        current = messages[-1:]
+        history = messages[len(head):-1] if len(messages) > len(head) else []
+
+        verbatim = history[-2 * self.keep_turns:] if self.keep_turns > 0 else []
+        older = history[:len(history) - len(verbatim)]
+
+        budget = self.budget_for(model)
+        while len(verbatim) > 2 and count_message_tokens(head + verbatim + current) > budget:
+            older, verbatim = older + verbatim[:2], verbatim[2:]
+
+        if not older:
+            return messages
+
+        # The opening exchange identifies a conversation whose history is replayed by the client
+        key = session_key or _digest(older[:2])
+        summary, folded = self._cached(key, older)
+        if folded == len(older):
+            self.cache_hits += 1
+        else:
+            self._fold_later(key, older, client)
+
+        note = [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}] if summary else []
+        # Messages the summary does not cover yet, newest first, for as long as they fit
+        carried: List[Dict[str, str]] = []
+        for message in reversed(older[folded:]):
+            if count_message_tokens(head + note + [message] + carried + verbatim + current) > budget:
+                break
+            carried.insert(0, message)
+        fitted = head + note + carried + verbatim + current
+
+        self.tokens_saved += max(0, count_message_tokens(messages) - count_message_tokens(fitted))
+        return fitted
+
+    async def fit_transcript(
+            self,
+            messages: List[Dict[str, str]],
+            client: Any,
+            model: str,
+            session_key: Optional[str] = None
+    ) -> str:
+        """Same as `fit` for a history with no pending input, rendered as a "User: / AI:" transcript."""
+        # A placeholder input keeps the last real exchange inside the history window
+        placeholder = {"role": "user", "content": ""}
+        fitted = await self.fit(messages + [placeholder], client, model, session_key)
+        return render_transcript(fitted[:-1])
+
+    def _cached(self, key: str, older: List[Dict[str, str]]) -> tuple[str, int]:
+        """The cached summary of a prefix of `older` and how many messages it covers ("", 0 if none)."""
+        with self._lock:
+            cached = self._summaries.get(key)
+        if cached is not None:
+            count, digest, summary = cached
+            if count <= len(older) and _digest(older[:count]) == digest:
+                return summary, count
+        return "", 0
+
+    def _fold_later(self, key: str, older: List[Dict[str, str]], client: Any) -> None:
+        running = self._folds.get(key)
+        if running is not None and not running.done():
+            # The next turn folds in whatever this one misses
+            return
+        # The fold outlives the request that started it, so it must not inherit its deadline
+        with request_deadline(None), llm_priority(BACKGROUND, session="context-summary"):
+            task = asyncio.get_running_loop().create_task(self._fold(key, list(older), client))
+        self._folds[key] = task
+        task.add_done_callback(lambda done: self._folds.pop(key, None) if self._folds.get(key) is done else None)
+
+    async def _fold(self, key: str, older: List[Dict[str, str]], client: Any) -> None:
+        previous, folded = self._cached(key, older)
+        if folded == len(older):
+            return
+
+        summary_so_far = f"Summary so far:\n{previous}\n\n" if previous else ""
+        prompt = (
+            "You maintain a running summary of a conversation so that it can continue without the full transcript. "
+            "Keep names, places, decisions, commitments and the current situation. Write at most 150 words.\n\n"
+            f"{summary_so_far}"
+            f"New messages to fold in:\n{render_transcript(older[folded:])}\n"
+            "Updated summary:"
+        )
+
+        try:
+            response = await generation_profiles.chat(
+                client,
+                SUMMARY,
+                model=self.summary_model,
+                messages=[{"role": "user", "content": prompt}]
+            )
+            summary = response["message"]["content"].strip()
+        except Exception as e:
+            # The last good summary stays cached and the next turn tries again
+            self.failed_folds += 1
+            logger.warning("Could not summarise conversation history: %s", str(e))
+            return
+
+        self.summary_calls += 1
+        if previous:
+            self.incremental_folds += 1
+
+        with self._lock:
+            self._summaries[key] = (len(older), _digest(older), summary)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    async def stop(self) -> None:
+        folds = list(self._folds.values())
+        for task in folds:
+            task.cancel()
+        await asyncio.gather(*folds, return_exceptions=True)
+        self._folds.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keep_turns": self.keep_turns,
+            "summary_calls": self.summary_calls,
+            "incremental_folds": self.incremental_folds,
+            "cache_hits": self.cache_hits,
+            "pending_folds": sum(1 for task in self._folds.values() if not task.done()),
+            "failed_folds": self.failed_folds,
+            "cached_conversations": len(self._summaries),
+            "estimated_tokens_saved": self.tokens_saved
+        }
+
+
+context_manager = ContextManager()
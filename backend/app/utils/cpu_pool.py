@@ -0,0 +1,192 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from app.utils.deadline import within_deadline
+
+load_dotenv()
+
+# 0 turns the pool off; CPU-bound work then runs in a thread of this process
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Jobs queued or running at once; further submissions are refused rather than left to pile up
+CPU_POOL_MAX_PENDING = int(os.getenv("CPU_POOL_MAX_PENDING", "256"))
+CPU_POOL_TIMEOUT = float(os.getenv("CPU_POOL_TIMEOUT", "10"))
+# "spawn" keeps workers free of the server's threads and open connections
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")
+# "module:function" loaders each worker runs once at startup, e.g. to load a model
+CPU_POOL_PRELOAD = [
+    name.strip() for name in os.getenv(
+        "CPU_POOL_PRELOAD", "app.utils.model_runtime:init_sentiment_worker"
+    ).split(",") if name.strip()
+]
+
+logger = logging.getLogger(__name__)
+
+# Filled in each worker process by _init_worker
+_preloaded: Dict[str, Any] = {}
+
+
+class CpuPoolBusy(RuntimeError):
+    """Raised when the pool already has CPU_POOL_MAX_PENDING jobs."""
+
+
+def _resolve(name: str) -> Callable[[], Any]:
+    module, function = name.split(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def _init_worker(preload: Sequence[str]) -> None:
+    for name in preload:
+        started = time.perf_counter()
+        try:
+            result = _resolve(name)()
+        except Exception as e:
+            # Raising here would break the whole pool; the failure is reported by the warm-up ping instead
+            _preloaded[name] = {"error": str(e)}
+            continue
+        _preloaded[name] = {"result": result, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _ping() -> Dict[str, Any]:
+    return {"pid": os.getpid(), "preloaded": _preloaded}
+
+
+class CpuPool:
+    """
+    Process pool for CPU-bound scoring, so it runs on every core instead
+    of stalling the event loop. Workers are started together and each
+    runs the `preload` loaders once, so models are in memory before the
+    first job. `submit` takes a picklable top-level function; jobs past
+    `max_pending` are refused with CpuPoolBusy and each job waits at most
+    `timeout` seconds (and never past the request deadline). A crashed
+    worker breaks the pool, which is then replaced on the next submit.
+    """
+
+    def __init__(
+            self,
+            workers: int = CPU_POOL_WORKERS,
+            max_pending: int = CPU_POOL_MAX_PENDING,
+            timeout: float = CPU_POOL_TIMEOUT,
+            preload: Optional[Sequence[str]] = None,
+            start_method: str = CPU_POOL_START_METHOD
+    ):
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self.preload = list(CPU_POOL_PRELOAD if preload is None else preload)
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.restarts = 0
+        self.worker_pids: List[int] = []
+        self._latencies = deque(maxlen=512)
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(self.preload,)
+            )
+        return self._executor
+
+    def _replace_broken(self, executor: ProcessPoolExecutor) -> None:
+        if self._executor is executor:
+            self._executor = None
+            self.restarts += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.warning("CPU pool worker died; the pool will be restarted")
+
+    async def submit(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """Result of `fn(*args)` computed in a worker process (or a thread when the pool is off)."""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise CpuPoolBusy(f"CPU pool has {self._pending} pending jobs")
+
+        self._pending += 1
+        self.submitted += 1
+        started = time.perf_counter()
+        future = None
+        try:
+            if self.enabled:
+                executor = self._ensure_executor()
+                future = executor.submit(fn, *args)
+                result = await within_deadline(asyncio.wrap_future(future), limit=timeout or self.timeout)
+            else:
+                result = await within_deadline(asyncio.to_thread(fn, *args), limit=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            if future is not None:
+                # Only drops a job still queued; one already running finishes in its worker
+                future.cancel()
+            raise
+        except BrokenProcessPool:
+            self.failed += 1
+            self._replace_broken(executor)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        self.completed += 1
+        self._latencies.append(time.perf_counter() - started)
+        return result
+
+    async def warm(self) -> List[Dict[str, Any]]:
+        """Start every worker and return what each one preloaded; an empty list when the pool is off."""
+        if not self.enabled:
+            return []
+        # Submitted together, the pings make the executor start every worker now
+        reports = await asyncio.gather(*(
+            asyncio.wrap_future(self._ensure_executor().submit(_ping)) for _ in range(self.workers)
+        ))
+        self.worker_pids = sorted({report["pid"] for report in reports})
+        return reports
+
+    async def stop(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "worker_pids": self.worker_pids,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "restarts": self.restarts,
+            "avg_job_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p95_job_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+        }
+
+
+cpu_pool = CpuPool()
@@ -0,0 +1,223 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Default time budget of an API request, in seconds
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+# Clients may ask for a shorter (or, up to this cap, longer) budget with the header below
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "300"))
+REQUEST_TIMEOUT_HEADER = b"x-request-timeout"
+# Controllers get this long past the deadline to answer with their own error before the request is cut
+REQUEST_DEADLINE_GRACE = float(os.getenv("REQUEST_DEADLINE_GRACE", "2"))
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() deadline of the current request, if any
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when the current request's time budget runs out."""
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """
+    Give the code inside this block at most `seconds`; an enclosing,
+    earlier deadline still wins. None lifts the deadline, for work that
+    outlives the request (background tasks started from a handler).
+    """
+    if seconds is None:
+        token = _deadline.set(None)
+    else:
+        deadline = time.monotonic() + seconds
+        current = _deadline.get()
+        token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline() -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        deadline_monitor.exceeded += 1
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+async def within_deadline(awaitable: Awaitable[T], limit: Optional[float] = None) -> T:
+    """
+    Await `awaitable`, cancelling it when the request deadline passes
+    (DeadlineExceeded) or after `limit` seconds (asyncio.TimeoutError),
+    whichever comes first.
+    """
+    left = remaining()
+    budget = left if limit is None else (limit if left is None else min(limit, left))
+    if budget is None:
+        return await awaitable
+    if left is not None and left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        deadline_monitor.exceeded += 1
+        raise DeadlineExceeded("Request deadline exceeded")
+    try:
+        # Runs in the calling task, so stream iterators and scheduler slots stay with their owner
+        async with asyncio.timeout(budget):
+            return await awaitable
+    except asyncio.TimeoutError:
+        if left is not None and budget == left:
+            deadline_monitor.exceeded += 1
+            raise DeadlineExceeded("Request deadline exceeded") from None
+        raise
+
+
+class DeadlineMonitor:
+    """Counts requests cut short and the model time spent on work nobody received."""
+
+    def __init__(self):
+        self.exceeded = 0
+        self.disconnects = 0
+        self.requests_cut = 0
+        self.retries_skipped = 0
+        self.cancelled_calls = 0
+        self.wasted_model_seconds = 0.0
+        self._wasted = deque(maxlen=512)
+
+    def record_waste(self, seconds: float) -> None:
+        """A model call that held a slot for `seconds` was cancelled before it finished."""
+        self.cancelled_calls += 1
+        self.wasted_model_seconds += seconds
+        self._wasted.append((time.time(), seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        hour_ago = time.time() - 3600
+        return {
+            "request_timeout": REQUEST_TIMEOUT,
+            "deadline_exceeded": self.exceeded,
+            "client_disconnects": self.disconnects,
+            "requests_cut": self.requests_cut,
+            "retries_skipped": self.retries_skipped,
+            "cancelled_model_calls": self.cancelled_calls,
+            "wasted_model_seconds": round(self.wasted_model_seconds, 3),
+            "wasted_model_seconds_last_hour": round(sum(s for at, s in self._wasted if at >= hour_ago), 3)
+        }
+
+
+deadline_monitor = DeadlineMonitor()
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware that starts every HTTP request with a deadline and
+    cancels the handler when the client disconnects or the deadline (plus
+    a short grace period) has passed. Cancelling the handler closes any
+    in-flight Ollama connection, which makes Ollama stop generating.
+    Event streams from `sse_response` close themselves with an `error`
+    event at the deadline, inside the grace period.
+    """
+
+    def __init__(self, app: Any, timeout: float = REQUEST_TIMEOUT, grace: float = REQUEST_DEADLINE_GRACE):
+        self.app = app
+        self.timeout = timeout
+        self.grace = grace
+
+    def _timeout(self, scope: Dict[str, Any]) -> float:
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_TIMEOUT_HEADER:
+                try:
+                    return max(0.0, min(float(value), REQUEST_TIMEOUT_MAX))
+                except ValueError:
+                    break
+        return self.timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        loop = asyncio.get_running_loop()
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = False
+        response_started = False
+        response_complete = False
+        reason: Optional[str] = None
+
+        async def pump():
+            nonlocal disconnected, reason
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    # After the last body chunk this is just the connection closing
+                    if not handler.done() and not response_complete:
+                        reason = reason or "disconnect"
+                        handler.cancel()
+                    return
+
+        async def wrapped_receive():
+            if disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def wrapped_send(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        def cut():
+            nonlocal reason
+            if not handler.done() and not response_complete:
+                reason = reason or "deadline"
+                handler.cancel()
+
+        seconds = self._timeout(scope)
+        with request_deadline(seconds):
+            handler = loop.create_task(self.app(scope, wrapped_receive, wrapped_send))
+        pumping = loop.create_task(pump())
+        timer = loop.call_later(seconds + self.grace, cut)
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if reason is None:
+                # The server itself is cancelling this request
+                raise
+            if reason == "disconnect":
+                deadline_monitor.disconnects += 1
+            else:
+                deadline_monitor.requests_cut += 1
+                logger.warning("Request to %s cut at its %.1fs deadline", scope.get("path"), seconds)
+                if not response_started and not disconnected:
+                    body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+                    await send({
+                        "type": "http.response.start",
+                        "status": 504,
+                        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                    })
+                    await send({"type": "http.response.body", "body": body})
+        finally:
+            timer.cancel()
+            pumping.cancel()
+            if not handler.done():
+                handler.cancel()
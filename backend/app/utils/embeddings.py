@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.deadline import request_deadline, within_deadline
+from app.utils.get_model import get_async_client
+from app.utils.model_registry import EMBEDDER, model_for
+
+load_dotenv()
+
+EMBEDDING_MODEL = model_for(EMBEDDER)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+# Bump whenever the endpoint or the normalisation of vectors changes, so vectors
+# of different schemes are never mixed. 1: /api/embeddings, unnormalised;
+# 2: /api/embed, L2-normalised.
+EMBEDDING_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+
+def embedding_key(text: str, model: str, version: int = EMBEDDING_VERSION) -> str:
+    """Content hash used to identify an embedding for a given model and embedding scheme."""
+    return hashlib.sha256(f"v{version}\x00{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = math.fsum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(math.fsum(x * x for x in a)) * math.sqrt(math.fsum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-memory LRU in front of a SQLite table
+    that survives restarts. Vectors are stored on disk as packed float32.
+    The table is cleared when it was written under an older
+    EMBEDDING_VERSION, recorded as the database's user_version.
+
+    Disk reads and writes run in a worker thread so they never block the
+    event loop. Vectors are kept as tuples and handed out as fresh lists,
+    so a caller changing its copy cannot corrupt the cache.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, path: Optional[str] = EMBEDDING_CACHE_PATH):
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, tuple[float, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # The connection is shared by worker threads; one statement at a time
+        self._db_lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+                )
+                version = self._db.execute("PRAGMA user_version").fetchone()[0]
+                if version < EMBEDDING_VERSION:
+                    dropped = self._db.execute("DELETE FROM embeddings").rowcount
+                    self._db.execute(f"PRAGMA user_version = {EMBEDDING_VERSION}")
+                    if dropped:
+                        logger.info("Dropped %d cached embeddings from embedding version %d", dropped, version)
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("Embedding disk cache disabled: %s", str(e))
+                self._db = None
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return list(vector)
+
+        if self._db is not None:
+            blob = await asyncio.to_thread(self._read, key)
+            if blob is not None:
+                vector = tuple(array("f", blob))
+                with self._lock:
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                return list(vector)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def put(self, key: str, model: str, vector: List[float]) -> None:
+        with self._lock:
+            self._remember(key, tuple(vector))
+        if self._db is not None:
+            await asyncio.to_thread(self._write, key, model, array("f", vector).tobytes())
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with self._db_lock:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Could not read cached embedding: %s", str(e))
+            return None
+        return row[0] if row is not None else None
+
+    def _write(self, key: str, model: str, blob: bytes) -> None:
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                    (key, model, blob)
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Could not persist embedding: %s", str(e))
+
+    def _remember(self, key: str, vector: "tuple[float, ...]") -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            disk_entries = None
+            if self._db is not None:
+                with self._db_lock:
+                    disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_capacity": self.max_size,
+                "disk_entries": disk_entries
+            }
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into a single list-input
+    `embed` call. A batch is flushed once it reaches `max_batch_size` or
+    `max_wait_ms` after its first request arrived, whichever comes first.
+    """
+
+    def __init__(self, max_batch_size: int = EMBEDDING_BATCH_SIZE, max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight = set()
+
+        self.batches = 0
+        self.requests = 0
+        self.failed_batches = 0
+        self.size_histogram: Dict[int, int] = {}
+        self._latencies = deque(maxlen=512)
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            # Batches serve many requests; each caller's own deadline bounds its wait instead
+            with request_deadline(None):
+                self._worker = loop.create_task(self._run())
+
+    async def submit(self, text: str, model: str, client: Any) -> List[float]:
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, model, client, future))
+        return await within_deadline(future)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests for different models or clients cannot share a call
+            groups: Dict[Any, list] = {}
+            for item in batch:
+                groups.setdefault((item[1], id(item[2])), []).append(item)
+
+            for group in groups.values():
+                task = loop.create_task(self._dispatch(group))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, group: list) -> None:
+        model, client = group[0][1], group[0][2]
+        texts = list(dict.fromkeys(item[0] for item in group))
+        started = time.perf_counter()
+
+        try:
+            # Embedding calls bypass the generation scheduler (see PooledAsyncClient)
+            if asyncio.iscoroutinefunction(client.embed):
+                response = await client.embed(model=model, input=texts)
+            else:
+                response = await asyncio.to_thread(client.embed, model=model, input=texts)
+            vectors = dict(zip(texts, response["embeddings"]))
+        except Exception as e:
+            self.failed_batches += 1
+            for _, _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(group)
+        self.size_histogram[len(texts)] = self.size_histogram.get(len(texts), 0) + 1
+        self._latencies.append(time.perf_counter() - started)
+
+        for text, _, _, future in group:
+            if not future.done():
+                future.set_result(list(vectors[text]))
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.size_histogram.items())),
+            "avg_latency_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p95_latency_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+
+class EmbeddingService:
+    """Single entry point for text embeddings, shared by every controller."""
+
+    def __init__(
+            self,
+            model: str = EMBEDDING_MODEL,
+            cache: Optional[EmbeddingCache] = None,
+            batcher: Optional[EmbeddingBatcher] = None
+    ):
+        self.model = model
+        self.cache = cache or EmbeddingCache()
+        self.batcher = batcher or EmbeddingBatcher()
+
+    async def embed(self, text: str, client: Any = None, model: Optional[str] = None) -> List[float]:
+        model = model or self.model
+        key = embedding_key(text, model)
+
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        if client is None:
+            client = get_async_client()
+
+        vector = await self.batcher.submit(text, model, client)
+        await self.cache.put(key, model, vector)
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        return {"model": self.model, **self.cache.stats(), "batching": self.batcher.stats()}
+
+
+embedding_service = EmbeddingService()
+
+
+async def get_embeddings(text: str, client: Any = None) -> List[float]:
+    return await embedding_service.embed(text, client)
@@ -0,0 +1,376 @@
+"""
+Local stand-in for the Ollama HTTP API, for benchmarks and load tests on
+machines without models. It serves /api/chat and /api/generate (streamed
+or not), /api/embed and /api/embeddings, /api/ps and /api/tags, for any
+model name:
+
+    python -m app.utils.fake_ollama --port 11435 --ttft-ms 300 --tokens-per-second 30
+    OLLAMA_HOST=http://127.0.0.1:11435 uvicorn app.main:app
+
+Replies are scripted: the first rule in --script whose regex matches the
+prompt (system prompt and messages included) supplies the text, and
+anything else gets filler text seeded by the prompt, so the same request
+always gets the same reply. Embeddings are a deterministic bag of hashed
+words, so texts sharing words are similar. Latency follows a
+time-to-first-token, a token rate and multiplicative jitter, and at most
+--concurrency generations run at once while the rest queue, as a model
+serialises requests in real Ollama. GET /fake/stats reports the load.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+load_dotenv()
+
+FAKE_OLLAMA_HOST = os.getenv("FAKE_OLLAMA_HOST", "127.0.0.1")
+# Next to real Ollama's 11434, so both can run
+FAKE_OLLAMA_PORT = int(os.getenv("FAKE_OLLAMA_PORT", "11435"))
+FAKE_OLLAMA_TTFT_MS = float(os.getenv("FAKE_OLLAMA_TTFT_MS", "150"))
+FAKE_OLLAMA_TOKENS_PER_SECOND = float(os.getenv("FAKE_OLLAMA_TOKENS_PER_SECOND", "40"))
+# Each delay is scaled by a uniform factor in [1 - jitter, 1 + jitter]
+FAKE_OLLAMA_JITTER = float(os.getenv("FAKE_OLLAMA_JITTER", "0.1"))
+# Generations running at once; 1 behaves like OLLAMA_NUM_PARALLEL=1
+FAKE_OLLAMA_CONCURRENCY = int(os.getenv("FAKE_OLLAMA_CONCURRENCY", "1"))
+# Paid once per model, on its first request
+FAKE_OLLAMA_LOAD_MS = float(os.getenv("FAKE_OLLAMA_LOAD_MS", "0"))
+FAKE_OLLAMA_EMBED_MS = float(os.getenv("FAKE_OLLAMA_EMBED_MS", "2"))
+FAKE_OLLAMA_EMBED_DIM = int(os.getenv("FAKE_OLLAMA_EMBED_DIM", "384"))
+# Filler reply length when no script rule matches and num_predict does not cap it
+FAKE_OLLAMA_DEFAULT_TOKENS = int(os.getenv("FAKE_OLLAMA_DEFAULT_TOKENS", "120"))
+FAKE_OLLAMA_SCRIPT = os.getenv("FAKE_OLLAMA_SCRIPT", "app/data/fake_ollama_script.json")
+FAKE_OLLAMA_SEED = int(os.getenv("FAKE_OLLAMA_SEED", "0"))
+
+_TOKEN = re.compile(r"\s*\S+")
+_WORD = re.compile(r"\w+")
+
+_FILLER = (
+    "the envoys met at dawn beside the river and spoke of grain of borders and of the families "
+    "who had left their homes while the elders listened and the soldiers waited for orders that "
+    "never came because both councils had agreed to talk one more day"
+).split()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _seed_of(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dim: int) -> np.ndarray:
+    return np.random.default_rng(_seed_of(word)).standard_normal(dim)
+
+
+def embed_text(text: str, dim: int = FAKE_OLLAMA_EMBED_DIM) -> List[float]:
+    """Unit-length sum of per-word hashed vectors; the same text always embeds the same."""
+    words = _WORD.findall(text.lower()) or [""]
+    vector = np.sum([_word_vector(word, dim) for word in words], axis=0)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    parts = [body.get("system") or "", body.get("prompt") or ""]
+    parts += [str(message.get("content") or "") for message in body.get("messages") or []]
+    return "\n".join(part for part in parts if part)
+
+
+class FakeOllama:
+    """Scripted, latency-shaped model server state shared by every request."""
+
+    def __init__(
+            self,
+            ttft_ms: float = FAKE_OLLAMA_TTFT_MS,
+            tokens_per_second: float = FAKE_OLLAMA_TOKENS_PER_SECOND,
+            jitter: float = FAKE_OLLAMA_JITTER,
+            concurrency: int = FAKE_OLLAMA_CONCURRENCY,
+            load_ms: float = FAKE_OLLAMA_LOAD_MS,
+            embed_ms: float = FAKE_OLLAMA_EMBED_MS,
+            embed_dim: int = FAKE_OLLAMA_EMBED_DIM,
+            default_tokens: int = FAKE_OLLAMA_DEFAULT_TOKENS,
+            script: Optional[str] = FAKE_OLLAMA_SCRIPT,
+            seed: int = FAKE_OLLAMA_SEED
+    ):
+        self.ttft = ttft_ms / 1000
+        self.token_interval = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.jitter = max(0.0, jitter)
+        self.concurrency = max(1, concurrency)
+        self.load = load_ms / 1000
+        self.embed_delay = embed_ms / 1000
+        self.embed_dim = embed_dim
+        self.default_tokens = default_tokens
+        self.seed = seed
+        self.rules: List[Tuple[re.Pattern, Optional[str], str]] = []
+        if script and os.path.exists(script):
+            with open(script, encoding="utf-8") as f:
+                self.rules = [(re.compile(rule["match"]), rule.get("model"), rule["response"]) for rule in json.load(f)]
+
+        self._rng = random.Random(seed)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.loaded: Dict[str, float] = {}
+
+        self.requests: Dict[str, int] = {}
+        self.running = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.tokens = 0
+
+    async def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            await asyncio.sleep(seconds * self._rng.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _slot(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    async def _ensure_loaded(self, model: str) -> int:
+        """Load `model` if this is its first request; the load time in nanoseconds."""
+        if model in self.loaded:
+            return 0
+        started = time.perf_counter()
+        await self._sleep(self.load)
+        self.loaded[model] = time.time()
+        return int((time.perf_counter() - started) * 1e9)
+
+    def reply(self, model: str, prompt: str, format: Any = None) -> str:
+        for pattern, rule_model, response in self.rules:
+            if (rule_model is None or rule_model == model) and pattern.search(prompt):
+                return response
+        if format:
+            return "{}"
+        rng = random.Random(_seed_of(f"{self.seed}\n{model}\n{prompt}"))
+        return " ".join(rng.choice(_FILLER) for _ in range(self.default_tokens)).capitalize() + "."
+
+    async def generate(self, body: Dict[str, Any], chat: bool) -> AsyncIterator[Dict[str, Any]]:
+        """Response parts of one chat or generate call, the last with `done` and timings."""
+        model = body.get("model") or ""
+        options = body.get("options") or {}
+        prompt = _prompt_text(body)
+
+        text = self.reply(model, prompt, body.get("format")) if (chat or prompt) else ""
+        done_reason = "stop" if (chat or prompt) else "load"
+        for stop in options.get("stop") or []:
+            if stop and stop in text:
+                text = text[:text.index(stop)]
+        tokens = _TOKEN.findall(text)
+        limit = options.get("num_predict")
+        if isinstance(limit, int) and 0 <= limit < len(tokens):
+            tokens = tokens[:limit]
+            done_reason = "length"
+
+        def part(content: str) -> Dict[str, Any]:
+            if chat:
+                return {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": content}, "done": False}
+            return {"model": model, "created_at": _now(), "response": content, "done": False}
+
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        waiting = True
+        finished = False
+        try:
+            async with self._slot():
+                self.queued -= 1
+                waiting = False
+                self.running += 1
+                try:
+                    started = time.perf_counter()
+                    load_duration = await self._ensure_loaded(model)
+                    prompt_started = time.perf_counter()
+                    if tokens:
+                        await self._sleep(self.ttft)
+                    prompt_duration = time.perf_counter() - prompt_started
+
+                    eval_started = time.perf_counter()
+                    for index, token in enumerate(tokens):
+                        if index:
+                            await self._sleep(self.token_interval)
+                        self.tokens += 1
+                        yield part(token)
+
+                    final = part("")
+                    final.update(
+                        done=True,
+                        done_reason=done_reason,
+                        total_duration=int((time.perf_counter() - started) * 1e9),
+                        load_duration=load_duration,
+                        prompt_eval_count=len(_TOKEN.findall(prompt)),
+                        prompt_eval_duration=int(prompt_duration * 1e9),
+                        eval_count=len(tokens),
+                        eval_duration=int((time.perf_counter() - eval_started) * 1e9)
+                    )
+                    finished = True
+                    self.completed += 1
+                    yield final
+                finally:
+                    self.running -= 1
+        finally:
+            if waiting:
+                self.queued -= 1
+            if not finished:
+                # The client went away while queued or mid-generation
+                self.cancelled += 1
+
+    async def embed(self, model: str, inputs: List[str]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        load_duration = await self._ensure_loaded(model)
+        await self._sleep(self.embed_delay * len(inputs))
+        return {
+            "model": model,
+            "embeddings": [embed_text(text, self.embed_dim) for text in inputs],
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "load_duration": load_duration,
+            "prompt_eval_count": sum(len(_TOKEN.findall(text)) for text in inputs)
+        }
+
+    def count(self, endpoint: str) -> None:
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "running": self.running,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "tokens_generated": self.tokens,
+            "loaded_models": sorted(self.loaded),
+            "concurrency": self.concurrency
+        }
+
+
+def create_app(fake: Optional[FakeOllama] = None) -> FastAPI:
+    fake = fake or FakeOllama()
+    app = FastAPI(title="Fake Ollama")
+    app.state.fake = fake
+
+    async def respond(body: Dict[str, Any], chat: bool):
+        parts = fake.generate(body, chat)
+        # Like Ollama, stream unless told not to
+        if body.get("stream", True):
+            async def lines():
+                async for part in parts:
+                    yield json.dumps(part) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        text = []
+        async for part in parts:
+            text.append(part["message"]["content"] if chat else part["response"])
+        if chat:
+            part["message"]["content"] = "".join(text)
+        else:
+            part["response"] = "".join(text)
+        return JSONResponse(part)
+
+    @app.get("/")
+    async def root():
+        return PlainTextResponse("Ollama is running")
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "0.0.0-fake"}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        fake.count("chat")
+        return await respond(await request.json(), chat=True)
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        fake.count("generate")
+        return await respond(await request.json(), chat=False)
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        fake.count("embed")
+        body = await request.json()
+        inputs = body.get("input") or ""
+        return await fake.embed(body.get("model") or "", [inputs] if isinstance(inputs, str) else list(inputs))
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        fake.count("embeddings")
+        body = await request.json()
+        result = await fake.embed(body.get("model") or "", [body.get("prompt") or ""])
+        return {"embedding": result["embeddings"][0]}
+
+    def _model_entries() -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": model, "model": model, "size": 0, "size_vram": 0,
+                "digest": hashlib.sha256(model.encode("utf-8")).hexdigest(),
+                "details": {"format": "fake", "family": "fake"},
+                "expires_at": "2318-01-01T00:00:00Z", "modified_at": datetime.fromtimestamp(loaded_at, timezone.utc).isoformat()
+            }
+            for model, loaded_at in fake.loaded.items()
+        ]
+
+    @app.get("/api/ps")
+    async def ps():
+        fake.count("ps")
+        return {"models": _model_entries()}
+
+    @app.get("/api/tags")
+    async def tags():
+        fake.count("tags")
+        return {"models": _model_entries()}
+
+    @app.get("/fake/stats")
+    async def stats():
+        return fake.stats()
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a scripted, latency-shaped stand-in for the Ollama API")
+    parser.add_argument("--host", default=FAKE_OLLAMA_HOST)
+    parser.add_argument("--port", type=int, default=FAKE_OLLAMA_PORT)
+    parser.add_argument("--ttft-ms", type=float, default=FAKE_OLLAMA_TTFT_MS, help="Time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=FAKE_OLLAMA_TOKENS_PER_SECOND)
+    parser.add_argument("--jitter", type=float, default=FAKE_OLLAMA_JITTER, help="Relative spread of every delay, e.g. 0.2")
+    parser.add_argument("--concurrency", type=int, default=FAKE_OLLAMA_CONCURRENCY, help="Generations served at once")
+    parser.add_argument("--load-ms", type=float, default=FAKE_OLLAMA_LOAD_MS, help="One-off load time per model")
+    parser.add_argument("--embed-ms", type=float, default=FAKE_OLLAMA_EMBED_MS, help="Time per embedded input")
+    parser.add_argument("--embed-dim", type=int, default=FAKE_OLLAMA_EMBED_DIM)
+    parser.add_argument("--default-tokens", type=int, default=FAKE_OLLAMA_DEFAULT_TOKENS)
+    parser.add_argument("--script", default=FAKE_OLLAMA_SCRIPT, help="JSON list of {match, response[, model]} rules")
+    parser.add_argument("--seed", type=int, default=FAKE_OLLAMA_SEED)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    fake = FakeOllama(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        jitter=args.jitter,
+        concurrency=args.concurrency,
+        load_ms=args.load_ms,
+        embed_ms=args.embed_ms,
+        embed_dim=args.embed_dim,
+        default_tokens=args.default_tokens,
+        script=args.script,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
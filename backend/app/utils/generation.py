@@ -0,0 +1,172 @@
+import os
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Union
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Call types; each maps to one generation profile
+SCORE = "score"
+RUBRIC = "rubric"
+ACTIONS = "actions"
+NARRATIVE = "narrative"
+DILEMMA = "dilemma"
+SUMMARY = "summary"
+
+# Roughly how many tokens a word of English prose takes
+TOKENS_PER_WORD = 1.4
+# Ollama reloads a model whenever num_ctx changes, so profiles sharing a model must share a window
+GENERATION_NUM_CTX = int(os.getenv("GENERATION_NUM_CTX", "4096"))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+class GenerationProfile:
+    """
+    Decoding settings for one call type: an output token cap
+    (`num_predict`), the context window to allocate (`num_ctx`), stop
+    sequences, sampling temperature and an optional structured-output
+    `format` ("json" or a JSON schema).
+    """
+
+    def __init__(
+            self,
+            num_predict: int,
+            num_ctx: int,
+            temperature: float,
+            stop: Sequence[str] = (),
+            top_p: Optional[float] = None,
+            format: Union[str, Dict[str, Any], None] = None
+    ):
+        self.num_predict = num_predict
+        self.num_ctx = num_ctx
+        self.temperature = temperature
+        self.stop = list(stop)
+        self.top_p = top_p
+        self.format = format
+
+    def options(self) -> Dict[str, Any]:
+        options = {"num_predict": self.num_predict, "num_ctx": self.num_ctx, "temperature": self.temperature}
+        if self.stop:
+            options["stop"] = list(self.stop)
+        if self.top_p is not None:
+            options["top_p"] = self.top_p
+        return options
+
+    def describe(self) -> Dict[str, Any]:
+        return {**self.options(), "format": self.format}
+
+
+# Caps are env-configurable per call type, e.g. GEN_NARRATIVE_NUM_PREDICT=768
+PROFILES = {
+    # Per-turn KALKI ratings: four small integers and a one-line note
+    SCORE: GenerationProfile(
+        num_predict=_env_int("GEN_SCORE_NUM_PREDICT", 96),
+        num_ctx=GENERATION_NUM_CTX,
+        temperature=0.2,
+        format="json"
+    ),
+    # Rubric write-ups: debate evaluations, KALKI feedback and results analysis
+    RUBRIC: GenerationProfile(
+        num_predict=_env_int("GEN_RUBRIC_NUM_PREDICT", 384),
+        num_ctx=GENERATION_NUM_CTX,
+        temperature=0.3
+    ),
+    # Four short action phrases, one per line
+    ACTIONS: GenerationProfile(
+        num_predict=_env_int("GEN_ACTIONS_NUM_PREDICT", 80),
+        num_ctx=GENERATION_NUM_CTX,
+        temperature=0.7
+    ),
+    # Story, role-play, conflict and debate replies
+    NARRATIVE: GenerationProfile(
+        # Defaults to the reply room the context manager reserves
+        num_predict=_env_int("GEN_NARRATIVE_NUM_PREDICT", _env_int("CONTEXT_REPLY_RESERVE", 512)),
+        num_ctx=GENERATION_NUM_CTX,
+        temperature=0.7,
+        top_p=0.9,
+        # Keep the model from writing the player's next turn
+        stop=("\nUser:", "\nuser:")
+    ),
+    DILEMMA: GenerationProfile(
+        num_predict=_env_int("GEN_DILEMMA_NUM_PREDICT", 256),
+        num_ctx=GENERATION_NUM_CTX,
+        temperature=0.8
+    ),
+    # Rolling conversation summaries (at most 150 words) and results summaries
+    SUMMARY: GenerationProfile(
+        num_predict=_env_int("GEN_SUMMARY_NUM_PREDICT", 256),
+        num_ctx=GENERATION_NUM_CTX,
+        temperature=0.2
+    ),
+}
+
+
+def words_to_tokens(words: int) -> int:
+    return int(words * TOKENS_PER_WORD) + 1
+
+
+class GenerationProfiles:
+    """
+    Routes model calls through a call-type profile and counts the tokens
+    each profile consumes. `options` passed by a caller override the
+    profile's for that call only, as does `format`. A reply cut off by the
+    token cap (`done_reason == "length"`) is counted as truncated, which
+    shows when a cap is too tight.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, GenerationProfile]] = None):
+        self.profiles = dict(profiles or PROFILES)
+        self._counts: Dict[str, Dict[str, int]] = {
+            name: {"calls": 0, "prompt_tokens": 0, "generated_tokens": 0, "truncated": 0}
+            for name in self.profiles
+        }
+
+    def prepare(self, profile: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Request kwargs for `profile` with the caller's options and format layered on top."""
+        settings = self.profiles[profile]
+        kwargs = dict(kwargs)
+        kwargs["options"] = {**settings.options(), **(kwargs.get("options") or {})}
+        if settings.format is not None:
+            kwargs.setdefault("format", settings.format)
+        return kwargs
+
+    def record(self, profile: str, response: Any) -> None:
+        counts = self._counts[profile]
+        counts["calls"] += 1
+        counts["prompt_tokens"] += getattr(response, "prompt_eval_count", None) or 0
+        counts["generated_tokens"] += getattr(response, "eval_count", None) or 0
+        if getattr(response, "done_reason", None) == "length":
+            counts["truncated"] += 1
+
+    async def chat(self, client: Any, profile: str, **kwargs) -> Any:
+        response = await client.chat(**self.prepare(profile, kwargs))
+        self.record(profile, response)
+        return response
+
+    async def generate(self, client: Any, profile: str, **kwargs) -> Any:
+        response = await client.generate(**self.prepare(profile, kwargs))
+        self.record(profile, response)
+        return response
+
+    async def stream_chat(self, client: Any, profile: str, **kwargs) -> AsyncIterator[Any]:
+        async for part in await client.chat(stream=True, **self.prepare(profile, kwargs)):
+            if getattr(part, "done", False):
+                self.record(profile, part)
+            yield part
+
+    def stats(self) -> Dict[str, Any]:
+        profiles = {}
+        for name, counts in self._counts.items():
+            calls = counts["calls"]
+            profiles[name] = {
+                **self.profiles[name].describe(),
+                **counts,
+                "mean_generated_tokens": counts["generated_tokens"] / calls if calls else 0.0
+            }
+        return {"profiles": profiles}
+
+
+generation_profiles = GenerationProfiles()
@@ -1,3 +1,200 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import httpx
 import ollama
+from dotenv import load_dotenv
+
+from app.utils.deadline import deadline_monitor, within_deadline
+from app.utils.scheduler import llm_scheduler
+
+load_dotenv()
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "64"))
+OLLAMA_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_KEEPALIVE_CONNECTIONS", "32"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "120"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "10"))
+# How long Ollama keeps a model loaded after a request; a negative number means indefinitely
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "-1")
+# Embedding calls in flight at once; they are short and skip the generation scheduler
+OLLAMA_EMBED_CONCURRENCY = int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "2"))
+
+EMBED_PATHS = ("/api/embed", "/api/embeddings")
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_keep_alive(value: Optional[str]) -> Union[float, str, None]:
+    """Ollama takes plain numbers as seconds and strings as durations such as "30m"."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class PooledAsyncClient(ollama.AsyncClient):
+    """
+    `ollama.AsyncClient` backed by a bounded keep-alive connection pool.
+    Tracks in-flight calls (including open streams) for the metrics endpoint,
+    applies a default `keep_alive` to every model request and passes each
+    final response to `response_hooks`. Generation calls wait for a slot
+    from the priority scheduler; streams hold theirs until they are closed.
+    Embedding calls are cheap and must not queue behind long generations,
+    so they take one of `embed_concurrency` slots of their own instead.
+
+    Calls are bounded by the current request deadline. A call cancelled
+    before it finishes (deadline, client disconnect, or a stream closed
+    early) closes its HTTP connection so Ollama stops generating, and the
+    model time it had used is recorded as wasted.
+    """
+
+    def __init__(
+            self,
+            host: Optional[str] = OLLAMA_HOST,
+            pool_size: int = OLLAMA_POOL_SIZE,
+            keepalive_connections: int = OLLAMA_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry: float = OLLAMA_KEEPALIVE_EXPIRY,
+            keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE,
+            embed_concurrency: int = OLLAMA_EMBED_CONCURRENCY
+    ):
+        self.pool_size = pool_size
+        self.keep_alive = _parse_keep_alive(keep_alive)
+        self.embed_concurrency = max(1, embed_concurrency)
+        self._embed_slots: Optional[asyncio.Semaphore] = None
+        self.response_hooks: List[Callable[[Any], None]] = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+
+        super().__init__(
+            host=host,
+            # Generations can run for minutes; only bound connection setup
+            timeout=httpx.Timeout(None, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=min(keepalive_connections, pool_size),
+                keepalive_expiry=keepalive_expiry
+            )
+        )
+
+    def _acquire(self) -> None:
+        self.in_flight += 1
+        self.total_requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    def _notify(self, response: Any) -> None:
+        for hook in self.response_hooks:
+            try:
+                hook(response)
+            except Exception as e:
+                logger.warning("Response hook failed: %s", str(e))
+
+    async def _request(self, cls, *args, stream: bool = False, **kwargs):
+        body = kwargs.get("json")
+        is_model_call = isinstance(body, dict) and "model" in body
+        if self.keep_alive is not None and is_model_call:
+            body.setdefault("keep_alive", self.keep_alive)
+
+        if stream:
+            parts = await super()._request(cls, *args, stream=True, **kwargs)
+            return self._tracked_stream(parts)
+
+        if not is_model_call:
+            return await super()._request(cls, *args, **kwargs)
+
+        response = await within_deadline(self._model_call(cls, *args, **kwargs))
+        self._notify(response)
+        return response
+
+    def _slot(self, path: Any):
+        if path in EMBED_PATHS:
+            if self._embed_slots is None:
+                self._embed_slots = asyncio.Semaphore(self.embed_concurrency)
+            return self._embed_slots
+        return llm_scheduler.slot()
+
+    async def _model_call(self, cls, *args, **kwargs):
+        async with self._slot(args[1] if len(args) > 1 else None):
+            self._acquire()
+            started = time.perf_counter()
+            try:
+                return await super()._request(cls, *args, **kwargs)
+            except asyncio.CancelledError:
+                deadline_monitor.record_waste(time.perf_counter() - started)
+                raise
+            finally:
+                self._release()
+
+    async def _tracked_stream(self, parts):
+        # The HTTP request is only sent once the stream is iterated
+        async with AsyncExitStack() as stack:
+            await within_deadline(stack.enter_async_context(llm_scheduler.slot()))
+            self._acquire()
+            started = time.perf_counter()
+            finished = False
+            try:
+                while True:
+                    try:
+                        part = await within_deadline(parts.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    if getattr(part, "done", False):
+                        finished = True
+                        self._notify(part)
+                    yield part
+            finally:
+                if not finished:
+                    deadline_monitor.record_waste(time.perf_counter() - started)
+                self._release()
+                await parts.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        pool = getattr(self._client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            "pool_size": self.pool_size,
+            "open_connections": len(connections),
+            "active_connections": len(connections) - idle,
+            "idle_connections": idle,
+            "utilisation": (len(connections) - idle) / self.pool_size if self.pool_size else 0.0,
+            "in_flight_requests": self.in_flight,
+            "peak_in_flight_requests": self.peak_in_flight,
+            "total_requests": self.total_requests,
+            "keep_alive": self.keep_alive,
+            "embed_concurrency": self.embed_concurrency
+        }
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_client: Optional[PooledAsyncClient] = None
+
+
+def get_async_client() -> PooledAsyncClient:
+    global _client
+    if _client is None:
+        _client = PooledAsyncClient()
+    return _client
+
+
 async def get_model_client():
-    return ollama
\ No newline at end of file
+    return get_async_client()
+
+
+async def close_model_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import re
+import string
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# default.json plus one <conflict_type>.json per ConflictType
+LEXICON_DIR = os.getenv("LEXICON_DIR", "app/data/lexicons")
+DEFAULT_LEXICON = "default"
+# Bounds the per-lexicon word memo; it is cleared when full
+LEXICON_WORD_MEMO_SIZE = int(os.getenv("LEXICON_WORD_MEMO_SIZE", "50000"))
+
+ESCALATION = "escalation"
+DEESCALATION = "deescalation"
+
+logger = logging.getLogger(__name__)
+
+_SEPARATOR = re.compile(r"[\s\-]+")
+# Everything that separates words becomes a space, so str.split() tokenises
+_PUNCTUATION = str.maketrans({char: " " for char in string.punctuation + "\u2014\u2013\u201c\u201d\u2018\u2019\u2026"})
+
+Entry = Tuple[str, str, float]
+_UNSEEN = object()
+
+
+def _normalise(term: str) -> str:
+    """Lowercase with every run of spaces or hyphens as one space: "Power-sharing" -> "power sharing"."""
+    return _SEPARATOR.sub(" ", term.lower()).strip()
+
+
+class LexiconScore:
+    __slots__ = ("escalation", "deescalation", "hits")
+
+    def __init__(self, escalation: float, deescalation: float, hits: Dict[str, int]):
+        self.escalation = escalation
+        self.deescalation = deescalation
+        # Occurrences of each matched term
+        self.hits = hits
+
+    @property
+    def net(self) -> float:
+        """Escalation minus de-escalation weight; positive raises tension."""
+        return self.escalation - self.deescalation
+
+
+class CompiledLexicon:
+    """
+    Weighted escalation and de-escalation terms compiled for a single
+    pass over a text: the text is lowercased and split into words once,
+    and each distinct word is resolved against the lexicon by hash lookup
+    (memoised, so a word is matched against the stems only the first time
+    it is seen). Cost grows with the text, not with the number of terms.
+    Matches are whole words: "force" does not match "reinforce", while
+    "force*" matches "forces". Multi-word terms are confirmed with a
+    word-boundary regex only when their first word occurs, and count in
+    addition to any single-word terms inside them. Each term adds its
+    weight once per text however often it occurs, so repeating a word
+    cannot run the score up.
+    """
+
+    def __init__(self, name: str, lexicons: Dict[str, Dict[str, float]], memo_size: int = LEXICON_WORD_MEMO_SIZE):
+        self.name = name
+        self.memo_size = memo_size
+        # (term, kind, weight) for every term with a non-zero weight
+        self.terms: List[Entry] = [
+            (term, kind, float(weight))
+            for kind in (ESCALATION, DEESCALATION)
+            for term, weight in lexicons.get(kind, {}).items()
+            if weight
+        ]
+        self._exact: Dict[str, Entry] = {}
+        self._stems: Dict[str, Entry] = {}
+        # First word -> (regex, entry) of the multi-word terms starting with it
+        self._phrases: Dict[str, List[Tuple[re.Pattern, Entry]]] = {}
+        for entry in self.terms:
+            term = entry[0]
+            wildcard = term.endswith("*")
+            words = _normalise(term.rstrip("*")).split(" ")
+            if len(words) > 1:
+                pattern = r"\b" + " +".join(re.escape(word) for word in words) + (r"\w*" if wildcard else r"\b")
+                self._phrases.setdefault(words[0], []).append((re.compile(pattern), entry))
+            elif wildcard:
+                self._stems[words[0]] = entry
+            else:
+                self._exact[words[0]] = entry
+        # Longest stem first, so "peacekeep*" wins over "peace*"
+        self._stem_lengths = sorted({len(stem) for stem in self._stems}, reverse=True)
+        self._memo: Dict[str, Optional[Entry]] = {}
+
+    def _resolve(self, word: str) -> Optional[Entry]:
+        entry = self._exact.get(word)
+        if entry is None:
+            for length in self._stem_lengths:
+                if length <= len(word):
+                    entry = self._stems.get(word[:length])
+                    if entry is not None:
+                        break
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[word] = entry
+        return entry
+
+    def _score_normalised(self, text: str) -> LexiconScore:
+        """Score of a text already lowercased and stripped of punctuation."""
+        words = text.split()
+        get, resolve = self._memo.get, self._resolve
+
+        found: List[Entry] = []
+        for word in words:
+            entry = get(word, _UNSEEN)
+            if entry is _UNSEEN:
+                entry = resolve(word)
+            if entry is not None:
+                found.append(entry)
+        if self._phrases:
+            for head in self._phrases.keys() & set(words):
+                for pattern, phrase in self._phrases[head]:
+                    found.extend([phrase] * len(pattern.findall(text)))
+
+        hits: Dict[str, int] = {}
+        escalation = deescalation = 0.0
+        for term, kind, weight in found:
+            if term in hits:
+                hits[term] += 1
+                continue
+            hits[term] = 1
+            if kind == ESCALATION:
+                escalation += weight
+            else:
+                deescalation += weight
+        return LexiconScore(escalation, deescalation, hits)
+
+    def score(self, text: str) -> LexiconScore:
+        return self._score_normalised(text.lower().translate(_PUNCTUATION))
+
+    def score_many(self, texts: Sequence[str]) -> List[LexiconScore]:
+        score, table = self._score_normalised, _PUNCTUATION
+        return [score(text.lower().translate(table)) for text in texts]
+
+
+class LexiconEngine:
+    """
+    Loads per-conflict lexicons from LEXICON_DIR. Every conflict starts
+    from default.json; its own file adds terms or overrides weights, and a
+    weight of 0 removes a default term. Each lexicon is compiled on first
+    use and kept; unknown or missing conflict types use the default.
+
+    Lexicon files look like:
+        {"escalation": {"troop*": 2, "ultimatum": 3},
+         "deescalation": {"ceasefire*": 3, "peace talks": 2}}
+    """
+
+    def __init__(self, directory: str = LEXICON_DIR):
+        self.directory = directory
+        self._compiled: Dict[str, CompiledLexicon] = {}
+
+    def _read(self, name: str) -> Dict[str, Dict[str, float]]:
+        path = os.path.join(self.directory, f"{name}.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def lexicon(self, conflict_type: Optional[str] = None) -> CompiledLexicon:
+        name = getattr(conflict_type, "value", conflict_type) or DEFAULT_LEXICON
+        compiled = self._compiled.get(name)
+        if compiled is None:
+            lexicons = {kind: dict(terms) for kind, terms in self._read(DEFAULT_LEXICON).items()}
+            if name != DEFAULT_LEXICON:
+                for kind, terms in self._read(name).items():
+                    lexicons.setdefault(kind, {}).update(terms)
+            compiled = CompiledLexicon(name, lexicons)
+            self._compiled[name] = compiled
+            logger.info("Compiled %s lexicon: %d terms", name, len(compiled.terms))
+        return compiled
+
+    def score(self, text: str, conflict_type: Optional[str] = None) -> LexiconScore:
+        return self.lexicon(conflict_type).score(text)
+
+    def score_many(self, texts: Sequence[str], conflict_type: Optional[str] = None) -> List[LexiconScore]:
+        return self.lexicon(conflict_type).score_many(texts)
+
+    def reload(self) -> None:
+        """Pick up edited lexicon files; each is recompiled on next use."""
+        self._compiled.clear()
+
+
+lexicon_engine = LexiconEngine()
@@ -0,0 +1,111 @@
+"""
+Micro-benchmark of tension keyword scoring: the keyword loop that
+calculate_tension_with_sentiment used to run against the compiled
+lexicon engine, per text and in batches:
+
+    python -m app.utils.lexicon_benchmark --texts 2000 --repeat 5
+    python -m app.utils.lexicon_benchmark --conflict rwanda
+    python -m app.utils.lexicon_benchmark --synthetic-terms 500
+"""
+import argparse
+import random
+import string
+import time
+from typing import Callable, Dict, List
+
+from app.utils.lexicon import DEESCALATION, ESCALATION, CompiledLexicon, LexiconEngine
+
+# The keyword loop as it was, for comparison
+_ESCALATION = [
+    "military", "troops", "violence", "attack", "protest", "riot",
+    "conflict", "dispute", "tension", "hostility", "threat", "weapon",
+    "ultimatum", "deadline", "sanction", "force", "demand"
+]
+_DEESCALATION = [
+    "peace", "agreement", "treaty", "compromise", "negotiate", "cooperate",
+    "collaborate", "understand", "reconcile", "dialogue", "diplomacy",
+    "ceasefire", "handshake", "concession", "mediate"
+]
+
+_WORDS = (
+    "the delegation said that both sides would meet again after the harvest and that the council "
+    "had asked for calm while the villages near the river waited for news from the capital"
+).split()
+
+
+def legacy_score(text: str, escalation: List[str] = _ESCALATION, deescalation: List[str] = _DEESCALATION) -> int:
+    change = 0
+    for word in escalation:
+        if word in text.lower():
+            change += 2
+    for word in deescalation:
+        if word in text.lower():
+            change -= 2
+    return change
+
+
+def _synthetic_lexicon(terms: int) -> Dict[str, Dict[str, float]]:
+    """A lexicon of `terms` made-up words, half of them wildcard stems."""
+    rng = random.Random(terms)
+    words = {"".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10))) for _ in range(terms)}
+    lexicons: Dict[str, Dict[str, float]] = {ESCALATION: {}, DEESCALATION: {}}
+    for i, word in enumerate(sorted(words)):
+        lexicons[ESCALATION if i % 2 else DEESCALATION][word + ("*" if i % 4 < 2 else "")] = 2
+    return lexicons
+
+
+def sample_texts(count: int, words: int = 120, seed: int = 7) -> List[str]:
+    """Reply-sized texts of filler words with a few lexicon terms mixed in."""
+    rng = random.Random(seed)
+    terms = _ESCALATION + _DEESCALATION + ["reinforce", "misunderstanding", "peacekeeping"]
+    return [
+        " ".join(rng.choice(terms) if rng.random() < 0.05 else rng.choice(_WORDS) for _ in range(words))
+        for _ in range(count)
+    ]
+
+
+def _best_of(repeat: int, run: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare keyword-loop and compiled-lexicon tension scoring")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=120, help="Words per text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--conflict", default=None, help="Conflict type lexicon to use (default lexicon if unset)")
+    parser.add_argument("--synthetic-terms", type=int, default=0, help="Use a made-up lexicon of this many terms instead")
+    args = parser.parse_args()
+
+    texts = sample_texts(args.texts, args.words)
+    if args.synthetic_terms:
+        lexicon = CompiledLexicon("synthetic", _synthetic_lexicon(args.synthetic_terms))
+    else:
+        lexicon = LexiconEngine().lexicon(args.conflict)
+    # The old loop over this lexicon's terms, wildcards dropped, to show how each approach scales with terms
+    escalation = [term.rstrip("*") for term, kind, _ in lexicon.terms if kind == ESCALATION]
+    deescalation = [term.rstrip("*") for term, kind, _ in lexicon.terms if kind == DEESCALATION]
+
+    legacy = _best_of(args.repeat, lambda: [legacy_score(text) for text in texts])
+    rows = [
+        (f"keyword loop ({len(_ESCALATION) + len(_DEESCALATION)})", legacy),
+        (f"keyword loop ({len(lexicon.terms)})", _best_of(
+            args.repeat, lambda: [legacy_score(text, escalation, deescalation) for text in texts]
+        )),
+        ("lexicon.score", _best_of(args.repeat, lambda: [lexicon.score(text) for text in texts])),
+        ("lexicon.score_many", _best_of(args.repeat, lambda: lexicon.score_many(texts))),
+    ]
+
+    print(f"{args.texts} texts of {args.words} words, {len(lexicon.terms)} terms ({lexicon.name}), best of {args.repeat}")
+    print(f"  {'':<22} {'us/text':>8}  vs original loop")
+    for name, seconds in rows:
+        print(f"  {name:<22} {1e6 * seconds / args.texts:8.1f}  {legacy / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
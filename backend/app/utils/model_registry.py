@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.generation import GENERATION_NUM_CTX
+
+load_dotenv()
+
+# Logical model roles used by the controllers
+NARRATOR = "narrator"
+STORYTELLER = "storyteller"
+ACTION_SUGGESTER = "action-suggester"
+EVALUATOR = "evaluator"
+SCORER = "scorer"
+SUMMARISER = "summariser"
+EMBEDDER = "embedder"
+
+# Pointing several roles at the same tag keeps fewer models resident and avoids swaps
+MODEL_ROLES = {
+    NARRATOR: os.getenv("NARRATOR_MODEL", "llama3.2:latest"),
+    STORYTELLER: os.getenv("STORYTELLER_MODEL", "llama3.2:3b"),
+    ACTION_SUGGESTER: os.getenv("ACTION_SUGGESTER_MODEL", "llama3.2:latest"),
+    EVALUATOR: os.getenv("EVALUATOR_MODEL", "llama3.2:latest"),
+    SCORER: os.getenv("SCORER_MODEL", "llama3:latest"),
+    SUMMARISER: os.getenv("CONTEXT_SUMMARY_MODEL", "llama3.2:latest"),
+    EMBEDDER: os.getenv("EMBEDDING_MODEL", "all-minilm:33m"),
+}
+
+# Seconds between checks of which models Ollama has resident
+MODEL_MONITOR_INTERVAL = float(os.getenv("MODEL_MONITOR_INTERVAL", "30"))
+MODEL_WARMUP_RETRY = float(os.getenv("MODEL_WARMUP_RETRY", "10"))
+# A request whose load_duration exceeds this (seconds) after warm-up counts as a reload
+MODEL_RELOAD_THRESHOLD = float(os.getenv("MODEL_RELOAD_THRESHOLD", "1.0"))
+
+logger = logging.getLogger(__name__)
+
+
+def model_for(role: str) -> str:
+    return MODEL_ROLES[role]
+
+
+class ModelRegistry:
+    """
+    Warms every configured model at startup and watches for swaps.
+
+    Each distinct tag gets one warm-up request (an empty generate, or a tiny
+    embed for the embedder), which also applies the client's `keep_alive`.
+    Afterwards the registry polls Ollama's running-model list and inspects
+    the `load_duration` of responses, recording an event whenever a model
+    is evicted or has to be loaded again.
+    """
+
+    def __init__(
+            self,
+            roles: Optional[Dict[str, str]] = None,
+            monitor_interval: float = MODEL_MONITOR_INTERVAL,
+            warmup_retry: float = MODEL_WARMUP_RETRY,
+            reload_threshold: float = MODEL_RELOAD_THRESHOLD
+    ):
+        self.roles = dict(roles or MODEL_ROLES)
+        self.monitor_interval = monitor_interval
+        self.warmup_retry = warmup_retry
+        self.reload_threshold = reload_threshold
+        self._task: Optional[asyncio.Task] = None
+
+        self.models: Dict[str, Dict[str, Any]] = {
+            model: {"warm": False, "resident": None, "warmup_seconds": None, "reloads": 0, "evictions": 0, "error": None}
+            for model in self.roles.values()
+        }
+        self.events = deque(maxlen=100)
+
+    @property
+    def ready(self) -> bool:
+        return all(state["warm"] for state in self.models.values())
+
+    def _record(self, model: str, event: str, **details) -> None:
+        self.events.append({"model": model, "event": event, "at": time.time(), **details})
+        logger.info("Model %s: %s %s", model, event, details or "")
+
+    async def warm_up(self, client: Any) -> bool:
+        """Load every model that is not warm yet; returns whether all of them are."""
+        embedders = {self.roles[EMBEDDER]} if EMBEDDER in self.roles else set()
+        for model, state in self.models.items():
+            if state["warm"]:
+                continue
+            started = time.perf_counter()
+            try:
+                if model in embedders:
+                    await client.embed(model=model, input="warm-up")
+                else:
+                    # Same window as real calls, or the first of them would reload the model
+                    await client.generate(model=model, prompt="", options={"num_ctx": GENERATION_NUM_CTX})
+            except Exception as e:
+                state["error"] = str(e)
+                logger.warning("Could not warm up %s: %s", model, str(e))
+                continue
+            state.update(warm=True, resident=True, error=None, warmup_seconds=round(time.perf_counter() - started, 3))
+            self._record(model, "warmed", seconds=state["warmup_seconds"])
+        return self.ready
+
+    def observe(self, response: Any) -> None:
+        """Response hook for the Ollama client: count loads that happen after warm-up."""
+        model = getattr(response, "model", None)
+        load_duration = getattr(response, "load_duration", None)
+        state = self.models.get(model)
+        if state is None or not state["warm"] or not load_duration:
+            return
+        seconds = load_duration / 1e9
+        if seconds >= self.reload_threshold:
+            state["reloads"] += 1
+            state["resident"] = True
+            self._record(model, "reloaded", seconds=round(seconds, 3))
+
+    async def check_resident(self, client: Any) -> None:
+        running = await client.ps()
+        resident = {model.model for model in running.models}
+        for model, state in self.models.items():
+            if not state["warm"]:
+                continue
+            is_resident = model in resident
+            if state["resident"] and not is_resident:
+                state["evictions"] += 1
+                self._record(model, "evicted")
+            state["resident"] = is_resident
+
+    async def _run(self, client: Any) -> None:
+        while not await self.warm_up(client):
+            await asyncio.sleep(self.warmup_retry)
+        logger.info("All models warm: %s", ", ".join(self.models))
+
+        if self.monitor_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.monitor_interval)
+            try:
+                await self.check_resident(client)
+            except Exception as e:
+                logger.warning("Could not list running models: %s", str(e))
+
+    def start(self, client: Any) -> None:
+        if self.observe not in client.response_hooks:
+            client.response_hooks.append(self.observe)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(client))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "roles": self.roles,
+            "models": self.models,
+            "events": list(self.events)
+        }
+
+
+model_registry = ModelRegistry()
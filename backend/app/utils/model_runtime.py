@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.utils.cpu_pool import CpuPool, cpu_pool
+from app.utils.deadline import request_deadline
+from app.utils.sentiment import Predictor, SentimentEngine, sentiment_engine
+
+load_dotenv()
+
+TFIDF_PATH = os.getenv("TFIDF_VECTORIZER_PATH", "app/models/tfidf_vectorizer.joblib")
+SENTIMENT_MODEL_PATH = os.getenv("SENTIMENT_MODEL_PATH", "app/models/sentiment_model.h5")
+# Exported by app.utils.sentiment_export; preferred over the Keras model when present
+SENTIMENT_WEIGHTS_PATH = os.getenv("SENTIMENT_WEIGHTS_PATH", "app/models/sentiment_weights.npz")
+# "background": load right after startup; "lazy": load on the first sentiment request; "off": never
+SENTIMENT_LOAD = os.getenv("SENTIMENT_LOAD", "background").lower()
+
+# Runtime states
+IDLE = "idle"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+# Preload name of the worker loader below, as listed in CPU_POOL_PRELOAD
+SENTIMENT_WORKER_PRELOAD = "app.utils.model_runtime:init_sentiment_worker"
+
+logger = logging.getLogger(__name__)
+
+# Set in CPU pool worker processes only
+_worker_predictor: Optional[Predictor] = None
+
+
+def load_sentiment_predictor(
+        vectorizer_path: str = TFIDF_PATH,
+        weights_path: str = SENTIMENT_WEIGHTS_PATH,
+        model_path: str = SENTIMENT_MODEL_PATH
+) -> Tuple[Predictor, str]:
+    """
+    The sentiment predictor and the backend serving it ("numpy" or
+    "keras"). Blocking, and the only place joblib and TensorFlow are
+    imported, so call it off the event loop.
+    """
+    import joblib
+    from app.utils.sentiment import NumpySentimentModel, keras_predictor, numpy_predictor
+
+    vectorizer = joblib.load(vectorizer_path)
+    if os.path.exists(weights_path):
+        return numpy_predictor(vectorizer, NumpySentimentModel.load(weights_path)), "numpy"
+
+    import tensorflow as tf
+
+    return keras_predictor(vectorizer, tf.keras.models.load_model(model_path)), "keras"
+
+
+def init_sentiment_worker() -> Optional[str]:
+    """CPU pool preload: load the predictor once per worker and return its backend."""
+    global _worker_predictor
+    if SENTIMENT_LOAD == "off":
+        return None
+    _worker_predictor, backend = load_sentiment_predictor()
+    return backend
+
+
+def predict_sentiment(texts: List[str]) -> List[float]:
+    """Sentiment scores computed in a CPU pool worker."""
+    if _worker_predictor is None:
+        raise RuntimeError("Sentiment model is not loaded in this worker")
+    return _worker_predictor(texts)
+
+
+class SentimentRuntime:
+    """
+    Loads the sentiment model into the shared engine without holding up
+    startup: either in a background thread as soon as the app starts, or
+    on the first request that needs a score. With the CPU pool enabled
+    the model is loaded by every pool worker instead, and predictions run
+    there. Requests served before the model is ready score 0.0. A failed
+    load is reported, not retried.
+    """
+
+    def __init__(self, engine: SentimentEngine = sentiment_engine, mode: str = SENTIMENT_LOAD, pool: CpuPool = cpu_pool):
+        self.engine = engine
+        self.mode = mode
+        self.pool = pool
+        self.workers = 0
+        self.state = DISABLED if mode == "off" else IDLE
+        self.backend: Optional[str] = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    async def _load_in_pool(self) -> Tuple[Predictor, str]:
+        reports = await self.pool.warm()
+        for report in reports:
+            loaded = report["preloaded"].get(SENTIMENT_WORKER_PRELOAD, {})
+            if "error" in loaded:
+                raise RuntimeError(f"CPU pool worker {report['pid']}: {loaded['error']}")
+        self.workers = len(self.pool.worker_pids)
+
+        async def predict(texts: List[str]) -> List[float]:
+            return await self.pool.submit(predict_sentiment, texts)
+
+        return predict, reports[0]["preloaded"][SENTIMENT_WORKER_PRELOAD]["result"]
+
+    async def _load(self) -> None:
+        self.state = LOADING
+        started = time.perf_counter()
+        try:
+            if self.pool.enabled and SENTIMENT_WORKER_PRELOAD in self.pool.preload:
+                predict, self.backend = await self._load_in_pool()
+            else:
+                predict, self.backend = await asyncio.to_thread(load_sentiment_predictor)
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+            logger.exception("Could not load the sentiment model: %s", str(e))
+            return
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        self.loaded_at = time.time()
+        self.engine.set_predictor(predict)
+        self.state = READY
+        logger.info(
+            "Sentiment model (%s) loaded in %.2fs%s", self.backend, self.load_seconds,
+            f" by {self.workers} CPU pool workers" if self.workers else ""
+        )
+
+    def load(self) -> None:
+        """Start loading in the background unless it has already started; never waits."""
+        if self.state != IDLE or (self._task is not None and not self._task.done()):
+            return
+        # Started from whichever request asked first, but must outlive it
+        with request_deadline(None):
+            self._task = asyncio.get_running_loop().create_task(self._load())
+
+    def start(self) -> None:
+        if self.mode == "background":
+            self.load()
+        elif self.mode == "lazy":
+            self.engine.set_loader(self.load)
+
+    async def stop(self) -> None:
+        self.engine.set_loader(None)
+        if self._task is not None:
+            # A load already in its thread runs to the end; only the wait is cancelled
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.state == LOADING:
+                self.state = IDLE
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "state": self.state,
+            "backend": self.backend,
+            "pool_workers": self.workers,
+            "load_seconds": self.load_seconds,
+            "loaded_at": self.loaded_at,
+            "error": self.error
+        }
+
+
+sentiment_runtime = SentimentRuntime()
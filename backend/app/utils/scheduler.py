@@ -0,0 +1,212 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+ASSIST = "assist"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, ASSIST, BACKGROUND)
+
+# Total model calls in flight; match OLLAMA_NUM_PARALLEL on the server
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_CLASS_LIMITS = {
+    INTERACTIVE: int(os.getenv("LLM_INTERACTIVE_CONCURRENCY", str(LLM_MAX_CONCURRENCY))),
+    ASSIST: int(os.getenv("LLM_ASSIST_CONCURRENCY", "2")),
+    BACKGROUND: int(os.getenv("LLM_BACKGROUND_CONCURRENCY", "1")),
+}
+# When enabled, queued background calls fail with LLMPreempted while interactive calls are waiting
+LLM_PREEMPT_BACKGROUND = os.getenv("LLM_PREEMPT_BACKGROUND", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_session", default=None)
+
+
+def bind_llm_session(session: Optional[str]) -> None:
+    """
+    Queue the rest of the current request's model calls under `session`.
+    The value lives in the request's context, so it also reaches the task
+    that streams the response body.
+    """
+    _session.set(session)
+
+
+class LLMPreempted(RuntimeError):
+    """Raised to a queued background call that was dropped in favour of interactive work."""
+
+
+@contextmanager
+def llm_priority(priority: str, session: Optional[str] = None):
+    """
+    Run the model calls made inside this block at `priority`, queued under
+    `session` for fairness. A session of None keeps the enclosing one.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority class: {priority}")
+    priority_token = _priority.set(priority)
+    session_token = _session.set(session) if session is not None else None
+    try:
+        yield
+    finally:
+        _priority.reset(priority_token)
+        if session_token is not None:
+            _session.reset(session_token)
+
+
+class _Ticket:
+    __slots__ = ("future", "priority", "session", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, priority: str, session: str):
+        self.future = future
+        self.priority = priority
+        self.session = session
+        self.enqueued_at = time.perf_counter()
+
+
+class LLMScheduler:
+    """
+    Admission control for Ollama calls. Every call takes a slot from a
+    global pool and from its priority class; free slots always go to the
+    highest class with waiting work. Within a class, sessions are served
+    round-robin so one long session cannot starve the others.
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = LLM_MAX_CONCURRENCY,
+            class_limits: Optional[Dict[str, int]] = None,
+            preempt_background: bool = LLM_PREEMPT_BACKGROUND
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.class_limits = dict(class_limits or LLM_CLASS_LIMITS)
+        self.preempt_background = preempt_background
+
+        # priority -> session -> waiting tickets; dict order is the round-robin order
+        self._waiting: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._running: Dict[str, int] = {p: 0 for p in PRIORITIES}
+
+        self.admitted: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self.preempted = 0
+        self.peak_depth: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self._waits: Dict[str, Deque[float]] = {p: deque(maxlen=512) for p in PRIORITIES}
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def depth(self, priority: str) -> int:
+        return sum(len(tickets) for tickets in self._waiting[priority].values())
+
+    def _has_capacity(self, priority: str) -> bool:
+        return self.running < self.max_concurrency and self._running[priority] < self.class_limits[priority]
+
+    def _higher_waiting(self, priority: str) -> bool:
+        for other in PRIORITIES:
+            if other == priority:
+                return False
+            if self._waiting[other] and self._has_capacity(other):
+                return True
+        return False
+
+    def _admit(self, ticket: _Ticket) -> None:
+        self._running[ticket.priority] += 1
+        self.admitted[ticket.priority] += 1
+        self._waits[ticket.priority].append(time.perf_counter() - ticket.enqueued_at)
+
+    def _dispatch(self) -> None:
+        for priority in PRIORITIES:
+            queues = self._waiting[priority]
+            while queues and self._has_capacity(priority):
+                session, tickets = next(iter(queues.items()))
+                ticket = tickets.popleft()
+                # Move the session to the back so the next slot goes to another one
+                del queues[session]
+                if tickets:
+                    queues[session] = tickets
+                if ticket.future.done():
+                    continue
+                self._admit(ticket)
+                ticket.future.set_result(None)
+
+    def _remove(self, ticket: _Ticket) -> None:
+        tickets = self._waiting[ticket.priority].get(ticket.session)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._waiting[ticket.priority][ticket.session]
+
+    def _preempt_background(self) -> None:
+        for tickets in self._waiting[BACKGROUND].values():
+            for ticket in tickets:
+                if not ticket.future.done():
+                    ticket.future.set_exception(LLMPreempted("Background model call preempted by interactive work"))
+                    self.preempted += 1
+        self._waiting[BACKGROUND].clear()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None, session: Optional[str] = None):
+        priority = priority or _priority.get()
+        session = session or _session.get() or ""
+        ticket = _Ticket(asyncio.get_running_loop().create_future(), priority, session)
+
+        if not self._waiting[priority] and not self._higher_waiting(priority) and self._has_capacity(priority):
+            self._admit(ticket)
+        else:
+            self._waiting[priority].setdefault(session, deque()).append(ticket)
+            self.peak_depth[priority] = max(self.peak_depth[priority], self.depth(priority))
+            if priority == INTERACTIVE and self.preempt_background and self._waiting[BACKGROUND]:
+                self._preempt_background()
+            try:
+                await ticket.future
+            except asyncio.CancelledError:
+                if ticket.future.done() and not ticket.future.cancelled() and ticket.future.exception() is None:
+                    # The slot was granted just as the caller gave up
+                    self._release(priority)
+                else:
+                    self._remove(ticket)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def _release(self, priority: str) -> None:
+        self._running[priority] -= 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority in PRIORITIES:
+            waits = sorted(self._waits[priority])
+            classes[priority] = {
+                "running": self._running[priority],
+                "limit": self.class_limits[priority],
+                "queued": self.depth(priority),
+                "queued_sessions": len(self._waiting[priority]),
+                "peak_queued": self.peak_depth[priority],
+                "admitted": self.admitted[priority],
+                "wait_p50_ms": waits[len(waits) // 2] * 1000 if waits else 0.0,
+                "wait_p95_ms": waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "preempt_background": self.preempt_background,
+            "preempted": self.preempted,
+            "classes": classes
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.utils.deadline import request_deadline, within_deadline
+
+load_dotenv()
+
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "4096"))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "64"))
+SENTIMENT_BATCH_WAIT_MS = float(os.getenv("SENTIMENT_BATCH_WAIT_MS", "2"))
+
+logger = logging.getLogger(__name__)
+
+# Scores a batch of texts, each from -1 (very negative) to 1 (very positive); may be a coroutine function
+Predictor = Callable[[List[str]], Any]
+
+
+def sentiment_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# Keras activation names supported by the NumPy runtime
+ACTIVATIONS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+    "softmax": _softmax,
+}
+
+
+class NumpySentimentModel:
+    """
+    Inference-only copy of the Keras sentiment network, exported to .npz
+    by app.utils.sentiment_export. The sparse TF-IDF matrix is multiplied
+    straight into the first layer, so no vocabulary-sized dense array is
+    built, and the remaining dense layers run in float32 NumPy.
+    """
+
+    def __init__(self, layers: List[tuple]):
+        # (kernel, bias, activation name) per dense layer, input to output
+        self.layers = [
+            (kernel.astype(np.float32), bias.astype(np.float32), ACTIVATIONS[activation])
+            for kernel, bias, activation in layers
+        ]
+
+    @classmethod
+    def load(cls, path: str) -> "NumpySentimentModel":
+        with np.load(path, allow_pickle=False) as weights:
+            activations = [str(name) for name in weights["activations"]]
+            return cls([
+                (weights[f"kernel_{i}"], weights[f"bias_{i}"], activation)
+                for i, activation in enumerate(activations)
+            ])
+
+    def predict(self, features: Any) -> np.ndarray:
+        """Outputs for a (texts x vocabulary) matrix, sparse or dense."""
+        kernel, bias, activation = self.layers[0]
+        # sparse @ dense stays sparse-aware and returns a dense (texts x units) array
+        x = activation(np.asarray(features.astype(np.float32) @ kernel) + bias)
+        for kernel, bias, activation in self.layers[1:]:
+            x = activation(x @ kernel + bias)
+        return x
+
+
+def numpy_predictor(vectorizer: Any, model: NumpySentimentModel) -> Predictor:
+    """Predictor for the TF-IDF vectorizer and the exported network; needs no TensorFlow."""
+    def predict(texts: List[str]) -> List[float]:
+        prediction = model.predict(vectorizer.transform(texts))
+        return [float(row[0]) * 2 - 1 for row in prediction]
+    return predict
+
+
+def keras_predictor(vectorizer: Any, model: Any) -> Predictor:
+    """Predictor for the TF-IDF vectorizer and Keras model trained for conflict mode."""
+    def predict(texts: List[str]) -> List[float]:
+        prediction = model.predict(vectorizer.transform(texts).toarray(), verbose=0)
+        # The model outputs 0 to 1
+        return [float(row[0]) * 2 - 1 for row in prediction]
+    return predict
+
+
+class SentimentEngine:
+    """
+    Shared sentiment scorer. Scores are memoised by content hash, and
+    texts not seen before are queued so that concurrent requests from
+    every session go through a single `predict` call per batch, off the
+    event loop. Until a predictor is installed every text scores 0.0, and
+    the first such call triggers the on-demand loader, if one is set.
+    """
+
+    def __init__(
+            self,
+            cache_size: int = SENTIMENT_CACHE_SIZE,
+            max_batch_size: int = SENTIMENT_BATCH_SIZE,
+            max_wait_ms: float = SENTIMENT_BATCH_WAIT_MS
+    ):
+        self.cache_size = cache_size
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._predict: Optional[Predictor] = None
+        self._loader: Optional[Callable[[], None]] = None
+        self._memo: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.predicted = 0
+        self.failed_batches = 0
+        self._latencies = deque(maxlen=512)
+
+    @property
+    def ready(self) -> bool:
+        return self._predict is not None
+
+    def set_predictor(self, predict: Optional[Predictor]) -> None:
+        self._predict = predict
+        with self._lock:
+            self._memo.clear()
+
+    def set_loader(self, loader: Optional[Callable[[], None]]) -> None:
+        """Called, without waiting, whenever a score is asked for before a predictor is installed."""
+        self._loader = loader
+
+    def _remember(self, key: str, score: float) -> None:
+        with self._lock:
+            self._memo[key] = score
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.cache_size:
+                self._memo.popitem(last=False)
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._pending = {}
+            # Batches serve many requests; each caller's own deadline bounds its wait instead
+            with request_deadline(None):
+                self._worker = loop.create_task(self._run())
+
+    async def score(self, texts: List[str]) -> List[float]:
+        """Scores for `texts`, in order; a failed prediction scores 0.0."""
+        if self._predict is None:
+            if self._loader is not None:
+                self._loader()
+            return [0.0] * len(texts)
+
+        keys = [sentiment_key(text) for text in texts]
+        scores: Dict[str, float] = {}
+        waiting: Dict[str, Optional[asyncio.Future]] = {}
+        with self._lock:
+            for key in keys:
+                if key in scores or key in waiting:
+                    continue
+                score = self._memo.get(key)
+                if score is not None:
+                    self._memo.move_to_end(key)
+                    scores[key] = score
+                    self.hits += 1
+                else:
+                    waiting[key] = None
+                    self.misses += 1
+
+        if waiting:
+            self._ensure_worker()
+            loop = asyncio.get_running_loop()
+            for key, text in zip(keys, texts):
+                if key not in waiting or waiting[key] is not None:
+                    continue
+                # The same text already queued by another request shares its future
+                future = self._pending.get(key)
+                if future is None:
+                    future = loop.create_future()
+                    self._pending[key] = future
+                    self._queue.put_nowait((key, text, future))
+                waiting[key] = future
+            # Shielded: the futures are shared, so one caller giving up must not cancel them for others
+            results = await within_deadline(
+                asyncio.gather(*(asyncio.shield(future) for future in waiting.values()), return_exceptions=True)
+            )
+            for key, result in zip(waiting, results):
+                if isinstance(result, BaseException):
+                    logger.warning("Sentiment prediction failed: %s", str(result))
+                    result = 0.0
+                scores[key] = result
+
+        return [scores[key] for key in keys]
+
+    async def score_one(self, text: str) -> float:
+        return (await self.score([text]))[0]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch: list) -> None:
+        started = time.perf_counter()
+        try:
+            # One predict call for every text queued in this window, whichever session sent it
+            texts = [text for _, text, _ in batch]
+            if asyncio.iscoroutinefunction(self._predict):
+                # Already off the event loop, e.g. in the CPU pool
+                scores = await self._predict(texts)
+            else:
+                scores = await asyncio.to_thread(self._predict, texts)
+        except Exception as e:
+            self.failed_batches += 1
+            for key, _, future in batch:
+                self._pending.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.predicted += len(batch)
+        self._latencies.append(time.perf_counter() - started)
+        for (key, _, future), score in zip(batch, scores):
+            self._remember(key, score)
+            self._pending.pop(key, None)
+            if not future.done():
+                future.set_result(score)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        latencies = sorted(self._latencies)
+        with self._lock:
+            entries = len(self._memo)
+        return {
+            "ready": self.ready,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memo_entries": entries,
+            "memo_capacity": self.cache_size,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": self.predicted / self.batches if self.batches else 0.0,
+            "avg_predict_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p95_predict_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0
+        }
+
+
+sentiment_engine = SentimentEngine()
@@ -0,0 +1,110 @@
+"""
+Export the Keras sentiment model to the .npz format read by
+NumpySentimentModel, so serving never needs TensorFlow:
+
+    python -m app.utils.sentiment_export \
+        --model app/models/sentiment_model.h5 \
+        --out app/models/sentiment_weights.npz \
+        --vectorizer app/models/tfidf_vectorizer.joblib
+
+With --vectorizer, the export is checked against Keras on sample texts
+and fails if any score differs by more than --tolerance.
+"""
+import argparse
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.utils.sentiment import ACTIVATIONS, NumpySentimentModel
+
+load_dotenv()
+
+SENTIMENT_MODEL_PATH = os.getenv("SENTIMENT_MODEL_PATH", "app/models/sentiment_model.h5")
+SENTIMENT_WEIGHTS_PATH = os.getenv("SENTIMENT_WEIGHTS_PATH", "app/models/sentiment_weights.npz")
+
+# Layers with no effect at inference time
+PASSTHROUGH_LAYERS = {"InputLayer", "Dropout", "Flatten", "GaussianNoise", "GaussianDropout", "ActivityRegularization"}
+
+SAMPLE_TEXTS = [
+    "We propose a ceasefire and talks mediated by a neutral party.",
+    "Mobilise the troops and issue an ultimatum at dawn.",
+    "I understand your fears, and I want a fair agreement for both communities.",
+    "This is a betrayal and we will not forget it.",
+    "",
+]
+
+
+def extract_layers(model: Any) -> Dict[str, np.ndarray]:
+    """Dense weights and activations of a Sequential Keras model as named arrays."""
+    arrays: Dict[str, np.ndarray] = {}
+    activations: List[str] = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in PASSTHROUGH_LAYERS:
+            continue
+        if kind == "Activation":
+            if not activations:
+                raise ValueError("Activation layer before any Dense layer")
+            if activations[-1] != "linear":
+                raise ValueError("Two activations in a row cannot be exported")
+            activations[-1] = layer.activation.__name__
+            continue
+        if kind != "Dense":
+            raise ValueError(f"Unsupported layer for NumPy export: {kind} ({layer.name})")
+
+        weights = layer.get_weights()
+        kernel = weights[0]
+        bias = weights[1] if len(weights) > 1 else np.zeros(kernel.shape[1], dtype=np.float32)
+        activation = layer.activation.__name__
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation for NumPy export: {activation} ({layer.name})")
+
+        index = len(activations)
+        arrays[f"kernel_{index}"] = kernel.astype(np.float32)
+        arrays[f"bias_{index}"] = bias.astype(np.float32)
+        activations.append(activation)
+
+    if not activations:
+        raise ValueError("Model has no Dense layers")
+    arrays["activations"] = np.array(activations)
+    return arrays
+
+
+def check_export(model: Any, exported: NumpySentimentModel, vectorizer: Any, tolerance: float) -> float:
+    """Largest difference between Keras and NumPy outputs on SAMPLE_TEXTS."""
+    features = vectorizer.transform(SAMPLE_TEXTS)
+    expected = model.predict(features.toarray(), verbose=0)
+    actual = exported.predict(features)
+    difference = float(np.max(np.abs(expected - actual)))
+    if difference > tolerance:
+        raise ValueError(f"Exported model differs from Keras by {difference:.2e} (tolerance {tolerance:.0e})")
+    return difference
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the Keras sentiment model to NumPy .npz weights")
+    parser.add_argument("--model", default=SENTIMENT_MODEL_PATH)
+    parser.add_argument("--out", default=SENTIMENT_WEIGHTS_PATH)
+    parser.add_argument("--vectorizer", default=None, help="TF-IDF vectorizer used to check the export")
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    # Training-side dependency only
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(args.model)
+    arrays = extract_layers(model)
+    np.savez_compressed(args.out, **arrays)
+    print(f"Wrote {len(arrays['activations'])} dense layers to {args.out}")
+
+    if args.vectorizer:
+        import joblib
+
+        difference = check_export(model, NumpySentimentModel.load(args.out), joblib.load(args.vectorizer), args.tolerance)
+        print(f"Matches Keras on {len(SAMPLE_TEXTS)} sample texts (max difference {difference:.2e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+
+load_dotenv()
+
+# Endpoints whose identical concurrent requests share one computation; creative ones can be left out
+SINGLE_FLIGHT_ENDPOINTS = [
+    endpoint.strip() for endpoint in os.getenv(
+        "SINGLE_FLIGHT_ENDPOINTS", "story,debate-evaluate,rpg-evaluate,results"
+    ).split(",") if endpoint.strip()
+]
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight requests. The first caller for a key
+    starts the computation as its own task; callers arriving while it
+    runs wait on the same task and get the same result or exception.
+    The computation is only cancelled once every caller has gone, so one
+    impatient client cannot fail the others.
+    """
+
+    def __init__(self, endpoints: Optional[list] = None):
+        self.endpoints = set(SINGLE_FLIGHT_ENDPOINTS if endpoints is None else endpoints)
+        self._calls: Dict[str, _Call] = {}
+        self.leaders: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+        self.abandoned = 0
+
+    @staticmethod
+    def key(endpoint: str, payload: Any) -> str:
+        canonical = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{endpoint}\n{canonical}".encode("utf-8")).hexdigest()
+
+    async def run(self, endpoint: str, payload: Any, compute: Callable[[], Awaitable[T]]) -> T:
+        """Return `compute()`, shared with any identical request to `endpoint` already in flight."""
+        if endpoint not in self.endpoints:
+            return await compute()
+
+        key = self.key(endpoint, payload)
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.get_running_loop().create_task(compute()))
+            self._calls[key] = call
+            self.leaders[endpoint] = self.leaders.get(endpoint, 0) + 1
+
+            def _forget(_: asyncio.Task, key=key, call=call) -> None:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+            call.task.add_done_callback(_forget)
+        else:
+            self.coalesced[endpoint] = self.coalesced.get(endpoint, 0) + 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self.abandoned += 1
+                call.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint in sorted(self.endpoints | set(self.leaders)):
+            leaders = self.leaders.get(endpoint, 0)
+            coalesced = self.coalesced.get(endpoint, 0)
+            endpoints[endpoint] = {
+                "computed": leaders,
+                "coalesced": coalesced,
+                "coalesce_rate": coalesced / (leaders + coalesced) if leaders + coalesced else 0.0
+            }
+        return {
+            "enabled": sorted(self.endpoints),
+            "in_flight": len(self._calls),
+            "abandoned": self.abandoned,
+            "endpoints": endpoints
+        }
+
+
+single_flight = SingleFlight()
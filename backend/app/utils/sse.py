@@ -0,0 +1,52 @@
+import json
+from typing import Any, AsyncIterator
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from app.utils.deadline import DeadlineExceeded, within_deadline
+from app.utils.generation import generation_profiles
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format a single Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def stream_chat_tokens(client: Any, profile: str, **kwargs) -> AsyncIterator[str]:
+    """Yield content deltas from a streaming Ollama chat call made with generation `profile`."""
+    async for part in generation_profiles.stream_chat(client, profile, **kwargs):
+        token = part["message"]["content"]
+        if token:
+            yield token
+
+
+async def _until_deadline(events: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Pass `events` through until the request deadline, then end the stream
+    with an `error` event. This runs before DeadlineMiddleware's grace
+    period is up, so clients see why the stream stopped instead of a
+    connection that just closes.
+    """
+    iterator = events.__aiter__()
+    try:
+        while True:
+            try:
+                event = await within_deadline(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            except DeadlineExceeded:
+                yield sse_event("error", {"detail": "Request deadline exceeded"})
+                return
+            yield event
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        _until_deadline(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,79 @@
+"""
+Startup-time budget check. Imports the API and runs its startup in a
+fresh interpreter, then fails if either took longer than its budget or
+if a heavy ML library was imported on the way. tests/test_startup.py
+runs it with the suite; this is the same check by hand:
+
+    python -m app.utils.startup_check --import-budget 5 --startup-budget 1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STARTUP_IMPORT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", "5"))
+STARTUP_LIFESPAN_BUDGET = float(os.getenv("STARTUP_LIFESPAN_BUDGET", "1"))
+# Must only ever be imported by the model runtime's background load
+HEAVY_MODULES = ("tensorflow", "keras", "torch", "joblib", "sklearn")
+# The probe runs from here, as uvicorn would, so relative paths in .env resolve the same
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter() - started
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+
+async def startup():
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        return time.perf_counter() - started
+
+print(json.dumps({{"import_seconds": imported, "startup_seconds": asyncio.run(startup()), "heavy_modules": heavy}}))
+"""
+
+
+def measure() -> dict:
+    """Import and startup times of app.main in a fresh interpreter, with the model runtime held off."""
+    # Nothing should load in the background while being measured
+    env = {**os.environ, "SENTIMENT_LOAD": "off"}
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, env=env, cwd=BACKEND_DIR, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check API import and startup time against a budget")
+    parser.add_argument("--import-budget", type=float, default=STARTUP_IMPORT_BUDGET)
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_LIFESPAN_BUDGET)
+    args = parser.parse_args()
+
+    try:
+        timings = measure()
+    except subprocess.CalledProcessError as e:
+        sys.exit(f"Could not start the API:\n{e.stderr}")
+
+    print(f"import app.main: {timings['import_seconds']:.2f}s (budget {args.import_budget:.2f}s)")
+    print(f"lifespan startup: {timings['startup_seconds']:.2f}s (budget {args.startup_budget:.2f}s)")
+    failures = []
+    if timings["import_seconds"] > args.import_budget:
+        failures.append("import is over budget")
+    if timings["startup_seconds"] > args.startup_budget:
+        failures.append("startup is over budget")
+    if timings["heavy_modules"]:
+        failures.append(f"imported at startup: {', '.join(timings['heavy_modules'])}")
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
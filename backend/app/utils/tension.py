@@ -0,0 +1,77 @@
+"""
+Tension and conclusion rules of conflict mode, written over NumPy arrays
+so the live game (one session, scalars) and the offline simulator
+(hundreds of thousands of sessions at once) share the same arithmetic.
+Randomness is passed in, never drawn here.
+"""
+from typing import Any, Union
+
+import numpy as np
+
+ArrayLike = Union[float, np.ndarray]
+
+MIN_TENSION = 0
+MAX_TENSION = 100
+
+# Share of the reply's and the player's sentiment in the combined score
+AI_SENTIMENT_WEIGHT = 0.6
+USER_SENTIMENT_WEIGHT = 0.4
+# Neutral parties have less impact on tension
+NEUTRAL_FACTION_WEIGHT = 0.7
+# Combined sentiment of -1..1 moves tension by up to this much
+SENTIMENT_TENSION_SCALE = 20.0
+# Standard deviation of the random factor added every turn
+TENSION_NOISE_STD = 3.0
+
+# At or below this tension a session is likely to end peacefully, at or above BREAKDOWN_TENSION in breakdown
+PEACEFUL_TENSION = 10
+BREAKDOWN_TENSION = 90
+PEACEFUL_CONCLUSION_PROBABILITY = 0.8
+BREAKDOWN_CONCLUSION_PROBABILITY = 0.9
+# From this stage on, the chance of concluding grows by STAGE_CONCLUSION_STEP per stage
+LATE_STAGE = 4
+STAGE_CONCLUSION_STEP = 0.3
+BASE_CONCLUSION_PROBABILITY = 0.1
+
+
+def faction_weight(faction: Any) -> float:
+    return NEUTRAL_FACTION_WEIGHT if faction == "neutral" else 1.0
+
+
+def next_tension(
+        current: ArrayLike,
+        ai_sentiment: ArrayLike,
+        user_sentiment: ArrayLike,
+        weight: ArrayLike,
+        lexicon_net: ArrayLike,
+        noise: ArrayLike
+) -> np.ndarray:
+    """
+    Tension after a turn. Negative sentiment raises tension and positive
+    sentiment lowers it; `lexicon_net` is the turn's escalation minus
+    de-escalation weight and `noise` its random factor. The result is
+    clipped to 0..100 and truncated to whole points.
+    """
+    combined = (np.multiply(ai_sentiment, AI_SENTIMENT_WEIGHT) + np.multiply(user_sentiment, USER_SENTIMENT_WEIGHT)) * weight
+    change = -combined * SENTIMENT_TENSION_SCALE + lexicon_net + noise
+    return np.trunc(np.clip(np.add(current, change), MIN_TENSION, MAX_TENSION)).astype(np.int64)
+
+
+def conclusion_probability(tension: ArrayLike, stage: ArrayLike) -> np.ndarray:
+    """Chance that a session at `tension` in `stage` concludes this turn."""
+    tension = np.asarray(tension)
+    stage = np.asarray(stage)
+    return np.select(
+        [tension <= PEACEFUL_TENSION, tension >= BREAKDOWN_TENSION, stage >= LATE_STAGE],
+        [
+            PEACEFUL_CONCLUSION_PROBABILITY,
+            BREAKDOWN_CONCLUSION_PROBABILITY,
+            STAGE_CONCLUSION_STEP * (stage - (LATE_STAGE - 1))
+        ],
+        BASE_CONCLUSION_PROBABILITY
+    )
+
+
+def concludes(tension: ArrayLike, stage: ArrayLike, draw: ArrayLike) -> np.ndarray:
+    """Whether each session concludes, given a uniform 0..1 `draw` per session."""
+    return np.asarray(draw) < conclusion_probability(tension, stage)
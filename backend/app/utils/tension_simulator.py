@@ -0,0 +1,268 @@
+"""
+Offline Monte Carlo simulator of conflict-mode tension and conclusion,
+for tuning the constants in app.utils.tension without playing by hand.
+Every session is one slot in a set of NumPy arrays and each turn updates
+all sessions still running at once, using the same rules as the live
+game. Sentiment and lexicon hits are synthetic: sentiment is drawn from
+a clipped normal distribution and each turn hits a Poisson number of
+escalation and de-escalation terms, weighted as in the conflict's
+lexicon.
+
+    python -m app.utils.tension_simulator --sessions 200000 --seed 7
+    python -m app.utils.tension_simulator --faction neutral --conflict rwanda --histogram
+    python -m app.utils.tension_simulator --stage-policy per-turn --json
+
+As a library:
+
+    from app.utils.tension_simulator import simulate
+    summary = simulate(100_000, faction="neutral", conflict_type="rwanda", seed=1).summary()
+"""
+import argparse
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.schemas.schema import ConflictType, Faction
+from app.utils.lexicon import DEESCALATION, ESCALATION, lexicon_engine
+from app.utils.tension import (
+    BREAKDOWN_TENSION, MAX_TENSION, MIN_TENSION, PEACEFUL_TENSION, TENSION_NOISE_STD,
+    concludes, faction_weight, next_tension
+)
+
+# How the stage moves between turns. "server": as the API does today, where the
+# stage only advances when a session concludes, so it never changes within one;
+# "per-turn": one stage per turn, as if the client advanced it.
+STAGE_POLICIES = ("server", "per-turn")
+
+PEACEFUL = "peaceful"
+MODERATE = "moderate"
+BREAKDOWN = "breakdown"
+UNFINISHED = "unfinished"
+
+
+def _term_weights(rng: np.random.Generator, weights: np.ndarray, mean_terms: float, size: int) -> np.ndarray:
+    """Total weight of a Poisson(`mean_terms`) number of terms drawn from `weights`, per session."""
+    if size == 0 or mean_terms <= 0 or weights.size == 0:
+        return np.zeros(size)
+    counts = rng.poisson(mean_terms, size)
+    most = int(counts.max())
+    if most == 0:
+        return np.zeros(size)
+    draws = rng.choice(weights, size=(size, most))
+    return (draws * (np.arange(most) < counts[:, None])).sum(axis=1)
+
+
+class SimulationResult:
+    """Per-session outcome arrays of one simulation, with a summary of their distribution."""
+
+    def __init__(
+            self,
+            faction: str,
+            conflict_type: Optional[str],
+            max_turns: int,
+            turns: np.ndarray,
+            concluded: np.ndarray,
+            final_tension: np.ndarray,
+            hit_floor: np.ndarray,
+            hit_ceiling: np.ndarray
+    ):
+        self.faction = faction
+        self.conflict_type = conflict_type
+        self.max_turns = max_turns
+        # Turn on which each session concluded; 0 if it was still running after max_turns
+        self.turns = turns
+        self.concluded = concluded
+        self.final_tension = final_tension
+        self.hit_floor = hit_floor
+        self.hit_ceiling = hit_ceiling
+
+    @property
+    def sessions(self) -> int:
+        return int(self.turns.size)
+
+    def endings(self) -> np.ndarray:
+        return np.where(
+            ~self.concluded, UNFINISHED,
+            np.where(self.final_tension <= PEACEFUL_TENSION, PEACEFUL,
+                     np.where(self.final_tension >= BREAKDOWN_TENSION, BREAKDOWN, MODERATE))
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        sessions = self.sessions
+        finished = self.turns[self.concluded]
+        endings = self.endings()
+        return {
+            "faction": self.faction,
+            "conflict_type": self.conflict_type,
+            "sessions": sessions,
+            "max_turns": self.max_turns,
+            "turns_to_conclusion": {
+                "mean": float(finished.mean()) if finished.size else None,
+                "median": float(np.median(finished)) if finished.size else None,
+                "p90": float(np.percentile(finished, 90)) if finished.size else None,
+                # Sessions concluding on turn 1, 2, ... max_turns
+                "histogram": np.bincount(finished, minlength=self.max_turns + 1)[1:].tolist()
+            },
+            "endings": {
+                ending: float(np.count_nonzero(endings == ending)) / sessions
+                for ending in (PEACEFUL, MODERATE, BREAKDOWN, UNFINISHED)
+            },
+            "bounds": {
+                "hit_floor": float(self.hit_floor.mean()),
+                "hit_ceiling": float(self.hit_ceiling.mean()),
+                "hit_either": float((self.hit_floor | self.hit_ceiling).mean())
+            }
+        }
+
+
+def simulate(
+        sessions: int = 100_000,
+        faction: str = "side_a",
+        conflict_type: Optional[str] = None,
+        max_turns: int = 30,
+        start_tension: int = 50,
+        start_stage: int = 0,
+        stage_policy: str = "server",
+        sentiment_mean: float = 0.0,
+        sentiment_std: float = 0.35,
+        escalation_terms: float = 1.0,
+        deescalation_terms: float = 1.0,
+        seed: Any = 0
+) -> SimulationResult:
+    """
+    Play `sessions` synthetic sessions until each concludes or `max_turns`
+    have passed. `seed` is anything np.random.default_rng accepts, so the
+    same seed reproduces the same result.
+    """
+    if stage_policy not in STAGE_POLICIES:
+        raise ValueError(f"stage_policy must be one of {', '.join(STAGE_POLICIES)}")
+    rng = np.random.default_rng(seed)
+    lexicon = lexicon_engine.lexicon(conflict_type)
+    escalation = np.array([weight for _, kind, weight in lexicon.terms if kind == ESCALATION])
+    deescalation = np.array([weight for _, kind, weight in lexicon.terms if kind == DEESCALATION])
+    weight = faction_weight(faction)
+
+    tension = np.full(sessions, start_tension, dtype=np.int64)
+    stage = np.full(sessions, start_stage, dtype=np.int64)
+    turns = np.zeros(sessions, dtype=np.int64)
+    concluded = np.zeros(sessions, dtype=bool)
+    hit_floor = np.zeros(sessions, dtype=bool)
+    hit_ceiling = np.zeros(sessions, dtype=bool)
+
+    for turn in range(1, max_turns + 1):
+        # Only sessions still running are drawn for and updated
+        running = np.flatnonzero(~concluded)
+        size = running.size
+        if size == 0:
+            break
+
+        ai_sentiment = np.clip(rng.normal(sentiment_mean, sentiment_std, size), -1, 1)
+        user_sentiment = np.clip(rng.normal(sentiment_mean, sentiment_std, size), -1, 1)
+        lexicon_net = (
+            _term_weights(rng, escalation, escalation_terms, size)
+            - _term_weights(rng, deescalation, deescalation_terms, size)
+        )
+        noise = rng.normal(0, TENSION_NOISE_STD, size)
+
+        now = next_tension(tension[running], ai_sentiment, user_sentiment, weight, lexicon_net, noise)
+        tension[running] = now
+        hit_floor[running] |= now <= MIN_TENSION
+        hit_ceiling[running] |= now >= MAX_TENSION
+
+        done = running[concludes(now, stage[running], rng.random(size))]
+        concluded[done] = True
+        turns[done] = turn
+        if stage_policy == "per-turn":
+            stage[running] += 1
+
+    return SimulationResult(
+        getattr(faction, "value", faction), getattr(conflict_type, "value", conflict_type),
+        max_turns, turns, concluded, tension, hit_floor, hit_ceiling
+    )
+
+
+def simulate_grid(
+        factions: Sequence[str] = tuple(f.value for f in Faction),
+        conflict_types: Sequence[Optional[str]] = tuple(c.value for c in ConflictType),
+        seed: int = 0,
+        **kwargs: Any
+) -> List[SimulationResult]:
+    """`simulate` for every faction and conflict type, each with its own independent, reproducible stream."""
+    pairs = [(faction, conflict_type) for conflict_type in conflict_types for faction in factions]
+    streams = np.random.SeedSequence(seed).spawn(len(pairs))
+    return [
+        simulate(faction=faction, conflict_type=conflict_type, seed=stream, **kwargs)
+        for (faction, conflict_type), stream in zip(pairs, streams)
+    ]
+
+
+def _print_table(summaries: List[Dict[str, Any]], histogram: bool) -> None:
+    header = (
+        f"{'conflict':<20} {'faction':<8} {'mean':>5} {'med':>4} {'p90':>4} "
+        f"{'peace':>6} {'moder':>6} {'break':>6} {'unfin':>6} {'at 0':>6} {'at 100':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for summary in summaries:
+        turns, endings, bounds = summary["turns_to_conclusion"], summary["endings"], summary["bounds"]
+        number = lambda value: "-" if value is None else f"{value:.1f}"
+        print(
+            f"{summary['conflict_type'] or 'default':<20} {summary['faction']:<8} "
+            f"{number(turns['mean']):>5} {number(turns['median']):>4} {number(turns['p90']):>4} "
+            f"{endings[PEACEFUL]:6.1%} {endings[MODERATE]:6.1%} {endings[BREAKDOWN]:6.1%} {endings[UNFINISHED]:6.1%} "
+            f"{bounds['hit_floor']:6.1%} {bounds['hit_ceiling']:6.1%}"
+        )
+        if histogram:
+            counts = turns["histogram"]
+            scale = max(counts) or 1
+            for turn, count in enumerate(counts, start=1):
+                if count:
+                    print(f"    turn {turn:>3} {count:>8} {'#' * max(1, round(40 * count / scale))}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of conflict-mode tension and conclusions")
+    parser.add_argument("--sessions", type=int, default=100_000, help="Sessions per faction and conflict type")
+    parser.add_argument("--faction", default="all", choices=["all"] + [f.value for f in Faction])
+    parser.add_argument("--conflict", default="all", choices=["all", "default"] + [c.value for c in ConflictType])
+    parser.add_argument("--max-turns", type=int, default=30)
+    parser.add_argument("--start-tension", type=int, default=50)
+    parser.add_argument("--start-stage", type=int, default=0)
+    parser.add_argument("--stage-policy", default="server", choices=STAGE_POLICIES)
+    parser.add_argument("--sentiment-mean", type=float, default=0.0)
+    parser.add_argument("--sentiment-std", type=float, default=0.35)
+    parser.add_argument("--escalation-terms", type=float, default=1.0, help="Mean escalation terms per turn")
+    parser.add_argument("--deescalation-terms", type=float, default=1.0, help="Mean de-escalation terms per turn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--histogram", action="store_true", help="Print turns-to-conclusion histograms")
+    parser.add_argument("--json", action="store_true", help="Print summaries as JSON")
+    args = parser.parse_args()
+
+    factions = [f.value for f in Faction] if args.faction == "all" else [args.faction]
+    if args.conflict == "all":
+        conflict_types = [c.value for c in ConflictType]
+    else:
+        conflict_types = [None if args.conflict == "default" else args.conflict]
+
+    results = simulate_grid(
+        factions, conflict_types, seed=args.seed,
+        sessions=args.sessions,
+        max_turns=args.max_turns,
+        start_tension=args.start_tension,
+        start_stage=args.start_stage,
+        stage_policy=args.stage_policy,
+        sentiment_mean=args.sentiment_mean,
+        sentiment_std=args.sentiment_std,
+        escalation_terms=args.escalation_terms,
+        deescalation_terms=args.deescalation_terms
+    )
+    summaries = [result.summary() for result in results]
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        _print_table(summaries, args.histogram)
+
+
+if __name__ == "__main__":
+    main()
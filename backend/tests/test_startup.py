@@ -0,0 +1,19 @@
+import pytest
+
+from app.utils.startup_check import STARTUP_IMPORT_BUDGET, STARTUP_LIFESPAN_BUDGET, measure
+
+
+@pytest.fixture(scope="module")
+def timings():
+    # One fresh interpreter for the module; measuring is the slow part
+    return measure()
+
+
+def test_startup_stays_within_budget(timings):
+    assert timings["import_seconds"] <= STARTUP_IMPORT_BUDGET, f"import app.main took {timings['import_seconds']:.2f}s"
+    assert timings["startup_seconds"] <= STARTUP_LIFESPAN_BUDGET, f"lifespan startup took {timings['startup_seconds']:.2f}s"
+
+
+def test_startup_does_not_import_heavy_modules(timings):
+    assert "tensorflow" not in timings["heavy_modules"]
+    assert timings["heavy_modules"] == []